@@ -1,2 +1,3 @@
 from .factory import initialize
-from .redis_init import redis, psub, pub
\ No newline at end of file
+from .redis_init import redis, hub, pub
+from .query_monitor import query_monitor
\ No newline at end of file
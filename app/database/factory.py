@@ -5,11 +5,15 @@ from beanie import init_beanie, Document
 from motor import motor_asyncio
 
 from app.settings.app_settings import AppSettings
+from app.helpers.metrics import MongoCommandMetrics
+from app.database.query_monitor import query_monitor
 from app.models.user_account import UserAccount
 from app.models.library import Library
 from app.models.question import Question
 from app.models.car_race import CarRace
 from app.models.car_race_session import CarRaceSession
+from app.models.session_result import SessionResult
+from app.models.user_counter import UserCounter
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -48,7 +52,10 @@ async def initialize():
     app_settings = AppSettings()
 
     # CREATE MOTOR CLIENT
-    client = motor_asyncio.AsyncIOMotorClient(app_settings.mongo_dsn, maxPoolSize=5)
+    client = motor_asyncio.AsyncIOMotorClient(
+        app_settings.mongo_dsn, maxPoolSize=5, event_listeners=[MongoCommandMetrics(), query_monitor]
+    )
+    query_monitor.start(client)
 
     # INIT BEANIE
     await init_beanie(
@@ -58,7 +65,9 @@ async def initialize():
             Library,
             Question,
             CarRace,
-            CarRaceSession
+            CarRaceSession,
+            SessionResult,
+            UserCounter
         ],
     )
 
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+import aioredis
+
+from app.helpers import codec
+
+_logger = logging.getLogger(__name__)
+
+
+class PubSubHub:
+    """
+    Single redis pubsub connection per process.
+
+    Channels are subscribed once, when their first local subscriber shows up,
+    and unsubscribed when the last one leaves. Every message is read once into
+    a codec.Frame handed to each local subscriber, so the number of redis connections
+    no longer grows with the number of websockets. A subscriber is anything
+    with a non-blocking put_nowait, an asyncio queue by default.
+    """
+
+    def __init__(self, redis: aioredis.Redis):
+        self._redis = redis
+        self._pubsub = None
+        self._subscribers: Dict[str, Set] = {}
+        self._reader: Optional[asyncio.Task] = None
+        self._has_channels: Optional[asyncio.Event] = None
+
+    @asynccontextmanager
+    async def subscription(self, channel: str, subscriber=None):
+        subscriber = await self.subscribe(channel, subscriber)
+        try:
+            yield subscriber
+        finally:
+            await self.unsubscribe(channel, subscriber)
+
+    async def subscribe(self, channel: str, subscriber=None):
+        self._ensure_reader()
+        if subscriber is None:
+            subscriber = asyncio.Queue()
+        subscribers = self._subscribers.setdefault(channel, set())
+        subscribers.add(subscriber)
+        if len(subscribers) == 1:
+            try:
+                await self._pubsub.subscribe(channel)
+            except Exception:
+                # Not left behind waiting on a channel that was never subscribed
+                subscribers.discard(subscriber)
+                if not subscribers and self._subscribers.get(channel) is subscribers:
+                    del self._subscribers[channel]
+                raise
+            self._has_channels.set()
+        return subscriber
+
+    async def unsubscribe(self, channel: str, subscriber):
+        subscribers = self._subscribers.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[channel]
+            if self._pubsub is not None:
+                await self._pubsub.unsubscribe(channel)
+
+    def subscriber_count(self, channel: str) -> int:
+        return len(self._subscribers.get(channel, ()))
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.reset()
+            self._pubsub = None
+        self._subscribers.clear()
+
+    def _ensure_reader(self):
+        # Created lazily so everything binds to the running loop
+        if self._reader is None:
+            self._pubsub = self._redis.pubsub()
+            self._has_channels = asyncio.Event()
+            self._reader = asyncio.create_task(self._read(), name="pubsub-hub")
+
+    async def _read(self):
+        while True:
+            await self._has_channels.wait()
+            try:
+                # Ends by itself once nothing is subscribed anymore
+                async for message in self._pubsub.listen():
+                    if message["type"] == "message":
+                        self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _logger.exception("Pubsub hub lost its redis connection, resubscribing")
+                await self._resubscribe()
+                continue
+            if not self._subscribers:
+                self._has_channels.clear()
+
+    async def _resubscribe(self):
+        while True:
+            try:
+                await self._pubsub.reset()
+            except Exception:
+                pass
+            try:
+                self._pubsub = self._redis.pubsub()
+                if self._subscribers:
+                    await self._pubsub.subscribe(*self._subscribers.keys())
+                return
+            except Exception:
+                _logger.warning("Pubsub hub could not resubscribe, retrying")
+                await asyncio.sleep(1)
+
+    def _dispatch(self, channel, data):
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        subscribers = self._subscribers.get(channel)
+        if not subscribers:
+            return
+        # Only the routing header is decoded, the frame is shared by every subscriber.
+        # A bad message or subscriber is dropped here, the connection is fine.
+        try:
+            frame = codec.Frame(data)
+        except Exception:
+            _logger.exception(f"Dropped a malformed message on {channel}")
+            return
+        for subscriber in list(subscribers):
+            try:
+                subscriber.put_nowait(frame)
+            except Exception:
+                _logger.exception(f"Failed to hand a message on {channel} to a subscriber")
@@ -0,0 +1,295 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+from app.settings.app_settings import AppSettings
+
+_logger = logging.getLogger(__name__)
+
+# Commands sent by the services, driver housekeeping (hello, endSessions, ...) is ignored
+MONITORED_COMMANDS = {
+    "find",
+    "getMore",
+    "aggregate",
+    "count",
+    "distinct",
+    "insert",
+    "update",
+    "delete",
+    "findAndModify",
+}
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Distinct shapes kept, later ones are only counted in dropped_shapes
+MAX_SHAPES = 1000
+# Shapes explained per round, and how long an explain result is trusted
+EXPLAIN_BATCH_SIZE = 20
+EXPLAIN_TTL = 3600
+# Longest filter / sort text written to the slow query log
+MAX_LOGGED_CHARS = 500
+
+
+def _shape(value):
+    # Values become "?", field names, operators and nesting are kept
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(item, dict) for item in value):
+            return [_shape(item) for item in value]
+        return "?"
+    return "?"
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=str, separators=(",", ":"))
+
+
+def _query_parts(command_name: str, command: dict) -> Tuple[Optional[dict], Optional[dict]]:
+    # (filter, sort) of a command, whichever way the command spells them
+    if command_name == "find":
+        return command.get("filter") or {}, command.get("sort")
+    if command_name in ("count", "distinct"):
+        return command.get("query") or {}, None
+    if command_name == "findAndModify":
+        return command.get("query") or {}, command.get("sort")
+    if command_name == "aggregate":
+        pipeline = command.get("pipeline") or []
+        match = next((stage["$match"] for stage in pipeline if "$match" in stage), None)
+        sort = next((stage["$sort"] for stage in pipeline if "$sort" in stage), None)
+        return match, sort
+    if command_name == "update":
+        updates = command.get("updates") or [{}]
+        return updates[0].get("q") or {}, None
+    if command_name == "delete":
+        deletes = command.get("deletes") or [{}]
+        return deletes[0].get("q") or {}, None
+    return None, None
+
+
+def _explain_command(command_name: str, command: dict) -> Optional[dict]:
+    # The sampled command without its session / cluster fields, planner only
+    # so explain never runs the query itself
+    if command_name not in EXPLAINABLE_COMMANDS:
+        return None
+    if command_name == "aggregate":
+        return {
+            "aggregate": command["aggregate"],
+            "pipeline": command.get("pipeline") or [],
+            "explain": True,
+        }
+    keep = {
+        "find": ("find", "filter", "sort", "projection", "hint"),
+        "count": ("count", "query", "hint"),
+        "distinct": ("distinct", "key", "query"),
+        "update": ("update", "updates"),
+        "delete": ("delete", "deletes"),
+        "findAndModify": ("findAndModify", "query", "sort", "update", "remove", "upsert"),
+    }[command_name]
+    explained = {key: command[key] for key in keep if key in command}
+    for batch in ("updates", "deletes"):
+        if batch in explained:
+            explained[batch] = explained[batch][:1]
+    return {"explain": explained, "verbosity": "queryPlanner"}
+
+
+def _plan_stages(node, in_winning_plan: bool = False):
+    # Every stage of every winning plan in an explain document
+    if isinstance(node, dict):
+        if in_winning_plan and "stage" in node:
+            yield node["stage"]
+        for key, value in node.items():
+            yield from _plan_stages(value, in_winning_plan or key == "winningPlan")
+    elif isinstance(node, list):
+        for item in node:
+            yield from _plan_stages(item, in_winning_plan)
+
+
+class QueryShapeStats:
+    __slots__ = (
+        "command", "collection", "database", "filter", "sort", "count", "failures",
+        "total_ms", "max_ms", "slow", "sample", "stages", "collscan", "explained_at",
+    )
+
+    def __init__(self, command: str, collection: str, database: str, filter_shape, sort):
+        self.command = command
+        self.collection = collection
+        self.database = database
+        self.filter = filter_shape
+        self.sort = sort
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        # Latest command of this shape, what explain is run on
+        self.sample: Optional[dict] = None
+        self.stages = []
+        self.collscan: Optional[bool] = None
+        self.explained_at: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "collection": self.collection,
+            "filter": self.filter,
+            "sort": self.sort,
+            "count": self.count,
+            "failures": self.failures,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "slow": self.slow,
+            "plan_stages": self.stages,
+            "collscan": self.collscan,
+            "explained_at": self.explained_at,
+        }
+
+
+class QueryMonitor(monitoring.CommandListener):
+    """
+    Per query shape latency of the MongoDB commands of this worker.
+
+    A shape is the command, the collection and the filter / sort with every
+    value replaced by "?", so find({"user_id": a}) and find({"user_id": b})
+    add up together. Commands slower than MONGO_SLOW_QUERY_MS are logged
+    with their filter and sort, and a background task runs a planner-only
+    explain on the shapes seen since the last round to flag collection scans.
+
+    The driver calls the listener from its own threads, so the stats are
+    guarded by a lock and the listener never does any I/O itself.
+    """
+
+    def __init__(self):
+        app_settings = AppSettings()
+        self.slow_query_ms = app_settings.mongo_slow_query_ms
+        self.explain_interval = app_settings.mongo_explain_interval
+        self.shapes: Dict[str, QueryShapeStats] = {}
+        self.dropped_shapes = 0
+        self._lock = threading.Lock()
+        # (connection id, request id) -> (shape key, filter, sort) of commands in flight
+        self._in_flight: Dict[tuple, tuple] = {}
+        self._client = None
+        self._explain_task: Optional[asyncio.Task] = None
+
+    def start(self, client):
+        self._client = client
+        if self._explain_task is None and self.explain_interval > 0:
+            self._explain_task = asyncio.create_task(self._explain_loop(), name="query-explain")
+
+    async def stop(self):
+        if self._explain_task is not None:
+            self._explain_task.cancel()
+            self._explain_task = None
+
+    def started(self, event):
+        if event.command_name not in MONITORED_COMMANDS:
+            return
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        query_filter, sort = _query_parts(event.command_name, command)
+        filter_shape = _shape(query_filter) if query_filter is not None else None
+        key = f"{event.database_name}.{collection} {event.command_name} {_dumps(filter_shape)} {_dumps(sort)}"
+        with self._lock:
+            stats = self.shapes.get(key)
+            if stats is None:
+                if len(self.shapes) >= MAX_SHAPES:
+                    self.dropped_shapes += 1
+                    return
+                stats = self.shapes[key] = QueryShapeStats(
+                    event.command_name, collection, event.database_name, filter_shape, sort
+                )
+            if stats.sample is None or stats.explained_at is None:
+                stats.sample = _explain_command(event.command_name, command)
+        self._in_flight[(event.connection_id, event.request_id)] = (key, query_filter, sort)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        in_flight = self._in_flight.pop((event.connection_id, event.request_id), None)
+        if in_flight is None:
+            return
+        key, query_filter, sort = in_flight
+        duration_ms = event.duration_micros / 1000
+        slow = duration_ms >= self.slow_query_ms
+        with self._lock:
+            stats = self.shapes.get(key)
+            if stats is None:
+                return
+            stats.count += 1
+            stats.failures += failed
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            stats.slow += slow
+        if slow:
+            _logger.warning(
+                f"Slow MongoDB {event.command_name} on {stats.collection} took {duration_ms:.1f}ms"
+                f" filter={_dumps(query_filter)[:MAX_LOGGED_CHARS]}"
+                f" sort={_dumps(sort)[:MAX_LOGGED_CHARS]}"
+            )
+
+    def summary(self, limit: int = 50) -> dict:
+        with self._lock:
+            shapes = [stats.as_dict() for stats in self.shapes.values()]
+            dropped_shapes = self.dropped_shapes
+        shapes.sort(key=lambda stats: stats["total_ms"], reverse=True)
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "shape_count": len(shapes),
+            "dropped_shapes": dropped_shapes,
+            "collscan_shapes": sum(bool(stats["collscan"]) for stats in shapes),
+            "shapes": shapes[:limit],
+        }
+
+    async def explain_round(self) -> int:
+        # Explains shapes never (or not lately) explained, returns how many
+        now = time.time()
+        with self._lock:
+            due = [
+                stats for stats in self.shapes.values()
+                if stats.sample is not None
+                and (stats.explained_at is None or now - stats.explained_at > EXPLAIN_TTL)
+            ]
+        due.sort(key=lambda stats: stats.total_ms, reverse=True)
+        explained = 0
+        for stats in due[:EXPLAIN_BATCH_SIZE]:
+            try:
+                plan = await self._client[stats.database].command(stats.sample)
+            except Exception as e:
+                _logger.warning(f"Explain of {stats.command} on {stats.collection} failed: {e}")
+                stats.explained_at = now
+                continue
+            stages = sorted(set(_plan_stages(plan)))
+            with self._lock:
+                stats.stages = stages
+                stats.collscan = "COLLSCAN" in stages
+                stats.explained_at = now
+            if stats.collscan:
+                _logger.warning(
+                    f"MongoDB {stats.command} on {stats.collection} is a collection scan"
+                    f" filter={_dumps(stats.filter)} sort={_dumps(stats.sort)}"
+                )
+            explained += 1
+        return explained
+
+    async def _explain_loop(self):
+        while True:
+            await asyncio.sleep(self.explain_interval)
+            try:
+                await self.explain_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _logger.exception("Explain round failed")
+
+
+query_monitor = QueryMonitor()
@@ -1,7 +1,56 @@
+import time
+
 import aioredis
+from aioredis.client import Pipeline
+
 from app.settings.app_settings import AppSettings
+from app.database.pubsub_hub import PubSubHub
+from app.helpers.metrics import REDIS_COMMAND_DURATION
+
+
+# Commands that wait on the server for data, their round trip is mostly the wait
+BLOCKING_COMMANDS = {"BLPOP", "BRPOP", "BRPOPLPUSH", "BLMOVE", "BZPOPMIN", "BZPOPMAX"}
+
+
+def _blocks(args) -> bool:
+    # XREAD / XREADGROUP only block with a BLOCK argument
+    return args[0] in BLOCKING_COMMANDS or (
+        args[0] in ("XREAD", "XREADGROUP") and any(arg in (b"BLOCK", "BLOCK") for arg in args)
+    )
+
+
+class InstrumentedPipeline(Pipeline):
+    # One sample per round trip, queued commands are not timed on their own
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_DURATION.labels("MULTI" if self.is_transaction else "PIPELINE").observe(
+                time.perf_counter() - started
+            )
+
+
+class InstrumentedRedis(aioredis.Redis):
+    # Round trip of every command in redis_command_duration_seconds, but
+    # blocking reads like the engine's XREADGROUP BLOCK which would only
+    # measure how long they waited
+    async def execute_command(self, *args, **options):
+        if _blocks(args):
+            return await super().execute_command(*args, **options)
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_DURATION.labels(args[0]).observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> Pipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
 
 app_settings = AppSettings()
-redis = aioredis.from_url(app_settings.redis_dsn, max_connections=1000)
-psub = redis.pubsub()
-pub = aioredis.Redis.from_url(app_settings.redis_dsn, decode_responses=True)
\ No newline at end of file
+redis = InstrumentedRedis.from_url(app_settings.redis_dsn, max_connections=1000)
+hub = PubSubHub(redis)
+pub = InstrumentedRedis.from_url(app_settings.redis_dsn, decode_responses=True)
@@ -1,6 +1,6 @@
 from typing import List, Optional
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from beanie import PydanticObjectId
 
 from app.dto.common import BaseResponseData, BasePaginationResponseData, BeanieDocumentWithId
@@ -12,6 +12,8 @@ class CarRaceResponseData(BeanieDocumentWithId):
     library_id: PydanticObjectId
     bonus_time_setting: float
     penalty_time_setting: float
+    min_tick_interval: Optional[float]
+    max_tick_interval: Optional[float]
     additional_materials: Optional[List[str]]
     created_at: datetime
     updated_at: datetime
@@ -35,4 +37,6 @@ class CarRacePutRequest(BaseModel):
     library_id: str
     bonus_time_setting: float
     penalty_time_setting: float
+    min_tick_interval: Optional[float] = Field(None, gt=0)
+    max_tick_interval: Optional[float] = Field(None, gt=0)
     additional_materials: Optional[List[str]]
\ No newline at end of file
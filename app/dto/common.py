@@ -13,8 +13,10 @@ class BaseResponseData(BaseResponse):
 
 
 class BasePaginationResponseData(BaseModel):
-    total: int
+    # Not counted again when paging with a cursor
+    total: Optional[int]
     items: List
+    next_cursor: Optional[str] = None
 
 
 class BeanieDocumentWithId(BaseModel):
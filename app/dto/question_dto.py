@@ -33,4 +33,11 @@ class QuestionPutRequest(BaseModel):
     question: Union[str, List[str]]
     question_type: QuestionType = QuestionType.MULTIPLE
     choices: Optional[List[QuestionChoice]]
-    answer: Union[str, List[str]]
\ No newline at end of file
+    answer: Union[str, List[str]]
+
+
+class QuestionPackItem(BaseModel):
+    # What players get of a question before answering it, never the answer
+    question: Union[str, List[str]]
+    question_type: QuestionType = QuestionType.MULTIPLE
+    choices: Optional[List[QuestionChoice]]
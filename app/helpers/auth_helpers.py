@@ -1,11 +1,13 @@
 import os
+import hmac
 import jwt
 import time
 
-from fastapi import Depends
+from fastapi import Depends, Header
 from fastapi.security import OAuth2PasswordBearer
 
 from app.helpers.exceptions import PermissionDeniedException
+from app.settings.app_settings import AppSettings
 
 
 default_secret_key = os.getenv('JWT_SECRET_KEY')
@@ -60,3 +62,8 @@ def get_current_user(token: str= Depends(oauth2_scheme)):
             'Signature expired. Please log in again.'
         )
     return user.get("id")
+
+def verify_internal_token(x_internal_token: str = Header("")):
+    # Internal API callers send settings INTERNAL_TOKEN in X-Internal-Token
+    if not x_internal_token or not hmac.compare_digest(x_internal_token, AppSettings().internal_token or ""):
+        raise PermissionDeniedException('Invalid internal token.')
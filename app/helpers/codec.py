@@ -0,0 +1,190 @@
+import json
+import struct
+from typing import Iterable, List, Optional, Tuple, Union
+
+import msgpack
+
+# Wire formats of the live session websockets
+JSON = "json"
+MSGPACK = "msgpack"
+
+# Sec-WebSocket-Protocol values a client can offer, JSON stays the default
+SUBPROTOCOLS = {
+    "knowledgekart.msgpack.v1": MSGPACK,
+    "knowledgekart.json.v1": JSON,
+}
+
+# Player records are sent positionally in compact frames: [uid, name, point, time]
+# plus a trailing map for any other key the client put in its record
+PLAYER_FIELDS = ("uid", "name", "point", "time")
+# Keys of frame values holding {uid: player} maps
+PLAYER_MAP_KEYS = ("data", "client_data")
+# Broadcast message prefix: routing header length, JSON frame length
+BROADCAST_PREFIX = struct.Struct(">HI")
+
+
+def negotiate(subprotocols: Iterable[str]) -> Tuple[str, Optional[str]]:
+    # Returns the wire format and the subprotocol to accept, if any
+    for subprotocol in subprotocols or []:
+        if subprotocol in SUBPROTOCOLS:
+            return SUBPROTOCOLS[subprotocol], subprotocol
+    return JSON, None
+
+
+def pack_player(player: dict) -> list:
+    record = [player.get(field) for field in PLAYER_FIELDS]
+    extra = {key: value for key, value in player.items() if key not in PLAYER_FIELDS}
+    if extra:
+        record.append(extra)
+    return record
+
+
+def unpack_player(record: Union[list, dict]) -> dict:
+    if isinstance(record, dict):
+        return record
+    player = dict(zip(PLAYER_FIELDS, record))
+    if len(record) > len(PLAYER_FIELDS):
+        player.update(record[len(PLAYER_FIELDS)])
+    return player
+
+
+def compact_value(value):
+    # {uid: player} maps become lists of positional player records
+    if not isinstance(value, dict) or not any(key in value for key in PLAYER_MAP_KEYS):
+        return value
+    value = dict(value)
+    for key in PLAYER_MAP_KEYS:
+        if isinstance(value.get(key), dict):
+            value[key] = [pack_player(player) for player in value[key].values()]
+    return value
+
+
+def encode_frame(event: Optional[str], value, wire_format: str = JSON) -> Union[str, bytes]:
+    # event None sends the bare value, as done for the first snapshot frame
+    if wire_format == MSGPACK:
+        payload = compact_value(value) if event is None else [event, compact_value(value)]
+        return msgpack.packb(payload, use_bin_type=True)
+    payload = value if event is None else {"event": event, "value": value}
+    return json.dumps(payload)
+
+
+def encode_value(value, wire_format: str = JSON) -> Union[str, bytes]:
+    return encode_frame(None, value, wire_format)
+
+
+def wrap_value(event: str, encoded_value: Union[str, bytes], wire_format: str = JSON):
+    # Same frame as encode_frame(event, value) around an already encoded value
+    if wire_format == MSGPACK:
+        return b"\x92" + msgpack.packb(event, use_bin_type=True) + encoded_value
+    return '{"event": ' + json.dumps(event) + ', "value": ' + encoded_value + "}"
+
+
+def _map_header(size: int) -> bytes:
+    if size < 16:
+        return bytes([0x80 | size])
+    if size < 0x10000:
+        return b"\xde" + struct.pack(">H", size)
+    return b"\xdf" + struct.pack(">I", size)
+
+
+def add_field(encoded_map: Union[str, bytes], key: str, value, wire_format: str = JSON):
+    # Adds one key to an already encoded map without encoding it again,
+    # used to give every client its own rank on a shared snapshot
+    if wire_format == MSGPACK:
+        head = encoded_map[0]
+        if 0x80 <= head <= 0x8F:
+            size, body = head & 0x0F, encoded_map[1:]
+        elif head == 0xDE:
+            size, body = struct.unpack(">H", encoded_map[1:3])[0], encoded_map[3:]
+        else:
+            size, body = struct.unpack(">I", encoded_map[1:5])[0], encoded_map[5:]
+        field = msgpack.packb(key, use_bin_type=True) + msgpack.packb(value, use_bin_type=True)
+        return _map_header(size + 1) + field + body
+    field = json.dumps(key) + ": " + json.dumps(value)
+    if encoded_map == "{}":
+        return "{" + field + "}"
+    return "{" + field + ", " + encoded_map[1:]
+
+
+def decode_frame(data: Union[str, bytes], wire_format: str = JSON) -> dict:
+    # Client frames are maps, actions {question_index, answer, client_ts} or
+    # {event}, anything else raises ValueError
+    if wire_format == MSGPACK:
+        message = msgpack.unpackb(data, raw=False)
+    else:
+        message = json.loads(data)
+    if not isinstance(message, dict):
+        raise ValueError(f"Expected a map, got {type(message).__name__}")
+    return message
+
+
+class Frame:
+    """
+    Broadcast frame read from a session channel. Only the routing header is
+    decoded, the frame itself is already encoded in both wire formats by the
+    publisher and is forwarded to every websocket as is.
+    """
+
+    __slots__ = ("topic", "value", "_data", "_json_start", "_msgpack_start", "_json", "_msgpack")
+
+    def __init__(self, data: bytes):
+        header_size, json_size = BROADCAST_PREFIX.unpack_from(data)
+        self._json_start = BROADCAST_PREFIX.size + header_size
+        self._msgpack_start = self._json_start + json_size
+        # Scalar values (statuses) travel in the header so they can be routed on
+        self.topic, self.value = msgpack.unpackb(
+            data[BROADCAST_PREFIX.size:self._json_start], raw=False
+        )
+        self._data = data
+        self._json: Optional[str] = None
+        self._msgpack: Optional[bytes] = None
+
+    def encoded(self, wire_format: str = JSON) -> Union[str, bytes]:
+        # Sliced once per process, whatever the number of subscribers
+        if wire_format == MSGPACK:
+            if self._msgpack is None:
+                self._msgpack = self._data[self._msgpack_start:]
+            return self._msgpack
+        if self._json is None:
+            self._json = self._data[self._json_start:self._msgpack_start].decode()
+        return self._json
+
+
+def encode_broadcast(topic: str, value) -> bytes:
+    # Routing header + the frame in every wire format, see Frame
+    header = msgpack.packb(
+        [topic, None if isinstance(value, (dict, list)) else value], use_bin_type=True
+    )
+    json_frame = encode_frame(topic, value, JSON).encode()
+    msgpack_frame = encode_frame(topic, value, MSGPACK)
+    return b"".join((
+        BROADCAST_PREFIX.pack(len(header), len(json_frame)),
+        header,
+        json_frame,
+        msgpack_frame,
+    ))
+
+
+def dumps(obj) -> bytes:
+    # Binary form of redis payloads (results:, snapshot:)
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def loads(data: bytes):
+    return msgpack.unpackb(data, raw=False)
+
+
+def dumps_player(player: dict) -> bytes:
+    return dumps(pack_player(player))
+
+
+def loads_player(data: bytes) -> dict:
+    return unpack_player(loads(data))
+
+
+def decode_strings(values: Iterable[bytes]) -> List[str]:
+    return [value.decode() for value in values]
+
+
+def decode_hash(values: dict) -> dict:
+    return {key.decode(): value.decode() for key, value in values.items()}
@@ -0,0 +1,124 @@
+"""
+Event loop lag monitor of a worker.
+
+A heartbeat coroutine wakes up every BEAT_INTERVAL and records how late it
+was woken up (the scheduling delay every other coroutine of the worker
+suffered too). A watchdog thread checks the heartbeat, and once the loop has
+not beaten for longer than LOOP_BLOCK_THRESHOLD_MS it logs the stack of the
+loop thread and the name of the task running, which is the route
+("GET /api/v1/...") or the session ("session-engine:<id>") holding the loop.
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Deque, Optional
+
+from app.helpers.metrics import LOOP_BLOCKS, LOOP_LAG
+from app.settings.app_settings import AppSettings
+
+_logger = logging.getLogger(__name__)
+
+BEAT_INTERVAL = 0.05
+# Blocks kept for /admin/loop
+RECENT_BLOCKS = 50
+
+
+def label_current_task(label: str):
+    # Names the running task, the watchdog reports blocks under that name
+    task = asyncio.current_task()
+    if task is not None:
+        task.set_name(label)
+
+
+class LoopMonitor:
+
+    def __init__(self):
+        self.threshold = AppSettings().loop_block_threshold_ms / 1000
+        self.max_lag = 0.0
+        self.blocks = 0
+        self.recent_blocks: Deque[dict] = deque(maxlen=RECENT_BLOCKS)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._reported_beat: Optional[float] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        if self._heartbeat_task is not None or self.threshold <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "blocks": self.blocks,
+            "recent_blocks": list(self.recent_blocks),
+        }
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + BEAT_INTERVAL
+            await asyncio.sleep(BEAT_INTERVAL)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            if self._last_beat == self._reported_beat and self.recent_blocks:
+                # The reported block is over, now its full length is known
+                self.recent_blocks[-1]["total_ms"] = round(lag * 1000, 1)
+                _logger.warning(
+                    f"Event loop was blocked for {lag * 1000:.0f}ms by {self.recent_blocks[-1]['task']}"
+                )
+            self._last_beat = now
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG.observe(lag)
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            last_beat = self._last_beat
+            blocked_for = time.monotonic() - last_beat - BEAT_INTERVAL
+            # One report per block, the stack is the one at detection time
+            if blocked_for < self.threshold or last_beat == self._reported_beat:
+                continue
+            self._report(blocked_for)
+            self._reported_beat = last_beat
+
+    def _report(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        # Read from this thread, it is the task the loop is stuck in (None for plain callbacks)
+        task = asyncio.current_task(self._loop)
+        task_name = task.get_name() if task is not None else "callback"
+        self.blocks += 1
+        LOOP_BLOCKS.inc()
+        self.recent_blocks.append({
+            "at": time.time(),
+            "blocked_ms": round(blocked_for * 1000, 1),
+            "total_ms": None,
+            "task": task_name,
+            "stack": stack[-10:],
+        })
+        _logger.warning(
+            f"Event loop blocked for over {blocked_for * 1000:.0f}ms by {task_name}\n"
+            + "".join(stack[-10:])
+        )
+
+
+loop_monitor = LoopMonitor()
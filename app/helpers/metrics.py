@@ -0,0 +1,123 @@
+"""
+Prometheus metrics of the API, the websockets and the session engines.
+
+With several uvicorn / gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an
+empty directory shared by the workers (before they start), every worker then
+writes its samples there and /metrics sums them up, whichever worker serves
+the scrape. Without it only the samples of the serving process are exposed.
+"""
+import os
+import logging
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from pymongo import monitoring
+
+_logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# Fast paths (redis commands, ticks) need sub millisecond buckets
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections",
+    "Open websockets by role (host or guest)",
+    ["role"],
+    multiprocess_mode="livesum",
+)
+ENGINE_RUNNING = Gauge(
+    "session_engines_running",
+    "Live session engines running",
+    multiprocess_mode="livesum",
+)
+ENGINE_TICK_DURATION = Histogram(
+    "session_engine_tick_duration_seconds",
+    "Time to apply one tick: redis writes, snapshot and publish",
+    buckets=FAST_BUCKETS,
+)
+ENGINE_TICK_BATCH_SIZE = Histogram(
+    "session_engine_tick_batch_size",
+    "Stream entries applied by one tick",
+    buckets=SIZE_BUCKETS,
+)
+ENGINE_QUEUE_DEPTH = Histogram(
+    "session_engine_queue_depth",
+    "Events waiting in the engine mailbox when a tick starts",
+    buckets=SIZE_BUCKETS,
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds",
+    "Redis round trip by command, PIPELINE / MULTI for a whole pipeline",
+    ["command"],
+    buckets=FAST_BUCKETS,
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency as reported by the driver",
+    ["command", "outcome"],
+    buckets=FAST_BUCKETS,
+)
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the loop monitor heartbeat was scheduled",
+    buckets=FAST_BUCKETS,
+)
+LOOP_BLOCKS = Counter(
+    "event_loop_blocks",
+    "Times the event loop was blocked for longer than LOOP_BLOCK_THRESHOLD_MS",
+)
+PUBLISHED_BYTES = Counter(
+    "channel_published_bytes",
+    "Bytes published to the session channels by topic",
+    ["topic"],
+)
+PUBLISHED_MESSAGES = Counter(
+    "channel_published_messages",
+    "Messages published to the session channels by topic",
+    ["topic"],
+)
+
+
+def render() -> bytes:
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    # Drops the live gauges of this worker from the aggregate
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    # Registered on the motor client, called by the driver for every command
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_DURATION.labels(event.command_name, "success").observe(
+            event.duration_micros / 1e6
+        )
+
+    def failed(self, event):
+        MONGO_COMMAND_DURATION.labels(event.command_name, "failure").observe(
+            event.duration_micros / 1e6
+        )
@@ -0,0 +1,88 @@
+import base64
+import asyncio
+import binascii
+from typing import List, Optional, Tuple, Type
+
+from beanie import Document, PydanticObjectId
+from beanie.odm.utils.projection import get_projection
+from pydantic import BaseModel
+
+from app.helpers.exceptions import BadRequestException
+
+
+def encode_cursor(last_id: PydanticObjectId) -> str:
+    # Opaque to clients, it is only the _id of the last item of the page
+    return base64.urlsafe_b64encode(last_id.binary).decode()
+
+
+def decode_cursor(cursor: str) -> PydanticObjectId:
+    try:
+        return PydanticObjectId(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        raise BadRequestException("Invalid cursor")
+
+
+async def paginate(
+    document: Type[Document],
+    filters: dict,
+    projection: Type[BaseModel],
+    page: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    counter=None,
+) -> Tuple[List, Optional[int], Optional[str]]:
+    """
+    Newest first pages of document, as (items, total, next_cursor).
+
+    With a cursor the page starts right after the item it was built from
+    (_id < cursor on the {filters..., _id} index), so deep pages cost as
+    much as the first one and the total is not counted again. page / limit
+    is kept for older clients, it still skips page - 1 pages. Either way
+    next_cursor is None on the last page.
+
+    The total is read from counter (an app.services.counter_services.Counter
+    of exactly these filters) alongside the page. Without a counter, or
+    before it exists, items and total come from one $facet round trip.
+    """
+    skip = 0 if cursor else limit * (page - 1)
+    if cursor:
+        filters = {**filters, "_id": {"$lt": decode_cursor(cursor)}}
+        total = None
+        items = await _find_page(document, filters, projection, skip, limit)
+    elif counter is None:
+        items, total = await _facet_page(document, filters, projection, skip, limit)
+    else:
+        total, items = await asyncio.gather(
+            counter.get(),
+            _find_page(document, filters, projection, skip, limit),
+        )
+        if total is None:
+            items, total = await _facet_page(document, filters, projection, skip, limit)
+            await counter.seed(total)
+    next_cursor = encode_cursor(items[limit - 1].id) if len(items) > limit else None
+    return items[:limit], total, next_cursor
+
+
+async def _find_page(document: Type[Document], filters: dict, projection: Type[BaseModel], skip: int, limit: int) -> List:
+    # One more item than asked tells whether there is a next page
+    query = document.find(filters).sort(-document.id).skip(skip).limit(limit + 1)
+    return await query.project(projection).to_list()
+
+
+async def _facet_page(document: Type[Document], filters: dict, projection: Type[BaseModel], skip: int, limit: int) -> Tuple[List, int]:
+    results = await document.find(filters).aggregate([
+        {
+            "$facet": {
+                "items": [
+                    {"$sort": {"_id": -1}},
+                    {"$skip": skip},
+                    {"$limit": limit + 1},
+                    {"$project": get_projection(projection)},
+                ],
+                "total": [{"$count": "count"}],
+            }
+        },
+    ]).to_list()
+    facet = results[0]
+    total = facet["total"][0]["count"] if facet["total"] else 0
+    return [projection.parse_obj(item) for item in facet["items"]], total
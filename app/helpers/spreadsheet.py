@@ -0,0 +1,108 @@
+import io
+import re
+import csv
+import tempfile
+from typing import AsyncIterator, List, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from starlette.concurrency import run_in_threadpool
+
+XLSX = "xlsx"
+CSV = "csv"
+MEDIA_TYPES = {
+    XLSX: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    CSV: "text/csv; charset=utf-8",
+}
+# Spreadsheet apps run cells starting with these as formulas, see csv_safe
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+STREAM_CHUNK_SIZE = 64 * 1024
+# Characters Excel refuses in sheet titles, and their maximum length
+INVALID_TITLE_CHARACTERS = re.compile(r"[\[\]:*?/\\]")
+MAX_TITLE_LENGTH = 31
+
+
+def csv_safe(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_unsafe(value):
+    # Undoes csv_safe on import
+    if isinstance(value, str) and len(value) > 1 and value[0] == "'" and value[1] in FORMULA_PREFIXES:
+        return value[1:]
+    return value
+
+
+def sheet_title(title: str, taken: set) -> str:
+    # Valid and unique title, openpyxl's own "title1" suffix can overflow the length
+    title = INVALID_TITLE_CHARACTERS.sub(" ", title).strip()[:MAX_TITLE_LENGTH] or "Sheet"
+    unique, number = title, 1
+    while unique.lower() in taken:
+        number += 1
+        suffix = f" ({number})"
+        unique = title[:MAX_TITLE_LENGTH - len(suffix)] + suffix
+    taken.add(unique.lower())
+    return unique
+
+
+def _append_rows(sheet, rows: List[list]):
+    for row in rows:
+        cells = []
+        for value in row:
+            cell = WriteOnlyCell(sheet, value=value)
+            # Text even when it starts with "=", never a formula
+            if isinstance(value, str):
+                cell.data_type = "s"
+            cells.append(cell)
+        sheet.append(cells)
+
+
+async def stream_csv(header: list, batches: AsyncIterator[List[list]]) -> AsyncIterator[bytes]:
+    # One chunk per batch of rows
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens it as UTF-8
+    buffer.write("\ufeff")
+    writer.writerow(header)
+    async for batch in batches:
+        writer.writerows([csv_safe(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def single_sheet(title: str, header: list, batches: AsyncIterator[List[list]]):
+    # The sheets argument of stream_xlsx for one sheet workbooks
+    yield title, header, batches
+
+
+async def stream_xlsx(
+    sheets: AsyncIterator[Tuple[str, list, AsyncIterator[List[list]]]],
+) -> AsyncIterator[bytes]:
+    """
+    Workbook of (title, header, batches of rows) sheets. Write-only sheets
+    keep rows in temporary files as they are appended, the zip is put
+    together on save and streamed from disk, so memory does not grow with
+    the number of rows. openpyxl work runs in the threadpool.
+    """
+    workbook = Workbook(write_only=True)
+    titles = set()
+    with tempfile.TemporaryFile() as file:
+        async for title, header, batches in sheets:
+            sheet = workbook.create_sheet(sheet_title(title, titles))
+            sheet.append(header)
+            async for batch in batches:
+                await run_in_threadpool(_append_rows, sheet, batch)
+        if not workbook.worksheets:
+            workbook.create_sheet()
+        await run_in_threadpool(workbook.save, file)
+        file.seek(0)
+        while True:
+            chunk = await run_in_threadpool(file.read, STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
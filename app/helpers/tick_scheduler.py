@@ -0,0 +1,67 @@
+from typing import Optional
+
+DEFAULT_MIN_TICK_INTERVAL = 0.2
+DEFAULT_MAX_TICK_INTERVAL = 2.0
+# Batch size (changed players per tick) at which the interval is stretched to the max
+HIGH_WATERMARK = 1000
+# A tick may take at most 1 / DUTY_FACTOR of the interval, so ticks never overlap
+DUTY_FACTOR = 2
+# Weight of the newest sample in the moving averages
+EWMA_ALPHA = 0.2
+
+
+class TickScheduler:
+    """
+    Picks the batching window of a live session between min_interval and
+    max_interval. Small, quiet rooms tick at min_interval; the window grows
+    with the batch size and with how long the previous tick took. Ticks that
+    fire later than a whole window are counted as merged.
+    """
+
+    def __init__(self, min_interval: Optional[float] = None, max_interval: Optional[float] = None):
+        self.min_interval = min_interval or DEFAULT_MIN_TICK_INTERVAL
+        self.max_interval = max(max_interval or DEFAULT_MAX_TICK_INTERVAL, self.min_interval)
+        self.interval = self.min_interval
+        self.ticks = 0
+        self.merged_ticks = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.avg_duration = 0.0
+        self.last_batch_size = 0
+        self.avg_batch_size = 0.0
+
+    def next_interval(self, queue_depth: int = 0) -> float:
+        load = min(1.0, max(queue_depth, self.avg_batch_size) / HIGH_WATERMARK)
+        interval = self.min_interval + (self.max_interval - self.min_interval) * load
+        interval = max(interval, self.last_duration * DUTY_FACTOR)
+        self.interval = min(max(interval, self.min_interval), self.max_interval)
+        return self.interval
+
+    def record(self, duration: float, batch_size: int, lateness: float = 0.0):
+        # lateness: how long after its planned time the tick actually ran
+        self.ticks += 1
+        if self.interval and lateness > self.interval:
+            self.merged_ticks += int(lateness // self.interval)
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.last_batch_size = batch_size
+        if self.ticks == 1:
+            self.avg_duration = duration
+            self.avg_batch_size = float(batch_size)
+        else:
+            self.avg_duration += EWMA_ALPHA * (duration - self.avg_duration)
+            self.avg_batch_size += EWMA_ALPHA * (batch_size - self.avg_batch_size)
+
+    def stats(self) -> dict:
+        return {
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval,
+            "interval": round(self.interval, 4),
+            "ticks": self.ticks,
+            "merged_ticks": self.merged_ticks,
+            "last_duration": round(self.last_duration, 6),
+            "avg_duration": round(self.avg_duration, 6),
+            "max_duration": round(self.max_duration, 6),
+            "last_batch_size": self.last_batch_size,
+            "avg_batch_size": round(self.avg_batch_size, 2),
+        }
@@ -0,0 +1,48 @@
+import time
+
+from fastapi import FastAPI
+
+from app.helpers.loop_monitor import label_current_task
+from app.helpers.metrics import HTTP_REQUEST_DURATION
+
+
+class HttpMetricsMiddleware:
+    """
+    Plain ASGI middleware, cheaper than BaseHTTPMiddleware. Requests are
+    labelled by the route template ("/api/v1/session/{session_id}") the
+    router matched, unmatched paths are all counted as one route so random
+    URLs don't create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            # Blocks of the event loop are reported under the path
+            label_current_task(f"{scope.get('method', 'WS')} {scope['path']}")
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - started)
+
+
+def add_metrics(app: FastAPI):
+    app.add_middleware(HttpMetricsMiddleware)
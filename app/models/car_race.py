@@ -1,6 +1,6 @@
 from typing import Optional, List
 from beanie import PydanticObjectId
-from pymongo import ASCENDING, IndexModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 from app.models.base import RootModel
 
@@ -15,6 +15,13 @@ class CarRace(RootModel):
                 ],
                 unique=True
             ),
+            # Newest first pages, see app.helpers.pagination
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("_id", DESCENDING),
+                ],
+            ),
         ]
 
     user_id: PydanticObjectId
@@ -23,4 +30,6 @@ class CarRace(RootModel):
     library_id: PydanticObjectId
     bonus_time_setting: float
     penalty_time_setting: float
+    min_tick_interval: Optional[float]
+    max_tick_interval: Optional[float]
     additional_materials: Optional[List[str]]
\ No newline at end of file
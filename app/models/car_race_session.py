@@ -1,6 +1,6 @@
 from typing import Optional, List
 from beanie import PydanticObjectId
-from pymongo import ASCENDING, IndexModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 from app.models.base import RootModel, RootEnum
 
@@ -20,6 +20,13 @@ class CarRaceSession(RootModel):
                 ],
                 unique=True
             ),
+            # Newest first pages, see app.helpers.pagination
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("_id", DESCENDING),
+                ],
+            ),
         ]
 
     user_id: PydanticObjectId
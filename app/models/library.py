@@ -1,6 +1,6 @@
 from typing import Optional
 from beanie import PydanticObjectId
-from pymongo import ASCENDING, IndexModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 from app.models.base import RootModel
 
@@ -15,6 +15,13 @@ class Library(RootModel):
                 ],
                 unique=True
             ),
+            # Newest first pages, see app.helpers.pagination
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("_id", DESCENDING),
+                ],
+            ),
         ]
 
     user_id: PydanticObjectId
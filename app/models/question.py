@@ -1,7 +1,7 @@
 from typing import Optional, List, Union
 from beanie import PydanticObjectId
 from pydantic import BaseModel
-from pymongo import ASCENDING, IndexModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
 from app.models.base import RootModel, RootEnum
 
@@ -24,6 +24,7 @@ class Question(RootModel):
                 [
                     ("user_id", ASCENDING),
                     ("library_id", ASCENDING),
+                    ("_id", DESCENDING),
                 ],
             ),
         ]
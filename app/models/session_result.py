@@ -0,0 +1,36 @@
+from typing import Optional, List
+from beanie import PydanticObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from app.models.base import RootModel
+
+class SessionResult(RootModel):
+    class Collection:
+        name = "session_result"
+        indexes = [
+            IndexModel(
+                [
+                    ("session_id", ASCENDING),
+                    ("uid", ASCENDING),
+                ],
+                unique=True
+            ),
+            # Players in rank order for exports, see app.services.session_export_services
+            IndexModel(
+                [
+                    ("session_id", ASCENDING),
+                    ("point", DESCENDING),
+                    ("time", ASCENDING),
+                    ("uid", DESCENDING),
+                ],
+            ),
+        ]
+
+    session_id: PydanticObjectId
+    uid: str
+    name: Optional[str]
+    point: int = 0
+    time: float = 0.0
+    correct: int = 0
+    wrong: int = 0
+    answered: List[int] = []
@@ -0,0 +1,26 @@
+from typing import Optional
+from beanie import PydanticObjectId
+from pymongo import ASCENDING, IndexModel
+
+from app.models.base import RootModel
+
+class UserCounter(RootModel):
+    class Collection:
+        name = "user_counter"
+        indexes = [
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("scope", ASCENDING),
+                    ("scope_id", ASCENDING),
+                ],
+                unique=True
+            ),
+        ]
+
+    user_id: PydanticObjectId
+    # What is counted: library, question, car_race or session
+    scope: str
+    # Parent the items are counted under, the library of questions
+    scope_id: Optional[PydanticObjectId]
+    total: int = 0
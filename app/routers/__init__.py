@@ -1,8 +1,9 @@
-from .health import ping
+from .health import ping, metrics
 from .auth import auth_routes
 from .library_management import library_management_routes
 from .car_race_management import car_race_management_routes
 from .session_management import session_management_routes
+from .admin import admin_routes
 
 def add_routes(routes, routers, tags, internal: bool = False):
     if internal:
@@ -21,7 +22,11 @@ routers = []
 routers.append({
     'router': ping.router
 })
+routers.append({
+    'router': metrics.router
+})
 add_routes(auth_routes, routers, [], False)
 add_routes(library_management_routes, routers, [], False)
 add_routes(car_race_management_routes, routers, [], False)
-add_routes(session_management_routes, routers, [], False)
\ No newline at end of file
+add_routes(session_management_routes, routers, [], False)
+add_routes(admin_routes, routers, [], True)
\ No newline at end of file
@@ -0,0 +1,8 @@
+from . import keyspace, queries, loop, counters
+
+admin_routes = [
+    keyspace.router,
+    queries.router,
+    loop.router,
+    counters.router,
+]
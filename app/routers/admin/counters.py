@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends
+
+from app.dto.common import BaseResponseData
+from app.helpers.auth_helpers import verify_internal_token
+from app.services.counter_services import CounterService
+
+router = APIRouter(
+    tags=["Admin"],
+    prefix="/admin/counters",
+    dependencies=[Depends(verify_internal_token)],
+)
+
+
+@router.post(
+    "/reconcile",
+    response_model=BaseResponseData,
+)
+async def reconcile_counters():
+    fixed = await CounterService.reconcile()
+    return BaseResponseData(
+        message="Reconciled counters successfully",
+        data={"fixed_counters": fixed},
+    )
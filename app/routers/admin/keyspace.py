@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Query
+
+from app.dto.common import BaseResponseData
+from app.helpers.auth_helpers import verify_internal_token
+from app.services.keyspace_services import KeyspaceService
+from app.services.session_supervisor_services import session_supervisor
+
+router = APIRouter(
+    tags=["Admin"],
+    prefix="/admin/keyspace",
+    dependencies=[Depends(verify_internal_token)],
+)
+
+
+@router.get(
+    "/memory",
+    response_model=BaseResponseData,
+)
+async def get_keyspace_memory(
+    limit: int = Query(50, ge=1, le=1000),
+):
+    report = await KeyspaceService.memory_report(
+        active_sessions=await session_supervisor.active_sessions(),
+        limit=limit,
+    )
+    return BaseResponseData(
+        message="Get keyspace memory successfully",
+        data=report,
+    )
+
+
+@router.post(
+    "/sweep",
+    response_model=BaseResponseData,
+)
+async def sweep_keyspace():
+    expired = await KeyspaceService.sweep(await session_supervisor.active_sessions())
+    return BaseResponseData(
+        message="Swept keyspace successfully",
+        data={"expired_keys": expired},
+    )
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends
+
+from app.dto.common import BaseResponseData
+from app.helpers.auth_helpers import verify_internal_token
+from app.helpers.loop_monitor import loop_monitor
+
+router = APIRouter(
+    tags=["Admin"],
+    prefix="/admin/loop",
+    dependencies=[Depends(verify_internal_token)],
+)
+
+
+@router.get(
+    "",
+    response_model=BaseResponseData,
+)
+async def get_loop_stats():
+    # Lag and recent blocks of the worker serving the request only
+    return BaseResponseData(
+        message="Get event loop stats successfully",
+        data=loop_monitor.stats(),
+    )
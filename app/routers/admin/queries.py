@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, Query
+
+from app.database import query_monitor
+from app.dto.common import BaseResponseData
+from app.helpers.auth_helpers import verify_internal_token
+
+router = APIRouter(
+    tags=["Admin"],
+    prefix="/admin/queries",
+    dependencies=[Depends(verify_internal_token)],
+)
+
+
+@router.get(
+    "",
+    response_model=BaseResponseData,
+)
+async def get_query_summary(
+    limit: int = Query(50, ge=1, le=1000),
+):
+    # Stats of the worker serving the request only
+    return BaseResponseData(
+        message="Get query summary successfully",
+        data=query_monitor.summary(limit),
+    )
+
+
+@router.post(
+    "/explain",
+    response_model=BaseResponseData,
+)
+async def explain_queries():
+    explained = await query_monitor.explain_round()
+    return BaseResponseData(
+        message="Explained queries successfully",
+        data={"explained_shapes": explained},
+    )
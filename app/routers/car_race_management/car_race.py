@@ -1,3 +1,5 @@
+from typing import Optional
+
 from fastapi import APIRouter, Depends, Query
 
 from app.dto.common import BaseResponse
@@ -15,13 +17,15 @@ router = APIRouter(tags=['Car Race'], prefix='/car_race')
 )
 async def get_list_car_races(
     user_id: str = Depends(get_current_user),
-    page: int = Query(1),
-    limit: int = Query(10),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, page is ignored when given"),
 ):
-    items, total = await CarRaceService.list_car_races(
+    items, total, next_cursor = await CarRaceService.list_car_races(
         user_id=user_id,
         page=page,
         limit=limit,
+        cursor=cursor,
     )
 
     return CarRacePaginationResponse(
@@ -29,6 +33,7 @@ async def get_list_car_races(
         data=CarRacePaginationResponseData(
             items=items,
             total=total,
+            next_cursor=next_cursor,
         )
     )
 
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from app.helpers import metrics
+
+
+router = APIRouter(tags=['Metrics'])
+
+
+@router.get(
+    '/metrics',
+    include_in_schema=False
+)
+def get_metrics():
+    # Prometheus text format, summed over every worker in multiprocess mode
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE_LATEST)
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, Query
+from typing import Optional
 
-from app.dto.common import BaseResponse
+from fastapi import APIRouter, Depends, File, Query, UploadFile
+from fastapi.responses import StreamingResponse
+
+from app.dto.common import BaseResponse, BaseResponseData
 from app.dto.library_dto import LibraryPaginationResponse, LibraryPaginationResponseData, LibraryResponse, LibraryPutRequest
 from app.helpers.auth_helpers import get_current_user
 from app.helpers.exceptions import BadRequestException
 from app.services.library_services import LibraryService
+from app.helpers.spreadsheet import CSV, MEDIA_TYPES, XLSX
+from app.services.question_file_services import QuestionFileService
 
 router = APIRouter(tags=['Library'], prefix='/library')
 
@@ -15,13 +20,15 @@ router = APIRouter(tags=['Library'], prefix='/library')
 )
 async def get_list_libraries(
     user_id: str = Depends(get_current_user),
-    page: int = Query(1),
-    limit: int = Query(10),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, page is ignored when given"),
 ):
-    items, total = await LibraryService.list_libraries(
+    items, total, next_cursor = await LibraryService.list_libraries(
         user_id=user_id,
         page=page,
         limit=limit,
+        cursor=cursor,
     )
 
     return LibraryPaginationResponse(
@@ -29,6 +36,7 @@ async def get_list_libraries(
         data=LibraryPaginationResponseData(
             items=items,
             total=total,
+            next_cursor=next_cursor,
         )
     )
 
@@ -119,4 +127,48 @@ async def delete_library_by_id(
     )
     return BaseResponse(
         message="Deleted library successfully"
-    )
\ No newline at end of file
+    )
+
+
+@router.post(
+    '/{library_id}/import',
+    response_model=BaseResponseData,
+)
+async def import_questions(
+    library_id: str,
+    file: UploadFile = File(...),
+    user_id: str = Depends(get_current_user),
+):
+    file_format = (file.filename or '').rsplit('.', 1)[-1].lower()
+    if file_format not in MEDIA_TYPES:
+        raise BadRequestException("Only .xlsx and .csv files can be imported")
+    report = await QuestionFileService.import_questions(
+        user_id=user_id,
+        library_id=library_id,
+        file=file.file,
+        file_format=file_format,
+    )
+    return BaseResponseData(
+        message="Imported questions successfully",
+        data=report,
+    )
+
+
+@router.get(
+    '/{library_id}/export',
+)
+async def export_questions(
+    library_id: str,
+    file_format: str = Query(XLSX, regex=f'^({XLSX}|{CSV})$'),
+    user_id: str = Depends(get_current_user),
+):
+    content = await QuestionFileService.export_questions(
+        user_id=user_id,
+        library_id=library_id,
+        file_format=file_format,
+    )
+    return StreamingResponse(
+        content,
+        media_type=MEDIA_TYPES[file_format],
+        headers={'Content-Disposition': f'attachment; filename="library-{library_id}.{file_format}"'},
+    )
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from fastapi import APIRouter, Depends, Query
 
 from app.dto.common import BaseResponse
@@ -16,14 +18,16 @@ router = APIRouter(tags=['Question'], prefix='/question')
 async def get_list_questions(
     user_id: str = Depends(get_current_user),
     library_id: str = Query(''),
-    page: int = Query(1),
-    limit: int = Query(10),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, page is ignored when given"),
 ):
-    items, total = await QuestionService.list_questions(
+    items, total, next_cursor = await QuestionService.list_questions(
         user_id=user_id,
         library_id=library_id,
         page=page,
         limit=limit,
+        cursor=cursor,
     )
 
     return QuestionPaginationResponse(
@@ -31,6 +35,7 @@ async def get_list_questions(
         data=QuestionPaginationResponseData(
             items=items,
             total=total,
+            next_cursor=next_cursor,
         )
     )
 
@@ -1,6 +1,7 @@
-from . import session_manager, session
+from . import session_manager, session, question_pack
 
 session_management_routes = [
     session_manager.router,
-    session.router
+    session.router,
+    question_pack.router
 ]
\ No newline at end of file
@@ -0,0 +1,30 @@
+import gzip
+from fastapi import APIRouter, Header, Response
+
+from app.services.question_pack_services import QuestionPackService
+
+router = APIRouter(tags=["Question Pack"], prefix="/question_pack")
+
+# Packs never change under the same hash
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get(
+    "/{pack_hash}",
+)
+async def get_question_pack(
+    pack_hash: str,
+    if_none_match: str = Header(None),
+    accept_encoding: str = Header(""),
+):
+    etag = f'"{pack_hash}"'
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    data = await QuestionPackService.get_compressed(pack_hash)
+    # Stored gzipped, only clients that can't take gzip get it inflated
+    if "gzip" in accept_encoding:
+        headers["Content-Encoding"] = "gzip"
+    else:
+        data = gzip.decompress(data)
+    return Response(content=data, media_type="application/json", headers=headers)
@@ -1,12 +1,14 @@
-import json
 import asyncio
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 
-from app.dto.common import BaseResponse
+from app.dto.common import BaseResponse, BaseResponseData
 from app.helpers.auth_helpers import get_current_user
 from app.services.live_session_services import LiveSessionService
+from app.services.action_stream_services import ActionStreamService
+from app.services.connection_services import ClientConnection, INVALID_FRAME_CLOSE_CODE
 from app.helpers.exceptions import BadRequestException
-from app.database import pub, psub, redis
+from app.database import hub
 
 router = APIRouter(tags=["Car Race Live Session"], prefix="/session")
 
@@ -43,116 +45,133 @@ async def end_session_by_id(
     )
 
 
+@router.get(
+    "/tick_stats/{session_id}",
+    response_model=BaseResponseData,
+)
+async def get_tick_stats_by_id(
+    session_id: str,
+    user_id: str = Depends(get_current_user),
+):
+    tick_stats = await LiveSessionService.get_tick_stats(
+        user_id=user_id,
+        session_id=session_id,
+    )
+    return BaseResponseData(
+        message="Get tick stats successfully",
+        data=tick_stats,
+    )
+
+
 @router.websocket("/ws_user/{session_id}")
 async def user_session_connect(websocket: WebSocket, session_id: str):
-    await websocket.accept()
-    temp_session = await LiveSessionService.get_temp_session(session_id)
-    if not temp_session:
-        statis_session = await LiveSessionService.get_statis_session(session_id)
-        await websocket.send_json(statis_session)
-        await websocket.close()
-    await websocket.send_text(json.dumps(temp_session))
-    new_psub = redis.pubsub()
-    async with new_psub as p:
-        await p.subscribe(f"channel:{session_id}")
-        if p != None:
-            while True:
-                # Get message from redis channel
-                message = await p.get_message(
-                    ignore_subscribe_messages=True, timeout=0.5
-                )
-                await asyncio.sleep(1)
-                if message != None:
-                    data = json.loads(message["data"])
-                    topic = data["topic"]
-                    value = data["value"]
-                    if topic in [
-                        "update_status",
-                        "client_update_users",
-                        "client_update_result",
-                    ]:
-                        await websocket.send_text(
-                            json.dumps({"event": topic, "value": value})
-                        )
-                    if topic == "update_status" and value == "ENDED":
-                        await websocket.close()
+    connection = ClientConnection(
+        websocket,
+        session_id,
+        close_on=lambda topic, value: topic == "update_status" and value == "ENDED",
+    )
+    await connection.accept()
+    # Subscribed before the snapshot is read so no delta falls in between
+    async with hub.subscription(f"channel:{session_id}", connection):
+        temp_session = await LiveSessionService.get_temp_session(session_id)
+        if not temp_session:
+            statis_session = await LiveSessionService.get_statis_session(session_id)
+            await connection.send_value(jsonable_encoder(statis_session))
+            await websocket.close()
+            return
+        await connection.send_snapshot(temp_session)
+        try:
+            done, pending = await asyncio.wait(
+                [
+                    get_resync_request(connection),
+                    connection.run_sender(),
+                ],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in pending:
+                task.cancel()
+        except WebSocketDisconnect:
+            return
 
 
 @router.websocket("/ws_guest/{session_id}/{client_id}")
 async def session_connect(websocket: WebSocket, session_id: str, client_id: str):
-    await websocket.accept()
+    connection = ClientConnection(websocket, session_id, client_id)
+    await connection.accept()
     if not client_id:
         raise BadRequestException("Missing client id")
-    temp_session = await LiveSessionService.get_temp_session(session_id)
-    if not temp_session:
-        static_session = await LiveSessionService.get_statis_session(session_id)
-        await websocket.send_json(static_session)
-        await websocket.close()
-    await websocket.send_json(temp_session)
-    try:
-        # Init message with user (uid, name, point, time) and send back current results
-        first_message = await websocket.receive_json()
-        await pub.publish(
-            f"channel:{session_id}",
-            json.dumps({"topic": "client_join", "value": first_message}),
-        )
-        done, pending = await asyncio.wait(
-            [
-                get_user_action(websocket, session_id),
-                send_user_update(websocket, session_id),
-            ],
-            return_when=asyncio.FIRST_COMPLETED,
-        )
-        await pub.publish(
-            f"channel:{session_id}",
-            json.dumps({"topic": "client_leave", "value": client_id}),
-        )
-    except WebSocketDisconnect:
-        await pub.publish(
-            f"channel:{session_id}",
-            json.dumps({"topic": "client_leave", "value": client_id}),
-        )
+    # Subscribed before the snapshot is read so no delta falls in between
+    async with hub.subscription(f"channel:{session_id}", connection):
+        temp_session = await LiveSessionService.get_temp_session(session_id)
+        if not temp_session:
+            static_session = await LiveSessionService.get_statis_session(session_id)
+            await connection.send_value(jsonable_encoder(static_session))
+            await websocket.close()
+            return
+        await connection.send_snapshot(temp_session)
+        try:
+            # Init message with user (name) and send back current results
+            first_message = await connection.receive()
+            await ActionStreamService.submit(
+                session_id,
+                "client_join",
+                {"uid": client_id, "name": first_message.get("name")},
+            )
+            done, pending = await asyncio.wait(
+                [
+                    get_user_action(session_id, client_id, connection),
+                    connection.run_sender(),
+                ],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in pending:
+                task.cancel()
+            await ActionStreamService.submit(session_id, "client_leave", client_id)
+        except WebSocketDisconnect:
+            await ActionStreamService.submit(session_id, "client_leave", client_id)
+        except ValueError:
+            # Only the first message gets here, the player hasn't joined yet
+            await websocket.close(code=INVALID_FRAME_CLOSE_CODE)
 
 
 # Assist function
-async def get_user_action(websocket: WebSocket, session_id: str):
+async def get_user_action(session_id: str, client_id: str, connection: ClientConnection):
     while True:
         try:
-            message = await websocket.receive_json()
-            await pub.publish(
-                f"channel:{session_id}",
-                json.dumps({"topic": "client_update", "value": message}),
+            message = await connection.receive()
+            if is_resync_request(message):
+                connection.request_resync()
+                continue
+            # Answers only, the engine scores them (point and time sent by clients are ignored)
+            await ActionStreamService.submit(
+                session_id,
+                "client_update",
+                {
+                    "uid": client_id,
+                    "question_index": message.get("question_index"),
+                    "answer": message.get("answer"),
+                    "client_ts": message.get("client_ts"),
+                },
             )
         except WebSocketDisconnect:
-            print("websocket disconnected")
             return
+        except ValueError:
+            # Not a map, dropped
+            continue
 
 
-async def send_user_update(websocket: WebSocket, session_id: str):
-    new_psub = redis.pubsub()
-    try: 
-        async with new_psub as p:
-            await p.subscribe(f"channel:{session_id}")
-            if p != None:
-                while True:
-                    # Get message from redis channel
-                    message = await p.get_message(
-                        ignore_subscribe_messages=True, timeout=0.5
-                    )
-                    await asyncio.sleep(0)
-                    if message != None:
-                        data = json.loads(message["data"])
-                        topic = data["topic"]
-                        value = data["value"]
-                        if topic in [
-                            "update_status",
-                            "client_update_users",
-                            "client_update_result",
-                        ]:
-                            await websocket.send_text(
-                                json.dumps({"event": topic, "value": value})
-                            )
-                        elif topic == "close_websocket":
-                            await websocket.close()
-    except WebSocketDisconnect:
-        return
+def is_resync_request(message) -> bool:
+    # Clients ask for a full snapshot when they detect a gap in delta seq
+    return isinstance(message, dict) and message.get("event") == "resync"
+
+
+async def get_resync_request(connection: ClientConnection):
+    while True:
+        try:
+            message = await connection.receive()
+            if is_resync_request(message):
+                connection.request_resync()
+        except WebSocketDisconnect:
+            return
+        except ValueError:
+            continue
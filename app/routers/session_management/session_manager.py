@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, Query, BackgroundTasks
+from typing import Optional
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 
 from app.dto.common import BaseResponse
 from app.dto.session_dto import SessionPaginationResponseData, SessionPaginationResponse, SessionResponse, SessionPutRequest, SessionCreateRequest
 from app.helpers.auth_helpers import get_current_user
+from app.helpers.spreadsheet import CSV, MEDIA_TYPES, XLSX
 from app.services.session_services import SessionService
+from app.services.session_export_services import SessionExportService
 
 router = APIRouter(tags=['Car Race Session'], prefix='/session_management')
 
@@ -14,13 +20,15 @@ router = APIRouter(tags=['Car Race Session'], prefix='/session_management')
 )
 async def get_list_sessions(
     user_id: str = Depends(get_current_user),
-    page: int = Query(1),
-    limit: int = Query(10),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, page is ignored when given"),
 ):
-    items, total = await SessionService.list_sessions(
+    items, total, next_cursor = await SessionService.list_sessions(
         user_id=user_id,
         page=page,
         limit=limit,
+        cursor=cursor,
     )
 
     return SessionPaginationResponse(
@@ -28,6 +36,7 @@ async def get_list_sessions(
         data=SessionPaginationResponseData(
             items=items,
             total=total,
+            next_cursor=next_cursor,
         )
     )
 
@@ -50,18 +59,61 @@ async def get_session_by_id(
     )
 
 
+@router.get(
+    '/{session_id}/export',
+)
+async def export_session_results(
+    session_id: str,
+    file_format: str = Query(XLSX, regex=f'^({XLSX}|{CSV})$'),
+    user_id: str = Depends(get_current_user),
+):
+    content = await SessionExportService.export_session(
+        user_id=user_id,
+        session_id=session_id,
+        file_format=file_format,
+    )
+    return StreamingResponse(
+        content,
+        media_type=MEDIA_TYPES[file_format],
+        headers={'Content-Disposition': f'attachment; filename="session-{session_id}.{file_format}"'},
+    )
+
+
+@router.get(
+    '/car_race/{car_race_id}/export',
+)
+async def export_car_race_results(
+    car_race_id: str,
+    file_format: str = Query(XLSX, regex=f'^({XLSX}|{CSV})$'),
+    created_from: Optional[datetime] = Query(None, description="Sessions created at or after"),
+    created_to: Optional[datetime] = Query(None, description="Sessions created at or before"),
+    user_id: str = Depends(get_current_user),
+):
+    # One sheet per session in XLSX, one table with a session column in CSV
+    content = await SessionExportService.export_car_race(
+        user_id=user_id,
+        car_race_id=car_race_id,
+        file_format=file_format,
+        created_from=created_from,
+        created_to=created_to,
+    )
+    return StreamingResponse(
+        content,
+        media_type=MEDIA_TYPES[file_format],
+        headers={'Content-Disposition': f'attachment; filename="car-race-{car_race_id}-sessions.{file_format}"'},
+    )
+
+
 @router.post(
     '/create',
 )
 async def create_session(
-    background_tasks: BackgroundTasks,
     create_session_data: SessionCreateRequest,
     user_id: str = Depends(get_current_user),
 ):
     await SessionService.create(
         user_id=user_id,
         new_session=create_session_data.dict(),
-        background_tasks=background_tasks
     )
     
     return BaseResponse(
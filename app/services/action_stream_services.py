@@ -0,0 +1,85 @@
+import json
+import logging
+from typing import List, Optional, Tuple
+
+from aioredis.client import Pipeline
+from aioredis.exceptions import ResponseError
+
+from app.database import pub
+
+_logger = logging.getLogger(__name__)
+
+# Only one engine runs a session at a time (see the session supervisor), so a
+# single consumer name lets a taking-over engine pick up unacked entries
+CONSUMER_GROUP = "engine"
+CONSUMER_NAME = "engine"
+# Approximate cap of every session stream, acked entries are trimmed first
+STREAM_MAXLEN = 10000
+READ_COUNT = 500
+READ_BLOCK_MS = 5000
+
+
+class ActionStreamService:
+    """
+    Inbound events of a live session (player actions, joins, leaves and
+    status changes) go through a redis stream read by the session engine,
+    so nothing is lost while the engine is busy or being taken over, and
+    broadcast traffic on channel:{session_id} never reaches the engine.
+    """
+
+    @staticmethod
+    def stream_key(session_id: str) -> str:
+        return f"actions:{session_id}"
+
+    @staticmethod
+    async def submit(session_id: str, topic: str, value):
+        await pub.xadd(
+            ActionStreamService.stream_key(session_id),
+            {"topic": topic, "value": json.dumps(value)},
+            maxlen=STREAM_MAXLEN,
+            approximate=True,
+        )
+
+    @staticmethod
+    async def ensure_group(session_id: str):
+        try:
+            await pub.xgroup_create(
+                ActionStreamService.stream_key(session_id),
+                CONSUMER_GROUP,
+                id="0",
+                mkstream=True,
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    @staticmethod
+    async def read(session_id: str, last_id: str = ">") -> List[Tuple[str, str, object]]:
+        # last_id ">" blocks for new entries, any other id re-reads entries
+        # after it that were delivered to a previous engine but never acked
+        response = await pub.xreadgroup(
+            CONSUMER_GROUP,
+            CONSUMER_NAME,
+            {ActionStreamService.stream_key(session_id): last_id},
+            count=READ_COUNT,
+            block=READ_BLOCK_MS if last_id == ">" else None,
+        )
+        entries = []
+        for _, stream_entries in response or []:
+            for entry_id, fields in stream_entries:
+                if not fields:
+                    # Trimmed away while pending
+                    entries.append((entry_id, None, None))
+                    continue
+                entries.append((entry_id, fields["topic"], json.loads(fields["value"])))
+        return entries
+
+    @staticmethod
+    async def ack(session_id: str, entry_ids: List[str], pipe: Optional[Pipeline] = None):
+        # Queued on pipe when given, e.g. with the rest of a tick
+        if not entry_ids:
+            return
+        if pipe is None:
+            await pub.xack(ActionStreamService.stream_key(session_id), CONSUMER_GROUP, *entry_ids)
+        else:
+            pipe.xack(ActionStreamService.stream_key(session_id), CONSUMER_GROUP, *entry_ids)
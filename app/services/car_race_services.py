@@ -1,5 +1,5 @@
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime
 from beanie import PydanticObjectId
 from pymongo.errors import DuplicateKeyError
@@ -7,6 +7,8 @@ from pymongo.errors import DuplicateKeyError
 from app.models.library import Library
 from app.models.car_race import CarRace
 from app.dto.car_race_dto import CarRaceResponseData
+from app.helpers.pagination import paginate
+from app.services.counter_services import Counter, CAR_RACES
 from app.helpers.exceptions import NotFoundException, BadRequestException
 
 _logger = logging.getLogger(__name__)
@@ -14,12 +16,8 @@ _logger = logging.getLogger(__name__)
 
 class CarRaceService:
     @staticmethod
-    async def list_car_races(user_id: str, page: int, limit: int) -> List[CarRaceResponseData]:
-        skip = limit * (page - 1)
-        query = CarRace.find({"user_id": PydanticObjectId(user_id)})
-        total = await query.count()
-        car_races = await query.skip(skip).limit(limit).sort(-CarRace.id).project(CarRaceResponseData).to_list()
-        return car_races, total
+    async def list_car_races(user_id: str, page: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[CarRaceResponseData], Optional[int], Optional[str]]:
+        return await paginate(CarRace, {"user_id": PydanticObjectId(user_id)}, CarRaceResponseData, page, limit, cursor, Counter(user_id, CAR_RACES))
     
     @staticmethod
     async def get_car_race_by_id(user_id: str, car_race_id: str) -> CarRaceResponseData:
@@ -41,6 +39,7 @@ class CarRaceService:
             await car_race.save()
         except DuplicateKeyError:
             raise BadRequestException("Car race already exists")
+        await Counter(user_id, CAR_RACES).increment()
         _logger.info(f"New car race created: {car_race.car_race_name}")
 
     @staticmethod
@@ -61,4 +60,5 @@ class CarRaceService:
         if not car_race:
             raise NotFoundException("Car race not found")
         await car_race.delete()
+        await Counter(user_id, CAR_RACES).increment(-1)
         _logger.info(f"Car race deleted: {car_race.car_race_name}")
\ No newline at end of file
@@ -0,0 +1,74 @@
+import time
+import logging
+from datetime import datetime
+from typing import Dict
+
+import bson
+from beanie import PydanticObjectId
+from pymongo import UpdateOne
+
+from app.models.session_result import SessionResult
+
+_logger = logging.getLogger(__name__)
+
+# Player record keys persisted in session_result
+RESULT_FIELDS = ("name", "point", "time", "correct", "wrong", "answered")
+
+
+class CheckpointService:
+    """
+    Live results are persisted one document per player in session_result,
+    upserted in unordered bulk writes of only the players that changed since
+    the previous checkpoint, so a crash or a redis eviction loses at most one
+    checkpoint interval and ending a session writes nothing but the ranking.
+    """
+
+    @staticmethod
+    async def write(session_id: str, players: Dict[str, dict]) -> dict:
+        # Returns what the checkpoint cost: players, bytes and duration
+        if not players:
+            return {"players": 0, "bytes": 0, "duration": 0.0}
+        started = time.perf_counter()
+        now = datetime.now()
+        session_object_id = PydanticObjectId(session_id)
+        operations = []
+        written_bytes = 0
+        for uid, player in players.items():
+            fields = {key: player[key] for key in RESULT_FIELDS if key in player}
+            fields["updated_at"] = now
+            written_bytes += len(bson.encode(fields))
+            operations.append(
+                UpdateOne(
+                    {"session_id": session_object_id, "uid": uid},
+                    {"$set": fields, "$setOnInsert": {"created_at": now}},
+                    upsert=True,
+                )
+            )
+        await SessionResult.get_motor_collection().bulk_write(operations, ordered=False)
+        return {
+            "players": len(operations),
+            "bytes": written_bytes,
+            "duration": time.perf_counter() - started,
+        }
+
+    @staticmethod
+    async def results(session_id: str) -> Dict[str, dict]:
+        # Checkpointed players as {uid: player}, the same shape as the live results
+        results = await SessionResult.find(
+            {"session_id": PydanticObjectId(session_id)}
+        ).to_list()
+        return {
+            result.uid: {"uid": result.uid, **result.dict(include=set(RESULT_FIELDS))}
+            for result in results
+        }
+
+    @staticmethod
+    async def attach_results(session_id: str, result: dict) -> dict:
+        # Ended sessions only keep their ranking, results are read back from session_result
+        if "ranking" in result and "results" not in result:
+            result["results"] = await CheckpointService.results(session_id)
+        return result
+
+    @staticmethod
+    async def delete(session_id: str):
+        await SessionResult.get_motor_collection().delete_many({"session_id": PydanticObjectId(session_id)})
@@ -0,0 +1,178 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+
+from fastapi import WebSocket
+
+from app.helpers import codec, metrics
+from app.services.live_session_services import LiveSessionService
+from app.services.snapshot_services import SessionSnapshot
+
+_logger = logging.getLogger(__name__)
+
+# Frames forwarded from channel:{session_id} to websockets
+FORWARDED_TOPICS = {
+    "update_status",
+    "client_update_users",
+    "client_update_result",
+    "close_websocket",
+}
+# Never dropped nor merged
+CONTROL_TOPICS = {"update_status", "close_websocket"}
+# Deltas can't be dropped, a backlog of them is replaced by one fresh snapshot
+DELTA_TOPICS = {"client_update_result", "client_update_users"}
+RESYNC = "session_snapshot"
+SNAPSHOT_TOPICS = DELTA_TOPICS | {RESYNC}
+
+# A client whose oldest unsent frame is older than this is disconnected
+MAX_LAG_SECONDS = 15
+# Close code sent to clients that fell too far behind (1013: try again later)
+SLOW_CLIENT_CLOSE_CODE = 1013
+# Close code sent to clients whose first frame is not a map (1003: unsupported data)
+INVALID_FRAME_CLOSE_CODE = 1003
+
+
+class ClientConnection:
+    """
+    Bounded outbound queue of one websocket.
+
+    The pubsub hub pushes frames with put_nowait, which never blocks: delta
+    frames are coalesced so at most one per topic is pending, and control
+    frames are kept in order. A single sender task drains the queue, so a
+    slow client only ever delays itself, and is disconnected once its
+    backlog gets older than MAX_LAG_SECONDS.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        session_id: str,
+        client_id: Optional[str] = None,
+        close_on: Optional[Callable[[str, object], bool]] = None,
+    ):
+        self.websocket = websocket
+        # JSON text frames unless the client negotiated msgpack on connect
+        self.wire_format, self.subprotocol = codec.negotiate(
+            websocket.scope.get("subprotocols", [])
+        )
+        self.session_id = session_id
+        self.client_id = client_id
+        self.close_on = close_on or (lambda topic, value: topic == "close_websocket")
+        self.coalesced_frames = 0
+        self.too_slow = False
+        # (topic, frame, enqueued at), frame is None for RESYNC
+        self._pending: Deque[Tuple[str, Optional[codec.Frame], float]] = deque()
+        self._wakeup = asyncio.Event()
+        self._sender_task: Optional[asyncio.Task] = None
+
+    async def accept(self):
+        await self.websocket.accept(subprotocol=self.subprotocol)
+
+    async def send_value(self, value):
+        # Bare frame without event, used for the first snapshot
+        await self._send_frame(codec.encode_frame(None, value, self.wire_format))
+
+    async def send_snapshot(self, snapshot: SessionSnapshot, event: Optional[str] = None):
+        # Shared pre-encoded snapshot, only this guest's rank is added
+        await self._send_frame(snapshot.frame(self.wire_format, event, self.client_id))
+
+    async def receive(self) -> dict:
+        # Raises ValueError on a frame that is not a map, see codec.decode_frame
+        if self.wire_format == codec.MSGPACK:
+            return codec.decode_frame(await self.websocket.receive_bytes(), codec.MSGPACK)
+        return codec.decode_frame(await self.websocket.receive_text(), codec.JSON)
+
+    def put_nowait(self, frame: codec.Frame):
+        # Called by the pubsub hub for every message of the session channel
+        self.push(frame.topic, frame)
+
+    def request_resync(self):
+        self.push(RESYNC, None)
+
+    def push(self, topic: str, frame: Optional[codec.Frame] = None):
+        if topic not in FORWARDED_TOPICS and topic != RESYNC:
+            return
+        if self.too_slow:
+            return
+        if (
+            self._sender_task is not None
+            and self._pending
+            and time.monotonic() - self._pending[0][2] > MAX_LAG_SECONDS
+        ):
+            self._disconnect_slow()
+            return
+        if topic not in CONTROL_TOPICS and self._coalesce(topic):
+            return
+        self._pending.append((topic, frame, time.monotonic()))
+        self._wakeup.set()
+
+    def _coalesce(self, topic: str) -> bool:
+        if topic not in SNAPSHOT_TOPICS:
+            return False
+        # The snapshot is read when it is sent, so a pending one covers every delta
+        if any(pending_topic == RESYNC for pending_topic, _, _ in self._pending):
+            self.coalesced_frames += 1
+            return True
+        for index, (pending_topic, _, enqueued_at) in enumerate(self._pending):
+            if pending_topic == topic:
+                self._pending[index] = (RESYNC, None, enqueued_at)
+                self.coalesced_frames += 1
+                return True
+        return False
+
+    def _disconnect_slow(self):
+        _logger.warning(
+            f"Disconnecting slow client {self.client_id or 'host'} of session {self.session_id}"
+        )
+        self.too_slow = True
+        self._pending.clear()
+        if self._sender_task is not None:
+            self._sender_task.cancel()
+
+    async def run_sender(self):
+        # Returns once the connection should be closed
+        self._sender_task = asyncio.current_task()
+        # Only connections that made it past the snapshot are counted
+        connections = metrics.WEBSOCKET_CONNECTIONS.labels("guest" if self.client_id else "host")
+        connections.inc()
+        # Frames buffered before the sender started don't count as lag
+        now = time.monotonic()
+        self._pending = deque((topic, frame, now) for topic, frame, _ in self._pending)
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._pending:
+                    topic, frame, _ = self._pending.popleft()
+                    await self._send(topic, frame)
+                    if self.close_on(topic, frame.value if frame else None):
+                        await self.websocket.close()
+                        return
+        except asyncio.CancelledError:
+            if not self.too_slow:
+                raise
+            try:
+                await asyncio.wait_for(
+                    self.websocket.close(code=SLOW_CLIENT_CLOSE_CODE), timeout=1
+                )
+            except Exception:
+                pass
+        finally:
+            connections.dec()
+
+    async def _send(self, topic: str, frame: Optional[codec.Frame]):
+        if topic == RESYNC:
+            snapshot = await LiveSessionService.get_temp_session(self.session_id)
+            if snapshot is not None:
+                await self.send_snapshot(snapshot, RESYNC)
+            return
+        # Published pre-encoded, nothing is serialized per client
+        await self._send_frame(frame.encoded(self.wire_format))
+
+    async def _send_frame(self, frame):
+        if isinstance(frame, bytes):
+            await self.websocket.send_bytes(frame)
+        else:
+            await self.websocket.send_text(frame)
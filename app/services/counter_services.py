@@ -0,0 +1,106 @@
+import logging
+from typing import Dict, Optional, Tuple
+
+from beanie import PydanticObjectId
+from pymongo import UpdateOne
+
+from app.models.user_counter import UserCounter
+from app.models.library import Library
+from app.models.question import Question
+from app.models.car_race import CarRace
+from app.models.car_race_session import CarRaceSession
+
+_logger = logging.getLogger(__name__)
+
+# Counter scopes
+LIBRARIES = "library"
+QUESTIONS = "question"
+CAR_RACES = "car_race"
+SESSIONS = "session"
+
+# scope -> (counted collection, field holding the scope_id)
+COUNTED = {
+    LIBRARIES: (Library, None),
+    QUESTIONS: (Question, "library_id"),
+    CAR_RACES: (CarRace, None),
+    SESSIONS: (CarRaceSession, None),
+}
+
+
+class Counter:
+    """
+    Number of items a user has in one list, maintained by the services that
+    create and delete them so list endpoints don't count on every request.
+
+    Increments only apply to counters that exist. A counter is created from
+    a real count the first time its list is read (see paginate), so users
+    from before the counters, or counters lost in between, never start from
+    a wrong value. Writes to the item and to its counter are two separate
+    atomic writes, CounterService.reconcile repairs whatever drifts.
+    """
+
+    __slots__ = ("key",)
+
+    def __init__(self, user_id: str, scope: str, scope_id: Optional[str] = None):
+        self.key = {
+            "user_id": PydanticObjectId(user_id),
+            "scope": scope,
+            "scope_id": PydanticObjectId(scope_id) if scope_id else None,
+        }
+
+    async def get(self) -> Optional[int]:
+        counter = await UserCounter.get_motor_collection().find_one(self.key, {"total": 1})
+        return counter["total"] if counter else None
+
+    async def increment(self, amount: int = 1):
+        await UserCounter.get_motor_collection().update_one(self.key, {"$inc": {"total": amount}})
+
+    async def seed(self, count: int):
+        # Loses to a counter created in the meantime
+        await UserCounter.get_motor_collection().update_one(
+            self.key, {"$setOnInsert": {"total": count}}, upsert=True
+        )
+
+    async def set(self, count: int):
+        await UserCounter.get_motor_collection().update_one(
+            self.key, {"$set": {"total": count}}, upsert=True
+        )
+
+    async def delete(self):
+        await UserCounter.get_motor_collection().delete_one(self.key)
+
+
+class CounterService:
+
+    @staticmethod
+    async def reconcile() -> int:
+        # Recounts every scope in one $group per collection, returns how many counters were fixed
+        fixed = 0
+        collection = UserCounter.get_motor_collection()
+        for scope, (document, scope_field) in COUNTED.items():
+            counters: Dict[Tuple, int] = {}
+            async for counter in collection.find({"scope": scope}):
+                counters[(counter["user_id"], counter.get("scope_id"))] = counter["total"]
+            if not counters:
+                continue
+            group_id = {"user_id": "$user_id"}
+            if scope_field:
+                group_id["scope_id"] = f"${scope_field}"
+            actual: Dict[Tuple, int] = {}
+            async for group in document.get_motor_collection().aggregate(
+                [{"$group": {"_id": group_id, "count": {"$sum": 1}}}]
+            ):
+                actual[(group["_id"]["user_id"], group["_id"].get("scope_id"))] = group["count"]
+            operations = [
+                UpdateOne(
+                    {"user_id": user_id, "scope": scope, "scope_id": scope_id},
+                    {"$set": {"total": actual.get((user_id, scope_id), 0)}},
+                )
+                for (user_id, scope_id), count in counters.items()
+                if actual.get((user_id, scope_id), 0) != count
+            ]
+            if operations:
+                await collection.bulk_write(operations, ordered=False)
+                _logger.warning(f"Reconciled {len(operations)} drifted {scope} counters")
+                fixed += len(operations)
+        return fixed
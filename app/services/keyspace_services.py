@@ -0,0 +1,117 @@
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.database import pub
+from app.settings.app_settings import AppSettings
+
+_logger = logging.getLogger(__name__)
+
+# Every redis key written for a live session is {prefix}:{session_id}
+SESSION_KEY_PREFIXES = (
+    "settings",
+    "results",
+    # No longer written, still expired for sessions that ran before
+    "ranking",
+    "current_clients",
+    "snapshot",
+    "tick_stats",
+    "actions",
+)
+SCAN_COUNT = 1000
+# TTL / EXPIRE / MEMORY USAGE commands sent per round trip
+PIPELINE_BATCH_SIZE = 500
+
+
+class KeyspaceService:
+    """
+    Lifecycle of the per session redis keys. Keys of an ended session get a
+    TTL once its results are persisted, and a periodic sweep gives the same
+    TTL to keys of sessions no engine will ever finish (not active anymore
+    and never expired), so redis only holds the sessions running right now.
+    """
+
+    @staticmethod
+    def session_keys(session_id: str) -> List[str]:
+        return [f"{prefix}:{session_id}" for prefix in SESSION_KEY_PREFIXES]
+
+    @staticmethod
+    async def expire_session(session_id: str, ttl: Optional[int] = None):
+        ttl = ttl or AppSettings().session_ended_key_ttl
+        pipe = pub.pipeline(transaction=False)
+        for key in KeyspaceService.session_keys(session_id):
+            pipe.expire(key, ttl)
+        await pipe.execute()
+
+    @staticmethod
+    async def scan_session_keys() -> Dict[str, List[str]]:
+        # session_id -> its keys, SCAN so redis is never blocked
+        sessions = defaultdict(list)
+        for prefix in SESSION_KEY_PREFIXES:
+            async for key in pub.scan_iter(match=f"{prefix}:*", count=SCAN_COUNT):
+                sessions[key.split(":", 1)[1]].append(key)
+        return sessions
+
+    @staticmethod
+    async def sweep(active_sessions: Set[str]) -> int:
+        # Returns how many orphaned keys got a TTL
+        sessions = await KeyspaceService.scan_session_keys()
+        keys = [
+            key
+            for session_id, session_keys in sessions.items()
+            if session_id not in active_sessions
+            for key in session_keys
+        ]
+        ttls = await _batched(keys, lambda pipe, key: pipe.ttl(key))
+        # -1: no TTL, -2: gone since the scan
+        orphans = [key for key, ttl in zip(keys, ttls) if ttl == -1]
+        if orphans:
+            ttl = AppSettings().session_ended_key_ttl
+            await _batched(orphans, lambda pipe, key: pipe.expire(key, ttl))
+            _logger.info(f"Keyspace sweep expired {len(orphans)} orphaned session keys")
+        return len(orphans)
+
+    @staticmethod
+    async def memory_report(active_sessions: Set[str], limit: int = 50) -> dict:
+        sessions = await KeyspaceService.scan_session_keys()
+        keys = [key for session_keys in sessions.values() for key in session_keys]
+        usages = dict(zip(keys, await _batched(keys, lambda pipe, key: pipe.memory_usage(key))))
+        report = []
+        for session_id, session_keys in sessions.items():
+            families = {key.split(":", 1)[0]: usages.get(key) or 0 for key in session_keys}
+            report.append({
+                "session_id": session_id,
+                "active": session_id in active_sessions,
+                "bytes": sum(families.values()),
+                "keys": families,
+            })
+        report.sort(key=lambda session: session["bytes"], reverse=True)
+        question_pack_keys = [
+            key async for key in pub.scan_iter(match="question_pack:*", count=SCAN_COUNT)
+        ]
+        question_pack_usages = await _batched(
+            question_pack_keys, lambda pipe, key: pipe.memory_usage(key)
+        )
+        memory = await pub.info("memory")
+        return {
+            "session_count": len(report),
+            "active_session_count": sum(session["active"] for session in report),
+            "session_bytes": sum(session["bytes"] for session in report),
+            "question_pack_count": len(question_pack_keys),
+            "question_pack_bytes": sum(usage or 0 for usage in question_pack_usages),
+            "used_memory": memory.get("used_memory"),
+            "used_memory_peak": memory.get("used_memory_peak"),
+            "maxmemory": memory.get("maxmemory"),
+            "sessions": report[:limit],
+        }
+
+
+async def _batched(keys: Iterable[str], command) -> list:
+    keys = list(keys)
+    replies = []
+    for start in range(0, len(keys), PIPELINE_BATCH_SIZE):
+        pipe = pub.pipeline(transaction=False)
+        for key in keys[start:start + PIPELINE_BATCH_SIZE]:
+            command(pipe, key)
+        replies.extend(await pipe.execute())
+    return replies
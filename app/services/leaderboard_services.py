@@ -0,0 +1,127 @@
+import logging
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from aioredis.client import Pipeline
+
+from app.database import redis
+from app.helpers import codec
+
+_logger = logging.getLogger(__name__)
+
+# Players are ranked by (-point, time). Both are packed into a single score:
+# a higher point always wins and, on equal points, the smaller time ranks
+# first. Times are clamped into [0, TIME_SCALE) so they can never spill over
+# into the point part. The engine keeps the order in memory, see Ranking.
+TIME_SCALE = 10 ** 7
+
+
+def composite_score(point, time) -> float:
+    time = min(max(float(time or 0), 0.0), TIME_SCALE - 1)
+    return float(point or 0) * TIME_SCALE - time
+
+
+class Ranking:
+    """
+    The ranking of a live session, held by its engine only: ascending
+    (score, uid) pairs read backwards, so score desc, then uid desc on equal
+    scores (str order is UTF-8 byte order), the order session_result exports
+    use too. Ranks and moved slices are computed here, redis only keeps the
+    results, a resuming engine rebuilds the ranking from them.
+    """
+
+    def __init__(self, players: Optional[Dict[str, dict]] = None):
+        self._scores: Dict[str, float] = {
+            uid: composite_score(player.get("point"), player.get("time"))
+            for uid, player in (players or {}).items()
+        }
+        self._entries: List[Tuple[float, str]] = sorted(
+            (score, uid) for uid, score in self._scores.items()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def rank(self, uid: str) -> Optional[int]:
+        # 0-based position of the player, None if the player is not ranked
+        score = self._scores.get(uid)
+        if score is None:
+            return None
+        return len(self._entries) - 1 - bisect_left(self._entries, (score, uid))
+
+    def update(self, scores: Dict[str, float]) -> Tuple[int, int]:
+        # O(k log n) searches, returns the (low, high) rank range that moved,
+        # low > high when nothing did
+        old_ranks = [self.rank(uid) for uid in scores]
+        for uid, score in scores.items():
+            old_score = self._scores.get(uid)
+            if old_score is not None:
+                del self._entries[bisect_left(self._entries, (old_score, uid))]
+            insort(self._entries, (score, uid))
+            self._scores[uid] = score
+        # A player moving from rank a to rank b shifts everyone in between,
+        # a new player shifts everyone below it
+        total = len(self._entries)
+        low, high = total, -1
+        for uid, old_rank in zip(scores, old_ranks):
+            new_rank = self.rank(uid)
+            if old_rank == new_rank:
+                continue
+            if old_rank is None:
+                old_rank = total - 1
+            low = min(low, old_rank, new_rank)
+            high = max(high, old_rank, new_rank)
+        return low, high
+
+    def slice(self, low: int, high: int) -> List[str]:
+        # uids ranked low..high, both included
+        if high < low:
+            return []
+        total = len(self._entries)
+        return [uid for _, uid in reversed(self._entries[total - 1 - high:total - low])]
+
+    def uids(self) -> List[str]:
+        return [uid for _, uid in reversed(self._entries)]
+
+
+class LeaderboardService:
+    @staticmethod
+    def results_key(session_id: str) -> str:
+        return f"results:{session_id}"
+
+    @staticmethod
+    def update(session_id: str, players: Dict[str, dict], ranking: Ranking, seq: int, pipe: Pipeline) -> dict:
+        # Only the players that changed are written, queued on pipe so they
+        # go out with the rest of the tick. Returns the delta clients need to
+        # patch their ranking: the changed players, the ranking slice covering
+        # every moved position and seq, the sequence number of this update.
+        if not players:
+            return {}
+        scores = {
+            uid: composite_score(player.get("point"), player.get("time"))
+            for uid, player in players.items()
+        }
+        low, high = ranking.update(scores)
+        pipe.hset(
+            LeaderboardService.results_key(session_id),
+            mapping={uid: codec.dumps_player(player) for uid, player in players.items()},
+        )
+        pipe.hset(f"settings:{session_id}", "seq", seq)
+        moved = ranking.slice(low, high)
+        return {
+            "seq": seq,
+            "offset": low if moved else 0,
+            "ranking": moved,
+            "total": len(ranking),
+            "data": players,
+        }
+
+    @staticmethod
+    async def results(session_id: str) -> Dict[str, dict]:
+        results = await redis.hgetall(LeaderboardService.results_key(session_id))
+        return LeaderboardService.decode_results(results)
+
+    @staticmethod
+    def decode_results(results: dict) -> Dict[str, dict]:
+        # results: values are msgpack player records, see app.helpers.codec
+        return {uid.decode(): codec.loads_player(value) for uid, value in results.items()}
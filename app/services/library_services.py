@@ -1,5 +1,5 @@
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime
 from beanie import PydanticObjectId
 from pymongo.errors import DuplicateKeyError
@@ -7,19 +7,18 @@ from pymongo.errors import DuplicateKeyError
 from app.models.library import Library
 from app.models.question import Question
 from app.dto.library_dto import LibraryResponseData
+from app.helpers.pagination import paginate
 from app.helpers.exceptions import NotFoundException, BadRequestException
+from app.services.question_pack_services import QuestionPackService
+from app.services.counter_services import Counter, LIBRARIES, QUESTIONS
 
 _logger = logging.getLogger(__name__)
 
 
 class LibraryService:
     @staticmethod
-    async def list_libraries(user_id: str, page: int, limit: int) -> List[LibraryResponseData]:
-        skip = limit * (page - 1)
-        query = Library.find({"user_id": PydanticObjectId(user_id)})
-        total = await query.count()
-        libraries = await query.skip(skip).limit(limit).sort(-Library.id).project(LibraryResponseData).to_list()
-        return libraries, total
+    async def list_libraries(user_id: str, page: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[LibraryResponseData], Optional[int], Optional[str]]:
+        return await paginate(Library, {"user_id": PydanticObjectId(user_id)}, LibraryResponseData, page, limit, cursor, Counter(user_id, LIBRARIES))
     
     @staticmethod
     async def get_library_by_id(user_id: str, library_id: str) -> LibraryResponseData:
@@ -36,6 +35,7 @@ class LibraryService:
             await library.save()
         except DuplicateKeyError:
             raise BadRequestException("Library already exists")
+        await Counter(user_id, LIBRARIES).increment()
         _logger.info(f"New library created: {library.library_name}")
 
     @staticmethod
@@ -54,6 +54,7 @@ class LibraryService:
             await copied_library.save()
         except DuplicateKeyError:
             raise BadRequestException("Library name existed")
+        await Counter(user_id, LIBRARIES).increment()
         _logger.info(f"New library created: {copied_library.library_name}")
         # Copy questions
         questions = await Question.find({"library_id": PydanticObjectId(library_id)}).to_list()
@@ -64,6 +65,7 @@ class LibraryService:
             question.created_at = current_time
             question.updated_at = current_time
             await question.save()
+        await Counter(user_id, QUESTIONS, copied_library.id).set(len(questions))
         return copied_library
 
     @staticmethod
@@ -83,6 +85,9 @@ class LibraryService:
         library = await Library.find_one({"user_id": PydanticObjectId(user_id), "_id": PydanticObjectId(library_id)})
         if not library:
             raise NotFoundException("Library not found")
-        await Question.find_many({"library_id": library_id}).delete()
+        await Question.find_many({"library_id": PydanticObjectId(library_id)}).delete()
+        await QuestionPackService.invalidate(library_id)
         await library.delete()
+        await Counter(user_id, QUESTIONS, library_id).delete()
+        await Counter(user_id, LIBRARIES).increment(-1)
         _logger.info(f"Library deleted: {library.library_name}")
\ No newline at end of file
@@ -1,17 +1,26 @@
+import time
 import logging
-import json
 import asyncio
-from queue import Queue
-from datetime import datetime
+from typing import Dict, List, Optional, Set
+from datetime import datetime, timedelta
 from beanie import PydanticObjectId
+from aioredis.client import Pipeline
 
-from app.database import psub, pub, redis
+from app.database import pub, redis
 from app.models.car_race_session import CarRaceSession, SessionStatus
 from app.models.car_race import CarRace
-from app.models.question import Question
-from app.dto.question_dto import QuestionPutRequest
 from app.dto.session_dto import SessionFullResponseData
+from app.services.leaderboard_services import LeaderboardService, Ranking
+from app.services.action_stream_services import ActionStreamService
+from app.services.question_pack_services import QuestionPackService
+from app.services.checkpoint_services import CheckpointService
+from app.services.keyspace_services import KeyspaceService
+from app.services.snapshot_services import SessionSnapshot, SnapshotService
+from app.services.scoring_services import AnswerIndex, apply_answer, new_player
+from app.helpers import codec, metrics
 from app.helpers.exceptions import NotFoundException
+from app.helpers.tick_scheduler import TickScheduler
+from app.settings.app_settings import AppSettings
 
 _logger = logging.getLogger(__name__)
 
@@ -19,33 +28,14 @@ _logger = logging.getLogger(__name__)
 class LiveSessionService:
 
     @staticmethod
-    async def get_temp_session(session_id: str):
-        # Gather questions, settings, session status, list player, player data and ranking
-        status = await pub.hget(f"settings:{session_id}", "status")
-        if not status or status == "ENDED":
+    async def get_temp_session(session_id: str) -> Optional[SessionSnapshot]:
+        # Snapshot of the question pack, settings, session status, list player,
+        # player data and ranking, stored by the session engine. Clients apply
+        # every delta with a higher seq on top of it.
+        snapshot = await SnapshotService.get(session_id)
+        if snapshot is None or snapshot.ended:
             return None
-        settings, questions, client_list, client_data, ranking = await asyncio.gather(
-            pub.hgetall(f"settings:{session_id}"),
-            pub.get(f"questions:{session_id}"),
-            pub.smembers(f"current_clients:{session_id}"),
-            pub.hgetall(f"results:{session_id}"),
-            pub.get(f"ranking:{session_id}"),
-        )
-        if not ranking:
-            ranking = "[]"
-        for key, value in client_data.items():
-            client_data[key] = json.loads(value)
-        session = {
-            "session_status": settings["status"],
-            "bonus": settings["bonus"],
-            "penalty": settings["penalty"],
-            "session_name": settings["session_name"],
-            "questions": json.loads(questions),
-            "client_list": list(client_list),
-            "client_data": client_data,
-            "ranking": json.loads(ranking),
-        }
-        return session
+        return snapshot
 
     @staticmethod
     async def get_statis_session(session_id: str) -> dict:
@@ -53,11 +43,21 @@ class LiveSessionService:
         session = await query.project(SessionFullResponseData)
         if not session:
             raise NotFoundException("Session not found")
+        await CheckpointService.attach_results(session_id, session.result)
         return_data = session.dict(
             exclude={"id", "_id", "car_race_id", "created_at", "updated_at"}
         )
         return return_data
 
+    @staticmethod
+    async def get_tick_stats(user_id: str, session_id: str) -> dict:
+        session = await CarRaceSession.find_one(
+            {"user_id": PydanticObjectId(user_id), "_id": PydanticObjectId(session_id)}
+        )
+        if not session:
+            raise NotFoundException("Session not found")
+        return await pub.hgetall(f"tick_stats:{session_id}")
+
     @staticmethod
     async def start(user_id: str, session_id: str):
         session = await CarRaceSession.find_one(
@@ -70,11 +70,12 @@ class LiveSessionService:
             "updated_at": datetime.now(),
         }
         await session.update({"$set": update_data})
-        await redis.hset(f"settings:{session_id}", "status", "STARTED")
-        await pub.publish(
-            f"channel:{session_id}",
-            json.dumps({"topic": "update_status", "value": "STARTED"}),
+        await redis.hset(
+            f"settings:{session_id}",
+            mapping={"status": "STARTED", "started_at": time.time()},
         )
+        await publish_to_clients(session_id, "update_status", "STARTED")
+        await ActionStreamService.submit(session_id, "update_status", "STARTED")
 
     @staticmethod
     async def end(user_id: str, session_id: str):
@@ -89,217 +90,550 @@ class LiveSessionService:
         }
         await session.update({"$set": update_data})
         await redis.hset(f"settings:{session_id}", "status", "ENDED")
-        await pub.publish(
-            f"channel:{session_id}",
-            json.dumps({"topic": "update_status", "value": "ENDED"}),
-        )
+        await publish_to_clients(session_id, "update_status", "ENDED")
+        await ActionStreamService.submit(session_id, "update_status", "ENDED")
 
 
-async def start_session_in_background(session_id: str, start_time: datetime):
-    # Gather resources
-    session = await CarRaceSession.find_one({"_id": PydanticObjectId(session_id)})
-    race_id = session.car_race_id
-    car_race = await CarRace.find_one({"_id": PydanticObjectId(race_id)})
-    library_id = car_race.library_id
-    question_list = (
-        await Question.find({"library_id": PydanticObjectId(library_id)})
-        .project(QuestionPutRequest)
-        .to_list()
-    )
-    parsed_question_list = []
-    for question in question_list:
-        parsed_question_list.append(question.dict())
-    async with psub as p:
-        # Subcribe to session redis channel
-        await p.subscribe(f"channel:{session_id}")
-        if p != None:
-            # On create session
-            loop_time = datetime.now()
-            status = "CREATED"
-            message_queue = Queue()
-            await redis.set(f"questions:{session_id}", json.dumps(parsed_question_list))
-            await redis.hset(
-                f"settings:{session_id}",
-                mapping={
-                    "status": "CREATED",
-                    "bonus": car_race.bonus_time_setting,
-                    "penalty": car_race.penalty_time_setting,
-                    "session_name": session.car_race_session_name,
-                },
-            )
+# Engine event kinds
+ACTIONS = "actions"
+TICK = "tick"
+TIMEOUT = "timeout"
+CHECKPOINT = "checkpoint"
+# Stream topics batched into ticks, the others are handled as they come
+TICK_TOPICS = {"client_update", "client_join", "client_leave"}
+
+# Seconds before a tick whose redis write failed is tried again
+TICK_RETRY_DELAY = 1.0
+# Sessions are ended if they stay CREATED / STARTED for longer than this
+CREATED_TIMEOUT = timedelta(minutes=15)
+STARTED_TIMEOUT = timedelta(minutes=60)
+
+
+class SessionEngine:
+    """
+    Actor running one live session.
+
+    Stream entries, tick and timeout timers all post events to a single
+    asyncio mailbox which is consumed by one coroutine, so session state is
+    only touched in one place. An idle session just waits on the mailbox, and
+    timers are only armed when there is something to do.
+    """
+
+    def __init__(self, session_id: str, start_time: datetime):
+        self.session_id = session_id
+        self.start_time = start_time
+        self.channel = f"channel:{session_id}"
+        self.mailbox: asyncio.Queue = asyncio.Queue()
+        # Latest action of every player since the last tick
+        self.pending_actions: Dict[str, dict] = {}
+        # Players who joined or left since the last tick
+        self.pending_joins: Set[str] = set()
+        self.pending_leaves: Set[str] = set()
+        # Stream entries of the pending changes, acked once the tick applied them
+        self.pending_entry_ids: List[str] = []
+        self.status = None
+        self.session = None
+        self.scheduler = TickScheduler()
+        # Server side scoring state, see app.services.scoring_services
+        self.answers = AnswerIndex([])
+        self.players: Dict[str, dict] = {}
+        # Ranks of self.players, rebuilt from them on resume
+        self.ranking = Ranking()
+        self.answered: Dict[str, Set[int]] = {}
+        self.bonus = 0.0
+        self.penalty = 0.0
+        self.started_at: Optional[float] = None
+        # Rest of the snapshot state, see _store_snapshot
+        self.session_name = None
+        self.question_pack = None
+        self.seq = 0
+        self.snapshot_version = 0
+        # Set when a tick failed after the in memory ranking moved, the next
+        # delta carries the whole ranking instead of the slice that moved
+        self._resend_ranking = False
+        self.clients: Set[str] = set()
+        # Players changed since the last checkpoint to MongoDB, see CheckpointService
+        self.checkpoint_interval = AppSettings().session_checkpoint_interval
+        self.unsaved: Set[str] = set()
+        self._unsaved_since: Optional[float] = None
+        self._checkpoint_task: Optional[asyncio.Task] = None
+        self._checkpoint_handle: Optional[asyncio.TimerHandle] = None
+        self.checkpoint_stats = {
+            "checkpoints": 0,
+            "last_players": 0,
+            "last_bytes": 0,
+            "total_bytes": 0,
+            "last_duration": 0.0,
+            "max_duration": 0.0,
+            "last_lag": 0.0,
+            "max_lag": 0.0,
+        }
+        self._last_tick = 0.0
+        self._tick_planned_at = None
+        self._tick_handle: Optional[asyncio.TimerHandle] = None
+        self._timeout_handle: Optional[asyncio.TimerHandle] = None
+
+    async def run(self):
+        await self._load()
+        self.snapshot_version = await SnapshotService.version(self.session_id)
+        await self._store_snapshot()
+        if self.status == "ENDED":
+            # Ended while no engine was running, only persisting is left
+            await self._finish()
+            return
+        reader = asyncio.create_task(
+            self._read_actions(), name=f"session-reader:{self.session_id}"
+        )
+        self._schedule_timeout()
+        metrics.ENGINE_RUNNING.inc()
+        try:
             while True:
-                # Loop to get published message from redis
-                total_delta = datetime.now() - start_time
-                if total_delta.total_seconds() > 15 * 60 and status == "CREATED":
-                    # End session if stayed in CREATED for over 15 minutes
-                    await pub.publish(
-                        f"channel:{session_id}",
-                        json.dumps({"topic": "update_status", "value": "ENDED"}),
-                    )
-                    update_data = {
-                        "session_status": SessionStatus.ENDED,
-                        "updated_at": datetime.now(),
-                    }
-                    await session.update({"$set": update_data})
-                    await redis.hset(f"settings:{session_id}", "status", "ENDED")
-                    await pub.publish(
-                                f"channel:{session_id}",
-                                json.dumps(
-                                    {
-                                        "topic": "close_websocket",
-                                        "value": ""
-                                    }
-                                ),
-                            )
+                kind, value = await self.mailbox.get()
+                if await self._handle(kind, value):
                     break
+        finally:
+            metrics.ENGINE_RUNNING.dec()
+            reader.cancel()
+            for handle in (self._tick_handle, self._timeout_handle, self._checkpoint_handle):
+                if handle:
+                    handle.cancel()
 
-                if total_delta.total_seconds() > 60 * 60 and status == "STARTED":
-                    # End session if total time over 15 minutes
-                    await pub.publish(
-                        f"channel:{session_id}",
-                        json.dumps({"topic": "update_status", "value": "ENDED"}),
-                    )
-                    update_data = {
-                        "session_status": SessionStatus.ENDED,
-                        "updated_at": datetime.now(),
-                    }
-                    await session.update({"$set": update_data})
-                    await redis.hset(f"settings:{session_id}", "status", "ENDED")
-                    await pub.publish(
-                                f"channel:{session_id}",
-                                json.dumps(
-                                    {
-                                        "topic": "close_websocket",
-                                        "value": ""
-                                    }
-                                ),
-                            )
-                    break
-                # Get message from redis channel
-                message = await p.get_message(
-                    ignore_subscribe_messages=True, timeout=0.5
+    async def _load(self):
+        # Gather resources
+        self.session = await CarRaceSession.find_one({"_id": PydanticObjectId(self.session_id)})
+        # A session taken over from another worker resumes from its redis state.
+        # Only the engine writes question_pack, start / end may have written
+        # the status before any engine loaded the session.
+        settings = await pub.hgetall(f"settings:{self.session_id}")
+        if settings.get("question_pack"):
+            self.status = settings["status"]
+            self.scheduler = TickScheduler(
+                float(settings.get("min_tick_interval", 0)),
+                float(settings.get("max_tick_interval", 0)),
+            )
+            self.bonus = float(settings.get("bonus", 0))
+            self.penalty = float(settings.get("penalty", 0))
+            if settings.get("started_at"):
+                self.started_at = float(settings["started_at"])
+            self.session_name = settings.get("session_name")
+            self.question_pack = settings["question_pack"]
+            self.seq = int(settings.get("seq", 0))
+            questions = await QuestionPackService.get_questions(self.question_pack)
+            self.answers = AnswerIndex(questions)
+            self.clients = await pub.smembers(f"current_clients:{self.session_id}")
+            self.players = await LeaderboardService.results(self.session_id)
+            self.ranking = Ranking(self.players)
+            # The previous engine may have died before checkpointing them
+            self.unsaved = set(self.players)
+            await self._restore_checkpoint()
+            _logger.info(f"Resuming session {self.session_id} with status {self.status}")
+            return
+        car_race = await CarRace.find_one({"_id": PydanticObjectId(self.session.car_race_id)})
+        # Shared with every session on the same library questions
+        question_pack = await QuestionPackService.get_pack_hash(str(car_race.library_id))
+        questions = await QuestionPackService.get_questions(question_pack)
+        # On create session, or started / ended before the first engine ran
+        self.status = settings.get("status", "CREATED")
+        self.scheduler = TickScheduler(car_race.min_tick_interval, car_race.max_tick_interval)
+        self.answers = AnswerIndex(questions)
+        self.bonus = car_race.bonus_time_setting
+        self.penalty = car_race.penalty_time_setting
+        self.session_name = self.session.car_race_session_name
+        self.question_pack = question_pack
+        pipe = redis.pipeline(transaction=True)
+        # Not overwritten, start / end may be writing it right now
+        pipe.hsetnx(f"settings:{self.session_id}", "status", self.status)
+        pipe.hset(
+            f"settings:{self.session_id}",
+            mapping={
+                "bonus": car_race.bonus_time_setting,
+                "penalty": car_race.penalty_time_setting,
+                "session_name": self.session.car_race_session_name,
+                "question_pack": question_pack,
+                "min_tick_interval": self.scheduler.min_interval,
+                "max_tick_interval": self.scheduler.max_interval,
+            },
+        )
+        await pipe.execute()
+        if settings.get("started_at"):
+            self.started_at = float(settings["started_at"])
+        elif self.status == "CREATED" and self.session.session_status != SessionStatus.CREATED:
+            # Redis lost the state of a running session, carry on from MongoDB
+            self.status = self.session.session_status.value
+            self.started_at = self.session.updated_at.timestamp()
+            await redis.hset(
+                f"settings:{self.session_id}",
+                mapping={"status": self.status, "started_at": self.started_at},
+            )
+            await self._restore_checkpoint()
+
+    async def _restore_checkpoint(self):
+        # Players missing from redis (evicted or flushed) come back from the last checkpoint
+        if not self.players:
+            self.players = await CheckpointService.results(self.session_id)
+            if self.players:
+                _logger.warning(
+                    f"Restored {len(self.players)} players of session {self.session_id} from checkpoint"
                 )
-                print(message)
-                if message != None:
-                    data = json.loads(message["data"])
-                    topic = data["topic"]
-                    value = data["value"]
-                    if topic == "update_status":
-                        status = value
-                        if value == "ENDED":
-                            # Update temp result from redis to MongoDB when session ended
-                            update_result = await pub.hgetall(f"results:{session_id}")
-                            ranking = await pub.get(f"ranking:{session_id}")
-                            if not ranking:
-                                ranking = "[]"
-                            for key, value in update_result.items():
-                                update_result[key] = json.loads(value)
-                            update_data = {
-                                "result": {
-                                    "results": update_result,
-                                    "ranking": json.loads(ranking),
-                                },
-                                "updated_at": datetime.now(),
-                            }
-                            await update_result_to_client(
-                                session_id, json.loads(ranking), update_result
-                            )
-                            await session.update({"$set": update_data})
-                            await pub.publish(
-                                f"channel:{session_id}",
-                                json.dumps(
-                                    {
-                                        "topic": "close_websocket",
-                                        "value": ""
-                                    }
-                                ),
-                            )
-                            break
-                    elif topic == "client_update":
-                        # Gather player action in a certain amount of time (1 second)
-                        message_queue.put(data["value"])
-                    elif topic == "client_join":
-                        # Logic when someone joins the session
-                        await redis.sadd(f"current_clients:{session_id}", value["uid"])
-                        await redis.hset(
-                            f"results:{session_id}", value["uid"], json.dumps(value)
-                        )
-                        await update_current_clients(session_id)
-                    elif topic == "client_leave":
-                        # Logic when someone leaves the session
-                        await redis.srem(f"current_clients:{session_id}", value)
-                        await update_current_clients(session_id)
-
-                delta = datetime.now() - loop_time
-                qSize = message_queue.qsize()
-                if delta.total_seconds() >= 1 and qSize:
-                    loop_time = datetime.now()
-                    # Logic for player actions (batch)
-                    old_results: dict = await pub.hgetall(f"results:{session_id}")
-                    while message_queue.qsize():
-                        # Player action data structure {uid, name, point, time}
-                        new_update = message_queue.get()
-                        uid = new_update["uid"]
-                        old_results[uid] = json.dumps(new_update)
-                    # sort new results
-                    if qSize:
-                        try:
-                            await redis.hset(
-                                f"results:{session_id}", mapping={**old_results}
-                            )
-                            ranking = []
-                            score_list = list(old_results.values())
-                            for index, score in enumerate(score_list):
-                                score_list[index] = json.loads(score)
-                            sorted_score_list = sorted(
-                                score_list, key=lambda x: (-x["point"], x["time"])
-                            )
-                            for score in sorted_score_list:
-                                ranking.append(score["uid"])
-                            await redis.set(
-                                f"ranking:{session_id}", json.dumps(ranking)
-                            )
-                            for key, value in old_results.items():
-                                old_results[key] = json.loads(value)
-                            await update_result_to_client(
-                                session_id, ranking, old_results
-                            )
-                        except Exception as e:
-                            e.with_traceback()
-                            print(e)
-
-
-async def update_current_clients(session_id: str):
-    client_lists, client_data = await asyncio.gather(
-        pub.smembers(f"current_clients:{session_id}"),
-        pub.hgetall(f"results:{session_id}"),
-    )
-    for key, value in client_data.items():
-        client_data[key] = json.loads(value)
-    await pub.publish(
-        f"channel:{session_id}",
-        json.dumps(
-            {
-                "topic": "client_update_users",
-                "value": {
-                    "player_list": list(client_lists),
-                    "data": client_data,
-                },
-            }
-        ),
-    )
-
-
-async def update_result_to_client(session_id: str, ranking: list, client_data: dict):
-    await pub.publish(
-        f"channel:{session_id}",
-        json.dumps(
-            {
-                "topic": "client_update_result",
-                "value": {
-                    "ranking": ranking,
-                    "data": client_data,
+                pipe = redis.pipeline(transaction=True)
+                self.seq += 1
+                LeaderboardService.update(self.session_id, self.players, self.ranking, self.seq, pipe)
+                await pipe.execute()
+        self.answered = {
+            uid: set(player.get("answered") or [])
+            for uid, player in self.players.items()
+        }
+
+    async def _read_actions(self):
+        # None until the consumer group exists, then entries a previous engine
+        # of this session read but never applied from "0", then new ones (">")
+        last_id = None
+        while True:
+            try:
+                if last_id is None:
+                    await ActionStreamService.ensure_group(self.session_id)
+                    last_id = "0"
+                entries = await ActionStreamService.read(self.session_id, last_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _logger.exception(f"Failed to read actions of session {self.session_id}")
+                await asyncio.sleep(1)
+                continue
+            if entries:
+                self.mailbox.put_nowait((ACTIONS, entries))
+            if last_id != ">":
+                last_id = entries[-1][0] if entries else ">"
+
+    async def _handle(self, kind: str, value) -> bool:
+        # Returns True once the session is over
+        if kind == TICK:
+            self._tick_handle = None
+            await self._tick()
+        elif kind == TIMEOUT:
+            _logger.info(f"Session {self.session_id} timed out in status {self.status}")
+            await self._end()
+            return True
+        elif kind == ACTIONS:
+            return await self._handle_actions(value)
+        elif kind == CHECKPOINT:
+            self._checkpoint_handle = None
+            self._start_checkpoint()
+        return False
+
+    async def _handle_actions(self, entries: list) -> bool:
+        handled_entry_ids = []
+        try:
+            for entry_id, topic, value in entries:
+                if topic in TICK_TOPICS:
+                    # Applied right away, written and published on the next tick
+                    if self._stage(entry_id, topic, value):
+                        self.pending_entry_ids.append(entry_id)
+                        self._schedule_tick()
+                    else:
+                        handled_entry_ids.append(entry_id)
+                    continue
+                handled_entry_ids.append(entry_id)
+                if topic and await self._handle_message(topic, value):
+                    return True
+            return False
+        finally:
+            await ActionStreamService.ack(self.session_id, handled_entry_ids)
+
+    def _stage(self, entry_id: str, topic: str, value) -> bool:
+        # Returns False when the entry changes nothing
+        if topic == "client_update":
+            player = self._score(entry_id, value)
+            if player is None:
+                return False
+            self.pending_actions[player["uid"]] = player
+        elif topic == "client_join":
+            # A rejoining player keeps its score
+            uid = value["uid"]
+            player = self.players.get(uid) or new_player(uid, value.get("name"))
+            player["name"] = value.get("name", player["name"])
+            self.players[uid] = player
+            self.pending_actions[uid] = player
+            if uid not in self.clients:
+                self.clients.add(uid)
+                self.pending_leaves.discard(uid)
+                self.pending_joins.add(uid)
+        elif topic == "client_leave":
+            if value not in self.clients:
+                return False
+            self.clients.discard(value)
+            if value in self.pending_joins:
+                self.pending_joins.discard(value)
+            else:
+                self.pending_leaves.add(value)
+        return True
+
+    def _score(self, entry_id: str, action: dict) -> Optional[dict]:
+        # Action data structure {uid, question_index, answer, client_ts},
+        # returns the updated player or None if the action doesn't count
+        uid = action.get("uid")
+        player = self.players.get(uid)
+        if player is None or self.status != "STARTED":
+            return None
+        question_index = action.get("question_index")
+        answered = self.answered.setdefault(uid, set())
+        if question_index in answered:
+            return None
+        correct = self.answers.check(question_index, action.get("answer"))
+        if correct is None:
+            return None
+        # Race time comes from the stream entry id (ms since epoch), not the client
+        received_at = int(entry_id.split("-")[0]) / 1000
+        elapsed = received_at - (self.started_at or received_at)
+        answered.add(question_index)
+        player["answered"] = sorted(answered)
+        apply_answer(player, correct, elapsed, self.bonus, self.penalty)
+        return player
+
+    async def _handle_message(self, topic: str, value) -> bool:
+        if topic == "update_status":
+            self.status = value
+            await self._store_snapshot()
+            if value == "ENDED":
+                await self._finish()
+                return True
+            if value == "STARTED" and self.started_at is None:
+                started_at = await pub.hget(f"settings:{self.session_id}", "started_at")
+                self.started_at = float(started_at) if started_at else time.time()
+            self._schedule_timeout()
+        return False
+
+    def _schedule_tick(self, min_delay: float = 0.0):
+        if self._tick_handle is not None:
+            return
+        loop = asyncio.get_running_loop()
+        interval = self.scheduler.next_interval(len(self.pending_actions))
+        delay = max(min_delay, self._last_tick + interval - loop.time())
+        self._tick_planned_at = loop.time() + delay
+        self._tick_handle = loop.call_later(delay, self.mailbox.put_nowait, (TICK, None))
+
+    def _schedule_timeout(self):
+        if self._timeout_handle is not None:
+            self._timeout_handle.cancel()
+            self._timeout_handle = None
+        if self.status == "CREATED":
+            deadline = self.start_time + CREATED_TIMEOUT
+        elif self.status == "STARTED":
+            deadline = self.start_time + STARTED_TIMEOUT
+        else:
+            return
+        delay = max(0.0, (deadline - datetime.now()).total_seconds())
+        self._timeout_handle = asyncio.get_running_loop().call_later(
+            delay, self.mailbox.put_nowait, (TIMEOUT, None)
+        )
+
+    async def _tick(self):
+        loop = asyncio.get_running_loop()
+        self._last_tick = loop.time()
+        lateness = self._last_tick - self._tick_planned_at if self._tick_planned_at else 0.0
+        self._tick_planned_at = None
+        changed_players, self.pending_actions = self.pending_actions, {}
+        joined, self.pending_joins = self.pending_joins, set()
+        left, self.pending_leaves = self.pending_leaves, set()
+        entry_ids, self.pending_entry_ids = self.pending_entry_ids, []
+        if not changed_players and not joined and not left:
+            await ActionStreamService.ack(self.session_id, entry_ids)
+            return
+        metrics.ENGINE_QUEUE_DEPTH.observe(self.mailbox.qsize())
+        metrics.ENGINE_TICK_BATCH_SIZE.observe(len(entry_ids))
+        # Logic for player actions, joins and leaves (batch), every redis
+        # write of the tick goes out in one round trip
+        seq = self.seq
+        pipe = redis.pipeline(transaction=True)
+        try:
+            self._update_results(pipe, changed_players, joined, left)
+            await ActionStreamService.ack(self.session_id, entry_ids, pipe)
+            # Stats as of the previous tick, the checkpoint writes the latest
+            pipe.hset(f"tick_stats:{self.session_id}", mapping=self.scheduler.stats())
+            await pipe.execute()
+            self._resend_ranking = False
+        except Exception:
+            _logger.exception(f"Failed to update results of session {self.session_id}")
+            # Nothing was written or published, the changes go back in the
+            # queue for the next tick. Nothing was staged in between, the
+            # mailbox is only consumed here.
+            self.seq = seq
+            self.pending_actions = {**changed_players, **self.pending_actions}
+            self.pending_joins |= joined
+            self.pending_leaves |= left
+            self.pending_entry_ids = entry_ids + self.pending_entry_ids
+            self._resend_ranking = True
+            self._schedule_tick(TICK_RETRY_DELAY)
+        # Scores changed in memory either way, the checkpoint saves them
+        self._mark_unsaved(changed_players)
+        duration = loop.time() - self._last_tick
+        metrics.ENGINE_TICK_DURATION.observe(duration)
+        self.scheduler.record(duration, len(changed_players), lateness)
+
+    def _update_results(self, pipe: Pipeline, changed_players: dict, joined: Set[str], left: Set[str]):
+        # Delta frames: only changed players and the ranking slice that moved,
+        # and only who joined or left. Clients apply result frames in seq order
+        # and resync on a gap. Everything is queued on the tick's transaction,
+        # the snapshot before the frames so a client connecting in between
+        # can't miss them.
+        clients_key = f"current_clients:{self.session_id}"
+        if joined:
+            pipe.sadd(clients_key, *joined)
+        if left:
+            pipe.srem(clients_key, *left)
+        delta = {}
+        if changed_players:
+            self.seq += 1
+            delta = LeaderboardService.update(
+                self.session_id, changed_players, self.ranking, self.seq, pipe
+            )
+            if self._resend_ranking:
+                delta.update(offset=0, ranking=self.ranking.uids())
+        self._queue_snapshot(pipe)
+        if delta:
+            queue_publish(pipe, self.session_id, "client_update_result", delta)
+        if joined or left:
+            queue_publish(
+                pipe,
+                self.session_id,
+                "client_update_users",
+                {
+                    "added": list(joined),
+                    "removed": list(left),
+                    "total": len(self.clients),
                 },
-            }
-        ),
-    )
+            )
+
+    async def _store_snapshot(self):
+        pipe = redis.pipeline(transaction=True)
+        self._queue_snapshot(pipe)
+        await pipe.execute()
+
+    def _queue_snapshot(self, pipe: Pipeline):
+        # Built once per change from engine state, instead of once per connect
+        self.snapshot_version += 1
+        value = {
+            "session_status": self.status,
+            "bonus": self.bonus,
+            "penalty": self.penalty,
+            "session_name": self.session_name,
+            "seq": self.seq,
+            "question_pack": self.question_pack,
+            "client_list": list(self.clients),
+            "client_data": self.players,
+            "ranking": self.ranking.uids(),
+        }
+        SnapshotService.queue(pipe, self.session_id, self.snapshot_version, value)
+
+    def _mark_unsaved(self, players: dict):
+        if not players:
+            return
+        self.unsaved.update(players)
+        if self._unsaved_since is None:
+            self._unsaved_since = asyncio.get_running_loop().time()
+        self._schedule_checkpoint()
+
+    def _schedule_checkpoint(self):
+        if self._checkpoint_handle is not None:
+            return
+        self._checkpoint_handle = asyncio.get_running_loop().call_later(
+            self.checkpoint_interval, self.mailbox.put_nowait, (CHECKPOINT, None)
+        )
+
+    def _start_checkpoint(self):
+        # Written in the background so ticks go on, one checkpoint at a time
+        if self._checkpoint_task is not None and not self._checkpoint_task.done():
+            self._schedule_checkpoint()
+            return
+        if self.unsaved:
+            self._checkpoint_task = asyncio.create_task(
+                self._checkpoint(), name=f"session-checkpoint:{self.session_id}"
+            )
+
+    async def _checkpoint(self, final: bool = False):
+        # The final checkpoint raises, the supervisor restarts the engine
+        # which finishes the session again from redis
+        uids, self.unsaved = self.unsaved, set()
+        since, self._unsaved_since = self._unsaved_since, None
+        # Copies, the records keep changing while they are written
+        players = {uid: dict(self.players[uid]) for uid in uids}
+        loop = asyncio.get_running_loop()
+        try:
+            cost = await CheckpointService.write(self.session_id, players)
+        except Exception:
+            self.unsaved |= uids
+            self._unsaved_since = since
+            if final:
+                raise
+            _logger.exception(f"Failed to checkpoint results of session {self.session_id}")
+            self._schedule_checkpoint()
+            return
+        # Lag: how long the oldest change waited to reach MongoDB
+        lag = loop.time() - since if since is not None else 0.0
+        stats = self.checkpoint_stats
+        stats["checkpoints"] += 1
+        stats["last_players"] = cost["players"]
+        stats["last_bytes"] = cost["bytes"]
+        stats["total_bytes"] += cost["bytes"]
+        stats["last_duration"] = round(cost["duration"], 6)
+        stats["max_duration"] = max(stats["max_duration"], stats["last_duration"])
+        stats["last_lag"] = round(lag, 3)
+        stats["max_lag"] = max(stats["max_lag"], stats["last_lag"])
+        await pub.hset(
+            f"tick_stats:{self.session_id}",
+            mapping={
+                **self.scheduler.stats(),
+                **{f"checkpoint_{key}": value for key, value in stats.items()},
+            },
+        )
+
+    async def _end(self):
+        await publish_to_clients(self.session_id, "update_status", "ENDED")
+        update_data = {
+            "session_status": SessionStatus.ENDED,
+            "updated_at": datetime.now(),
+        }
+        await self.session.update({"$set": update_data})
+        await redis.hset(f"settings:{self.session_id}", "status", "ENDED")
+        self.status = "ENDED"
+        await self._store_snapshot()
+        await self._finish()
+
+    async def _finish(self):
+        # Flush pending player actions, then the last checkpoint
+        await self._tick()
+        if self._checkpoint_task is not None:
+            await self._checkpoint_task
+        if self.unsaved:
+            await self._checkpoint(final=True)
+        # Player results are already in session_result, only the ranking is left
+        update_data = {
+            "result": {
+                "ranking": self.ranking.uids(),
+            },
+            "updated_at": datetime.now(),
+        }
+        await self.session.update({"$set": update_data})
+        await publish_to_clients(self.session_id, "close_websocket", "")
+        # Everything is in MongoDB now, redis only serves late readers until the TTL
+        await KeyspaceService.expire_session(self.session_id)
+
+
+async def start_session_in_background(session_id: str, start_time: datetime):
+    await SessionEngine(session_id, start_time).run()
+
+
+async def publish_to_clients(session_id: str, topic: str, value):
+    await redis.publish(f"channel:{session_id}", _broadcast(topic, value))
+
+
+def queue_publish(pipe: Pipeline, session_id: str, topic: str, value):
+    pipe.publish(f"channel:{session_id}", _broadcast(topic, value))
+
+
+def _broadcast(topic: str, value) -> bytes:
+    # Encoded once here in every wire format, subscribers only forward it, see codec.Frame
+    message = codec.encode_broadcast(topic, value)
+    metrics.PUBLISHED_MESSAGES.labels(topic).inc()
+    metrics.PUBLISHED_BYTES.labels(topic).inc(len(message))
+    return message
@@ -0,0 +1,249 @@
+import io
+import re
+import csv
+import shutil
+import logging
+import zipfile
+import tempfile
+from datetime import datetime
+from itertools import islice
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from app.models.question import Question
+from app.dto.question_dto import QuestionPutRequest
+from app.helpers.exceptions import BadRequestException
+from app.helpers.spreadsheet import CSV, XLSX, csv_unsafe, single_sheet, stream_csv, stream_xlsx
+from app.services.library_services import LibraryService
+from app.services.question_pack_services import QuestionPackService
+from app.services.counter_services import Counter, QUESTIONS
+
+_logger = logging.getLogger(__name__)
+
+# Rows parsed per threadpool hop, and questions per insert_many / export read
+BATCH_SIZE = 1000
+# Rows with errors listed in the import report, the others are only counted
+MAX_REPORTED_ERRORS = 100
+# Bytes per read when copying the upload, see _spool
+COPY_CHUNK_SIZE = 1024 * 1024
+CHOICE_HEADER = re.compile(r"^(choice|feedback)_?(\d+)$")
+
+
+def _cell(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _multi(value: Optional[str]):
+    # Several lines in a cell are a list (blanks of a fill in the blank question)
+    if value is None:
+        return None
+    lines = [line.strip() for line in value.splitlines() if line.strip()]
+    return lines[0] if len(lines) == 1 else lines
+
+
+def _header(row) -> dict:
+    # column index -> field, choice_1 / feedback_1 -> (choice | feedback, 1)
+    columns = {}
+    for index, name in enumerate(row):
+        name = re.sub(r"\s+", "_", str(name or "").strip().lower())
+        match = CHOICE_HEADER.match(name)
+        if match:
+            columns[index] = (match.group(1), int(match.group(2)))
+        elif name in ("question", "question_type", "answer"):
+            columns[index] = name
+    if "question" not in columns.values() or "answer" not in columns.values():
+        raise BadRequestException("Header row must have question and answer columns")
+    return columns
+
+
+def _question(columns: dict, row) -> Optional[dict]:
+    # None for blank rows
+    values = {}
+    choices = {}
+    for index, field in columns.items():
+        value = _cell(row[index]) if index < len(row) else None
+        if value is None:
+            continue
+        if isinstance(field, tuple):
+            choices.setdefault(field[1], {})[field[0]] = value
+        else:
+            values[field] = value
+    if not values and not choices:
+        return None
+    question = {
+        "question": _multi(values.get("question")),
+        "answer": _multi(values.get("answer")),
+        "choices": [
+            {"choice": choice["choice"], "feedback": choice.get("feedback")}
+            for _, choice in sorted(choices.items())
+            if "choice" in choice
+        ],
+    }
+    if "question_type" in values:
+        question["question_type"] = values["question_type"]
+    return question
+
+
+def _spool(upload):
+    # UploadFile.file is a SpooledTemporaryFile, which on Python 3.8 has no
+    # readable / seekable for TextIOWrapper and zipfile. Copied in chunks to
+    # a real temporary file, so memory stays flat.
+    file = tempfile.TemporaryFile()
+    upload.seek(0)
+    shutil.copyfileobj(upload, file, COPY_CHUNK_SIZE)
+    file.seek(0)
+    return file
+
+
+def _rows(file, file_format: str) -> Iterator[tuple]:
+    if file_format == XLSX:
+        # Read only: rows are parsed from the zip as they are iterated
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    else:
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            for row in csv.reader(text):
+                yield tuple(csv_unsafe(value) for value in row)
+        finally:
+            text.detach()
+
+
+def _validate_batch(rows: Iterator[tuple], columns: dict, first_row: int) -> Tuple[List[dict], List[dict], int]:
+    # Parses the next BATCH_SIZE rows: (questions, errors, rows read)
+    questions, errors = [], []
+    read = 0
+    for read, row in enumerate(islice(rows, BATCH_SIZE), 1):
+        question = _question(columns, row)
+        if question is None:
+            continue
+        try:
+            questions.append(QuestionPutRequest(**question).dict())
+        except ValidationError as e:
+            errors.append({
+                "row": first_row + read - 1,
+                "errors": [
+                    {"field": ".".join(str(part) for part in error["loc"]), "message": error["msg"]}
+                    for error in e.errors()
+                ],
+            })
+    return questions, errors, read
+
+
+def _export_row(question: dict, choice_count: int) -> list:
+    def joined(value):
+        return "\n".join(value) if isinstance(value, list) else value
+
+    row = [joined(question.get("question")), question.get("question_type"), joined(question.get("answer"))]
+    choices = question.get("choices") or []
+    for index in range(choice_count):
+        choice = choices[index] if index < len(choices) else {}
+        row.extend([choice.get("choice"), choice.get("feedback")])
+    return row
+
+
+class QuestionFileService:
+    """
+    Bulk import / export of the questions of a library as XLSX or CSV.
+
+    One row per question: question, question_type, answer, then choice_N /
+    feedback_N pairs. Lines of a multi-line question or answer cell are a
+    list, as used by fill in the blank questions. Files are parsed and
+    written in batches in the threadpool, so memory stays flat and the
+    event loop is never held by openpyxl for more than one batch.
+    """
+
+    @staticmethod
+    async def import_questions(user_id: str, library_id: str, file, file_format: str) -> dict:
+        await LibraryService.get_library_by_id(user_id, library_id)
+        file = await run_in_threadpool(_spool, file)
+        rows = _rows(file, file_format)
+        imported = 0
+        failed = 0
+        errors = []
+        # Row numbers as shown by spreadsheet apps, the header is row 1
+        next_row = 1
+        collection = Question.get_motor_collection()
+        try:
+            header = await run_in_threadpool(next, rows, None)
+            if header is None:
+                raise BadRequestException("File is empty")
+            columns = _header(header)
+            next_row = 2
+            while True:
+                questions, batch_errors, read = await run_in_threadpool(
+                    _validate_batch, rows, columns, next_row
+                )
+                next_row += read
+                failed += len(batch_errors)
+                errors.extend(batch_errors[:MAX_REPORTED_ERRORS - len(errors)])
+                if questions:
+                    now = datetime.now()
+                    for question in questions:
+                        question["question_type"] = question["question_type"].value
+                        question.update(
+                            user_id=PydanticObjectId(user_id),
+                            library_id=PydanticObjectId(library_id),
+                            created_at=now,
+                            updated_at=now,
+                        )
+                    await collection.insert_many(questions, ordered=False)
+                    imported += len(questions)
+                if read < BATCH_SIZE:
+                    break
+        except (ValueError, KeyError, csv.Error, zipfile.BadZipFile, InvalidFileException) as e:
+            raise BadRequestException(f"Could not read the file at row {next_row}: {e}")
+        finally:
+            rows.close()
+            file.close()
+            if imported:
+                await Counter(user_id, QUESTIONS, library_id).increment(imported)
+                await QuestionPackService.invalidate(library_id)
+        _logger.info(f"Imported {imported} questions into library {library_id}, {failed} rows failed")
+        return {"imported": imported, "failed": failed, "errors": errors}
+
+    @staticmethod
+    async def export_questions(user_id: str, library_id: str, file_format: str) -> AsyncIterator[bytes]:
+        # Checked before the response starts, errors can't be sent once it streams
+        await LibraryService.get_library_by_id(user_id, library_id)
+        query = {"user_id": PydanticObjectId(user_id), "library_id": PydanticObjectId(library_id)}
+        sizes = await Question.get_motor_collection().aggregate([
+            {"$match": query},
+            {"$group": {"_id": None, "choices": {"$max": {"$size": {"$ifNull": ["$choices", []]}}}}},
+        ]).to_list(1)
+        choice_count = sizes[0]["choices"] if sizes else 0
+        header = ["question", "question_type", "answer"]
+        for index in range(1, choice_count + 1):
+            header.extend([f"choice_{index}", f"feedback_{index}"])
+        rows = _export_batches(query, choice_count)
+        if file_format == CSV:
+            return stream_csv(header, rows)
+        return stream_xlsx(single_sheet("questions", header, rows))
+
+
+async def _question_batches(query: dict) -> AsyncIterator[List[dict]]:
+    cursor = Question.get_motor_collection().find(query).sort("_id", 1).batch_size(BATCH_SIZE)
+    batch = []
+    async for question in cursor:
+        batch.append(question)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _export_batches(query: dict, choice_count: int) -> AsyncIterator[List[list]]:
+    async for batch in _question_batches(query):
+        yield [_export_row(question, choice_count) for question in batch]
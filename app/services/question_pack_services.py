@@ -0,0 +1,152 @@
+import gzip
+import hmac
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+from beanie import PydanticObjectId
+
+from app.database import redis
+from app.models.question import Question
+from app.dto.question_dto import QuestionPackItem, QuestionPutRequest
+from app.helpers.exceptions import NotFoundException
+from app.settings.app_settings import AppSettings
+
+_logger = logging.getLogger(__name__)
+
+# Packs are immutable, a pack nobody asked for in a day is rebuilt on demand
+PACK_TTL = 24 * 60 * 60
+# Decoded packs kept in process memory, keyed by their hash
+LOCAL_CACHE_SIZE = 32
+
+# Points the library to the pack only if no question write bumped its
+# generation since the build read the questions, see QuestionPackService.build
+SET_LIBRARY_PACK_SCRIPT = """
+if (redis.call("get", KEYS[2]) or "") == ARGV[1] then
+    return redis.call("set", KEYS[1], ARGV[2], "EX", ARGV[3])
+end
+return 0
+"""
+
+_local_packs: "OrderedDict[str, List[dict]]" = OrderedDict()
+_set_library_pack = redis.register_script(SET_LIBRARY_PACK_SCRIPT)
+
+
+def _dumps(questions: List[dict]) -> bytes:
+    return json.dumps(questions, sort_keys=True, separators=(",", ":")).encode()
+
+
+class QuestionPackService:
+    """
+    The questions of a library, serialized once and gzipped under a key
+    derived from their content (question_pack:{hash}). Sessions only keep
+    the hash, so sessions on the same library share one copy, and clients
+    fetch the pack over HTTP where it is cached by ETag instead of receiving
+    it in every websocket snapshot.
+
+    The public pack has no answers, the engine checks them against the full
+    questions kept under question_pack:{hash}:full. The hash is keyed with
+    the internal token, a plain hash of the full questions could be brute
+    forced back into the answers of a small multiple choice library.
+
+    library_pack:{library_id} points to the current pack of a library and is
+    dropped by every question write, packs already referenced by running
+    sessions stay valid until they expire.
+    """
+
+    @staticmethod
+    def pack_key(pack_hash: str) -> str:
+        return f"question_pack:{pack_hash}"
+
+    @staticmethod
+    def full_pack_key(pack_hash: str) -> str:
+        return f"question_pack:{pack_hash}:full"
+
+    @staticmethod
+    def library_key(library_id: str) -> str:
+        return f"library_pack:{library_id}"
+
+    @staticmethod
+    def generation_key(library_id: str) -> str:
+        return f"library_pack_generation:{library_id}"
+
+    @staticmethod
+    async def get_pack_hash(library_id: str) -> str:
+        pack_hash = await redis.get(QuestionPackService.library_key(library_id))
+        if pack_hash:
+            pack_hash = pack_hash.decode()
+            pipe = redis.pipeline(transaction=False)
+            pipe.expire(QuestionPackService.pack_key(pack_hash), PACK_TTL)
+            pipe.expire(QuestionPackService.full_pack_key(pack_hash), PACK_TTL)
+            if all(await pipe.execute()):
+                return pack_hash
+        return await QuestionPackService.build(library_id)
+
+    @staticmethod
+    async def build(library_id: str) -> str:
+        # Read before the questions, a write landing in between makes the
+        # pointer update below a no-op instead of pointing to stale questions
+        generation = await redis.get(QuestionPackService.generation_key(library_id))
+        question_list = (
+            await Question.find({"library_id": PydanticObjectId(library_id)})
+            .sort(+Question.id)
+            .project(QuestionPutRequest)
+            .to_list()
+        )
+        questions = [question.dict() for question in question_list]
+        full_body = _dumps(questions)
+        public_body = _dumps([QuestionPackItem(**question).dict() for question in questions])
+        secret = (AppSettings().internal_token or "").encode()
+        pack_hash = hmac.new(secret, full_body, hashlib.sha256).hexdigest()[:32]
+        # mtime=0 so the same questions always give the same bytes
+        pipe = redis.pipeline(transaction=True)
+        pipe.set(QuestionPackService.pack_key(pack_hash), gzip.compress(public_body, mtime=0), ex=PACK_TTL)
+        pipe.set(QuestionPackService.full_pack_key(pack_hash), gzip.compress(full_body, mtime=0), ex=PACK_TTL)
+        await pipe.execute()
+        await _set_library_pack(
+            keys=[QuestionPackService.library_key(library_id), QuestionPackService.generation_key(library_id)],
+            args=[generation or b"", pack_hash, PACK_TTL],
+        )
+        _remember(pack_hash, questions)
+        _logger.info(f"Question pack {pack_hash} built for library {library_id}")
+        return pack_hash
+
+    @staticmethod
+    async def get_compressed(pack_hash: str) -> bytes:
+        # The public pack, safe to hand to players
+        data = await redis.get(QuestionPackService.pack_key(pack_hash))
+        if data is None:
+            raise NotFoundException("Question pack not found")
+        return data
+
+    @staticmethod
+    async def get_questions(pack_hash: str) -> List[dict]:
+        # Full questions with their answers, for the engine only
+        questions = _local_packs.get(pack_hash)
+        if questions is not None:
+            _local_packs.move_to_end(pack_hash)
+            return questions
+        data = await redis.get(QuestionPackService.full_pack_key(pack_hash))
+        if data is None:
+            raise NotFoundException("Question pack not found")
+        questions = json.loads(gzip.decompress(data))
+        _remember(pack_hash, questions)
+        return questions
+
+    @staticmethod
+    async def invalidate(library_id: Optional[str]):
+        if library_id:
+            pipe = redis.pipeline(transaction=True)
+            pipe.incr(QuestionPackService.generation_key(str(library_id)))
+            pipe.expire(QuestionPackService.generation_key(str(library_id)), PACK_TTL)
+            pipe.delete(QuestionPackService.library_key(str(library_id)))
+            await pipe.execute()
+
+
+def _remember(pack_hash: str, questions: List[dict]):
+    _local_packs[pack_hash] = questions
+    _local_packs.move_to_end(pack_hash)
+    while len(_local_packs) > LOCAL_CACHE_SIZE:
+        _local_packs.popitem(last=False)
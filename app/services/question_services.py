@@ -1,24 +1,23 @@
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime
 from beanie import PydanticObjectId
 
 from app.models.library import Library
 from app.models.question import Question
 from app.dto.question_dto import QuestionResponseData
+from app.helpers.pagination import paginate
 from app.helpers.exceptions import NotFoundException, BadRequestException
+from app.services.question_pack_services import QuestionPackService
+from app.services.counter_services import Counter, QUESTIONS
 
 _logger = logging.getLogger(__name__)
 
 
 class QuestionService:
     @staticmethod
-    async def list_questions(user_id: str, library_id: str, page: int, limit: int) -> List[QuestionResponseData]:
-        skip = limit * (page - 1)
-        query = Question.find({"user_id": PydanticObjectId(user_id), "library_id": PydanticObjectId(library_id)})
-        total = await query.count()
-        questions = await query.skip(skip).limit(limit).sort(-Question.id).project(QuestionResponseData).to_list()
-        return questions, total
+    async def list_questions(user_id: str, library_id: str, page: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[QuestionResponseData], Optional[int], Optional[str]]:
+        return await paginate(Question, {"user_id": PydanticObjectId(user_id), "library_id": PydanticObjectId(library_id)}, QuestionResponseData, page, limit, cursor, Counter(user_id, QUESTIONS, library_id))
     
     @staticmethod
     async def get_question_by_id(user_id: str, question_id: str) -> QuestionResponseData:
@@ -38,6 +37,8 @@ class QuestionService:
             await question.save()
         except Exception:
             raise BadRequestException("Unknown error")
+        await Counter(user_id, QUESTIONS, library_id).increment()
+        await QuestionPackService.invalidate(library_id)
         _logger.info(f"New question created: {question.question}")
 
     @staticmethod
@@ -54,6 +55,8 @@ class QuestionService:
             await copied_question.save()
         except Exception:
             raise BadRequestException("Unknown error")
+        await Counter(user_id, QUESTIONS, copied_question.library_id).increment()
+        await QuestionPackService.invalidate(copied_question.library_id)
         _logger.info(f"New question created: {copied_question.question}")
         return copied_question
 
@@ -64,6 +67,7 @@ class QuestionService:
             raise NotFoundException("Question not found")
         update_data.update(updated_at=datetime.now())
         await  question.update({"$set": update_data})
+        await QuestionPackService.invalidate(question.library_id)
         return QuestionResponseData(**question.dict(), _id=question.id)
     
     @staticmethod
@@ -72,4 +76,6 @@ class QuestionService:
         if not question:
             raise NotFoundException("Question not found")
         await question.delete()
+        await Counter(user_id, QUESTIONS, question.library_id).increment(-1)
+        await QuestionPackService.invalidate(question.library_id)
         _logger.info(f"Question deleted: {question.question}")
\ No newline at end of file
@@ -0,0 +1,124 @@
+import re
+import logging
+import unicodedata
+from typing import Callable, List, Optional, Union
+
+from app.models.question import QuestionType
+
+_logger = logging.getLogger(__name__)
+
+# Fill in the blank answers at least this long accept one typo
+TYPO_MIN_LENGTH = 6
+
+_SPACES = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " .,;:!?\"'()[]{}"
+
+
+def normalize(text) -> str:
+    # Case, accents, surrounding punctuation and repeated spaces don't matter
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _SPACES.sub(" ", text.casefold())
+    return text.strip(_EDGE_PUNCTUATION)
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    for index in range(len(a)):
+        if a[index] != b[index]:
+            if len(a) == len(b):
+                return a[index + 1:] == b[index + 1:]
+            return a[index:] == b[index + 1:]
+    return True
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def compile_multiple_choice(answer: Union[str, List[str]]) -> Callable:
+    # Every correct choice has to be picked, nothing else
+    correct = frozenset(normalize(choice) for choice in _as_list(answer))
+
+    def match(submitted) -> bool:
+        return frozenset(normalize(choice) for choice in _as_list(submitted)) == correct
+
+    return match
+
+
+def compile_fill_in_the_blank(answer: Union[str, List[str]]) -> Callable:
+    # One expected answer per blank, compared after normalization
+    blanks = [normalize(blank) for blank in _as_list(answer)]
+
+    def match(submitted) -> bool:
+        submitted = [normalize(blank) for blank in _as_list(submitted)]
+        if len(submitted) != len(blanks):
+            return False
+        for expected, given in zip(blanks, submitted):
+            if expected == given:
+                continue
+            if len(expected) < TYPO_MIN_LENGTH or not within_one_edit(expected, given):
+                return False
+        return True
+
+    return match
+
+
+class AnswerIndex:
+    """
+    Answer matchers of every question of a session, compiled once when the
+    engine loads the questions so scoring a submission is a list lookup
+    plus a set comparison.
+    """
+
+    def __init__(self, questions: List[dict]):
+        self.matchers = [self._compile(question) for question in questions]
+
+    @staticmethod
+    def _compile(question: dict) -> Callable:
+        if QuestionType(question.get("question_type", QuestionType.MULTIPLE)) == QuestionType.FILL:
+            return compile_fill_in_the_blank(question["answer"])
+        return compile_multiple_choice(question["answer"])
+
+    def __len__(self):
+        return len(self.matchers)
+
+    def check(self, question_index, answer) -> Optional[bool]:
+        # None when the question doesn't exist
+        if not isinstance(question_index, int) or not 0 <= question_index < len(self.matchers):
+            return None
+        return self.matchers[question_index](answer)
+
+
+def new_player(uid: str, name: Optional[str]) -> dict:
+    return {
+        "uid": uid,
+        "name": name,
+        "point": 0,
+        "time": 0.0,
+        "correct": 0,
+        "wrong": 0,
+        "answered": [],
+    }
+
+
+def apply_answer(player: dict, correct: bool, elapsed: float, bonus: float, penalty: float):
+    """
+    One point per correct answer. Time is the race time of the last answer,
+    minus bonus_time_setting for every correct and plus penalty_time_setting
+    for every wrong answer so far.
+    """
+    if correct:
+        player["correct"] += 1
+        player["point"] = player["correct"]
+    else:
+        player["wrong"] += 1
+    adjusted = elapsed - player["correct"] * bonus + player["wrong"] * penalty
+    player["time"] = round(max(adjusted, 0.0), 3)
@@ -0,0 +1,146 @@
+import logging
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from beanie import PydanticObjectId
+
+from app.models.car_race import CarRace
+from app.models.car_race_session import CarRaceSession
+from app.models.session_result import SessionResult
+from app.helpers.exceptions import BadRequestException, NotFoundException
+from app.helpers.spreadsheet import CSV, single_sheet, stream_csv, stream_xlsx
+
+_logger = logging.getLogger(__name__)
+
+# Players read per cursor batch / threadpool hop
+BATCH_SIZE = 1000
+# Sessions in one car race export, one sheet each
+MAX_EXPORT_SESSIONS = 100
+RESULT_HEADER = ["rank", "uid", "name", "point", "time", "correct", "wrong", "answered"]
+# Same order as the live ranking: point desc, time asc, then uid desc on
+# equal scores, see leaderboard_services.Ranking. Served by the
+# session_result rank index.
+RANK_SORT = [("point", -1), ("time", 1), ("uid", -1)]
+
+
+def _row(rank: int, uid: str, player: dict) -> list:
+    return [
+        rank,
+        uid,
+        player.get("name"),
+        player.get("point", 0),
+        player.get("time", 0.0),
+        player.get("correct", 0),
+        player.get("wrong", 0),
+        len(player.get("answered") or []),
+    ]
+
+
+async def _result_batches(session_id: PydanticObjectId) -> AsyncIterator[List[list]]:
+    cursor = SessionResult.get_motor_collection().find(
+        {"session_id": session_id},
+        {"_id": 0, "uid": 1, "name": 1, "point": 1, "time": 1, "correct": 1, "wrong": 1, "answered": 1},
+    ).sort(RANK_SORT).batch_size(BATCH_SIZE)
+    rank = 0
+    batch = []
+    async for player in cursor:
+        rank += 1
+        batch.append(_row(rank, player["uid"], player))
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    elif not rank:
+        rows = await _embedded_rows(session_id)
+        for start in range(0, len(rows), BATCH_SIZE):
+            yield rows[start:start + BATCH_SIZE]
+
+
+async def _embedded_rows(session_id: PydanticObjectId) -> List[list]:
+    # Sessions ended before session_result keep {uid: player} results and
+    # their ranking in CarRaceSession.result, like attach_results reads them
+    session = await CarRaceSession.get_motor_collection().find_one(
+        {"_id": session_id}, {"result": 1}
+    )
+    result = (session or {}).get("result") or {}
+    players = result.get("results") or {}
+    ranking = [uid for uid in result.get("ranking") or [] if uid in players]
+    # Players missing from the ranking go last, in ranking order
+    ranked = set(ranking)
+    ranking += sorted(
+        (uid for uid in players if uid not in ranked),
+        key=lambda uid: (-(players[uid].get("point") or 0), players[uid].get("time") or 0.0),
+    )
+    return [_row(rank, uid, players[uid]) for rank, uid in enumerate(ranking, 1)]
+
+
+async def _sheets(sessions: List[dict]):
+    for session in sessions:
+        yield session["car_race_session_name"], RESULT_HEADER, _result_batches(session["_id"])
+
+
+async def _csv_batches(sessions: List[dict]) -> AsyncIterator[List[list]]:
+    # All sessions in one table, each row prefixed by its session
+    for session in sessions:
+        prefix = [str(session["_id"]), session["car_race_session_name"]]
+        async for batch in _result_batches(session["_id"]):
+            yield [prefix + row for row in batch]
+
+
+class SessionExportService:
+    """
+    Ranking and per-player results of sessions as XLSX or CSV, read from
+    session_result in rank order and streamed out batch by batch, so memory
+    stays flat whatever the number of players. Results are the last
+    checkpoint of the session, a running session may lag by one interval.
+    """
+
+    @staticmethod
+    async def export_session(user_id: str, session_id: str, file_format: str) -> AsyncIterator[bytes]:
+        # Checked before the response starts, errors can't be sent once it streams
+        session = await CarRaceSession.get_motor_collection().find_one(
+            {"user_id": PydanticObjectId(user_id), "_id": PydanticObjectId(session_id)},
+            {"car_race_session_name": 1},
+        )
+        if not session:
+            raise NotFoundException("Session not found")
+        rows = _result_batches(session["_id"])
+        if file_format == CSV:
+            return stream_csv(RESULT_HEADER, rows)
+        return stream_xlsx(single_sheet(session["car_race_session_name"], RESULT_HEADER, rows))
+
+    @staticmethod
+    async def export_car_race(
+        user_id: str,
+        car_race_id: str,
+        file_format: str,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+    ) -> AsyncIterator[bytes]:
+        # Sessions of one car race created in [created_from, created_to], oldest first
+        car_race = await CarRace.get_motor_collection().find_one(
+            {"user_id": PydanticObjectId(user_id), "_id": PydanticObjectId(car_race_id)},
+            {"_id": 1},
+        )
+        if not car_race:
+            raise NotFoundException("Car race not found")
+        query = {"user_id": PydanticObjectId(user_id), "car_race_id": car_race["_id"]}
+        created_at = {}
+        if created_from:
+            created_at["$gte"] = created_from
+        if created_to:
+            created_at["$lte"] = created_to
+        if created_at:
+            query["created_at"] = created_at
+        sessions = await CarRaceSession.get_motor_collection().find(
+            query, {"car_race_session_name": 1}
+        ).sort("_id", 1).limit(MAX_EXPORT_SESSIONS + 1).to_list(None)
+        if not sessions:
+            raise NotFoundException("No session found")
+        if len(sessions) > MAX_EXPORT_SESSIONS:
+            raise BadRequestException(f"More than {MAX_EXPORT_SESSIONS} sessions, narrow the date range")
+        _logger.info(f"Exporting {len(sessions)} sessions of car race {car_race_id}")
+        if file_format == CSV:
+            return stream_csv(["session_id", "session_name"] + RESULT_HEADER, _csv_batches(sessions))
+        return stream_xlsx(_sheets(sessions))
@@ -1,14 +1,16 @@
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime
 from beanie import PydanticObjectId
 from pymongo.errors import DuplicateKeyError
-from fastapi import BackgroundTasks
 
-from app.services.live_session_services import start_session_in_background
+from app.services.session_supervisor_services import session_supervisor
+from app.services.checkpoint_services import CheckpointService
+from app.services.counter_services import Counter, SESSIONS
 from app.models.car_race_session import CarRaceSession, SessionStatus
 from app.models.car_race import CarRace
 from app.dto.session_dto import SessionFullResponseData, SessionShortResponseData
+from app.helpers.pagination import paginate
 from app.helpers.exceptions import NotFoundException, BadRequestException
 
 _logger = logging.getLogger(__name__)
@@ -16,12 +18,8 @@ _logger = logging.getLogger(__name__)
 
 class SessionService:
     @staticmethod
-    async def list_sessions(user_id: str, page: int, limit: int) -> List[SessionShortResponseData]:
-        skip = limit * (page - 1)
-        query = CarRaceSession.find({"user_id": PydanticObjectId(user_id)})
-        total = await query.count()
-        car_races = await query.skip(skip).limit(limit).sort(-CarRaceSession.id).project(SessionShortResponseData).to_list()
-        return car_races, total
+    async def list_sessions(user_id: str, page: int, limit: int, cursor: Optional[str] = None) -> Tuple[List[SessionShortResponseData], Optional[int], Optional[str]]:
+        return await paginate(CarRaceSession, {"user_id": PydanticObjectId(user_id)}, SessionShortResponseData, page, limit, cursor, Counter(user_id, SESSIONS))
     
     @staticmethod
     async def get_session_by_id(user_id: str, session_id: str) -> SessionFullResponseData:
@@ -29,10 +27,11 @@ class SessionService:
         session = await query.project(SessionFullResponseData)
         if not session:
             raise NotFoundException("Session not found")
+        await CheckpointService.attach_results(session_id, session.result)
         return session
     
     @staticmethod
-    async def create(user_id: str, new_session: dict, background_tasks: BackgroundTasks):
+    async def create(user_id: str, new_session: dict):
         car_race_id = PydanticObjectId(new_session["car_race_id"])
         car_race = await CarRace.find_one({"user_id": PydanticObjectId(user_id), "_id": car_race_id})
         if not car_race:
@@ -43,8 +42,9 @@ class SessionService:
             new_session = await session.save()
         except DuplicateKeyError:
             raise BadRequestException("Session name existed")
+        await Counter(user_id, SESSIONS).increment()
         _logger.info(f"New session created: {session.car_race_session_name}")
-        background_tasks.add_task(start_session_in_background, new_session.id, datetime.now())
+        await session_supervisor.submit(str(new_session.id), datetime.now())
 
     @staticmethod
     async def put(user_id: str, session_id: str, update_data: dict) -> SessionFullResponseData:
@@ -64,4 +64,9 @@ class SessionService:
         if not session:
             raise NotFoundException("Session not found")
         await session.delete()
+        await Counter(user_id, SESSIONS).increment(-1)
+        # Stops its engine and lets its redis keys expire
+        await session_supervisor.forget(session_id)
+        # After the engine is stopped, its checkpoints would write them back
+        await CheckpointService.delete(session_id)
         _logger.info(f"Session deleted: {session.car_race_session_name}")
\ No newline at end of file
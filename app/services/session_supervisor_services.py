@@ -0,0 +1,265 @@
+import os
+import math
+import time
+import uuid
+import random
+import socket
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+from datetime import datetime
+
+from beanie import PydanticObjectId
+
+from app.database import pub
+from app.settings.app_settings import AppSettings
+from app.models.car_race_session import CarRaceSession, SessionStatus
+from app.services.live_session_services import start_session_in_background
+from app.services.keyspace_services import KeyspaceService
+from app.services.counter_services import CounterService
+
+_logger = logging.getLogger(__name__)
+
+# session_id -> start time (iso) of every session that still needs an engine
+ACTIVE_SESSIONS_KEY = "sessions:active"
+# session_id -> engine crashes so far, and unix time before which it isn't restarted
+ENGINE_FAILURES_KEY = "sessions:failures"
+RETRY_AT_KEY = "sessions:retry_at"
+# Crashes before a session is given up and ended, the restart delay doubles
+# after every crash up to MAX_RESTART_BACKOFF seconds
+MAX_ENGINE_FAILURES = 5
+RESTART_BACKOFF = 5
+MAX_RESTART_BACKOFF = 300
+# worker_id -> last heartbeat (unix time)
+WORKERS_KEY = "sessions:workers"
+# Held by the worker sweeping the keyspace, so only one does per interval
+SWEEP_LOCK_KEY = "sessions:sweep_lock"
+# Same for the reconciliation of the list counters
+RECONCILE_LOCK_KEY = "counters:reconcile_lock"
+
+RENEW_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SessionSupervisor:
+    """
+    Runs session engines on whichever worker holds the session lease.
+
+    Every worker heartbeats into WORKERS_KEY and renews the leases of the
+    engines it runs. A session whose lease expired (its worker died or got
+    stuck) is claimed by another worker under its fair share of the active
+    sessions, and the engine resumes from the redis state of the session.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = AppSettings().session_lease_ttl
+        self.sweep_interval = AppSettings().keyspace_sweep_interval
+        self._next_sweep = 0.0
+        self.reconcile_interval = AppSettings().counter_reconcile_interval
+        self._next_reconcile = time.time() + self.reconcile_interval
+        self.engines: Dict[str, asyncio.Task] = {}
+        self._supervisor_task: Optional[asyncio.Task] = None
+        self._renew_lease = pub.register_script(RENEW_LEASE_SCRIPT)
+        self._release_lease = pub.register_script(RELEASE_LEASE_SCRIPT)
+
+    @staticmethod
+    def lease_key(session_id: str) -> str:
+        return f"lease:{session_id}"
+
+    async def start(self):
+        if self._supervisor_task is None:
+            self._supervisor_task = asyncio.create_task(
+                self._supervise(), name="session-supervisor"
+            )
+            _logger.info(f"Session supervisor started on worker {self.worker_id}")
+
+    async def stop(self):
+        # Leases are released but sessions stay active so other workers take over
+        if self._supervisor_task is not None:
+            self._supervisor_task.cancel()
+            self._supervisor_task = None
+        engines = list(self.engines.values())
+        for task in engines:
+            task.cancel()
+        await asyncio.gather(*engines, return_exceptions=True)
+        await pub.zrem(WORKERS_KEY, self.worker_id)
+
+    async def submit(self, session_id: str, start_time: datetime):
+        await pub.hset(ACTIVE_SESSIONS_KEY, session_id, start_time.isoformat())
+        # Run it here right away unless this worker already has its share,
+        # otherwise the next supervisor round of a less busy worker picks it up
+        if len(self.engines) < await self._fair_share():
+            await self._claim(session_id, start_time)
+
+    async def forget(self, session_id: str):
+        # No engine for this session anymore, wherever it runs: the worker
+        # running it fails to renew the deleted lease and cancels it
+        pipe = pub.pipeline(transaction=True)
+        pipe.hdel(ACTIVE_SESSIONS_KEY, session_id)
+        pipe.hdel(ENGINE_FAILURES_KEY, session_id)
+        pipe.hdel(RETRY_AT_KEY, session_id)
+        pipe.delete(self.lease_key(session_id))
+        await pipe.execute()
+        task = self.engines.get(session_id)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        await KeyspaceService.expire_session(session_id)
+
+    async def active_sessions(self) -> Set[str]:
+        return set(await pub.hkeys(ACTIVE_SESSIONS_KEY))
+
+    async def _fair_share(self) -> int:
+        active_count, worker_count = await asyncio.gather(
+            pub.hlen(ACTIVE_SESSIONS_KEY),
+            pub.zcard(WORKERS_KEY),
+        )
+        return math.ceil(active_count / max(worker_count, 1))
+
+    async def _claim(self, session_id: str, start_time: datetime) -> bool:
+        acquired = await pub.set(
+            self.lease_key(session_id),
+            self.worker_id,
+            nx=True,
+            px=int(self.lease_ttl * 1000),
+        )
+        if not acquired:
+            return False
+        _logger.info(f"Worker {self.worker_id} claimed session {session_id}")
+        self.engines[session_id] = asyncio.create_task(
+            self._run_engine(session_id, start_time), name=f"session-engine:{session_id}"
+        )
+        return True
+
+    async def _run_engine(self, session_id: str, start_time: datetime):
+        try:
+            await start_session_in_background(session_id, start_time)
+            # Finished sessions don't need an engine anymore
+            pipe = pub.pipeline(transaction=True)
+            pipe.hdel(ACTIVE_SESSIONS_KEY, session_id)
+            pipe.hdel(ENGINE_FAILURES_KEY, session_id)
+            pipe.hdel(RETRY_AT_KEY, session_id)
+            await pipe.execute()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _logger.exception(f"Engine of session {session_id} crashed, releasing lease")
+            await self._engine_failed(session_id)
+        finally:
+            self.engines.pop(session_id, None)
+            await self._release_lease(
+                keys=[self.lease_key(session_id)], args=[self.worker_id]
+            )
+
+    async def _engine_failed(self, session_id: str):
+        failures = await pub.hincrby(ENGINE_FAILURES_KEY, session_id, 1)
+        if failures >= MAX_ENGINE_FAILURES:
+            # Crashing every time, e.g. its session or car race was deleted
+            _logger.error(f"Engine of session {session_id} crashed {failures} times, ending it")
+            await self.forget(session_id)
+            await CarRaceSession.get_motor_collection().update_one(
+                {"_id": PydanticObjectId(session_id)},
+                {"$set": {"session_status": SessionStatus.ENDED.value, "updated_at": datetime.now()}},
+            )
+            return
+        backoff = min(RESTART_BACKOFF * 2 ** (failures - 1), MAX_RESTART_BACKOFF)
+        await pub.hset(RETRY_AT_KEY, session_id, time.time() + backoff)
+        _logger.warning(f"Engine of session {session_id} restarts in {backoff}s ({failures} crashes)")
+
+    async def _supervise(self):
+        while True:
+            try:
+                await self._heartbeat()
+                await self._renew_leases()
+                await self._claim_orphans()
+                await self._sweep_keyspace()
+                await self._reconcile_counters()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                _logger.exception("Session supervisor round failed")
+            await asyncio.sleep(self.lease_ttl / 3)
+
+    async def _sweep_keyspace(self):
+        if time.time() < self._next_sweep:
+            return
+        self._next_sweep = time.time() + self.sweep_interval
+        locked = await pub.set(
+            SWEEP_LOCK_KEY, self.worker_id, nx=True, ex=int(self.sweep_interval)
+        )
+        if locked:
+            await KeyspaceService.sweep(await self.active_sessions())
+
+    async def _reconcile_counters(self):
+        if time.time() < self._next_reconcile:
+            return
+        self._next_reconcile = time.time() + self.reconcile_interval
+        locked = await pub.set(
+            RECONCILE_LOCK_KEY, self.worker_id, nx=True, ex=int(self.reconcile_interval)
+        )
+        if locked:
+            await CounterService.reconcile()
+
+    async def _heartbeat(self):
+        now = time.time()
+        pipe = pub.pipeline(transaction=False)
+        pipe.zadd(WORKERS_KEY, {self.worker_id: now})
+        # Workers that stopped heartbeating no longer count for the fair share
+        pipe.zremrangebyscore(WORKERS_KEY, 0, now - self.lease_ttl)
+        await pipe.execute()
+
+    async def _renew_leases(self):
+        for session_id, task in list(self.engines.items()):
+            renewed = await self._renew_lease(
+                keys=[self.lease_key(session_id)],
+                args=[self.worker_id, int(self.lease_ttl * 1000)],
+            )
+            if not renewed:
+                # Someone else owns it now, two engines must never run at once
+                _logger.warning(f"Worker {self.worker_id} lost lease of session {session_id}")
+                task.cancel()
+
+    async def _claim_orphans(self):
+        active_sessions, retry_at = await asyncio.gather(
+            pub.hgetall(ACTIVE_SESSIONS_KEY),
+            pub.hgetall(RETRY_AT_KEY),
+        )
+        now = time.time()
+        candidates = [
+            session_id for session_id in active_sessions
+            if session_id not in self.engines
+            # Crashed engines wait for their backoff
+            and float(retry_at.get(session_id, 0)) <= now
+        ]
+        if not candidates:
+            return
+        pipe = pub.pipeline(transaction=False)
+        for session_id in candidates:
+            pipe.exists(self.lease_key(session_id))
+        leased = await pipe.execute()
+        orphans = [
+            session_id for session_id, is_leased in zip(candidates, leased)
+            if not is_leased
+        ]
+        # Shuffle so workers racing for the same orphans spread out
+        random.shuffle(orphans)
+        fair_share = await self._fair_share()
+        for session_id in orphans:
+            if len(self.engines) >= fair_share:
+                break
+            start_time = datetime.fromisoformat(active_sessions[session_id])
+            await self._claim(session_id, start_time)
+
+
+session_supervisor = SessionSupervisor()
@@ -0,0 +1,116 @@
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+from aioredis.client import Pipeline
+
+from app.database import redis
+from app.helpers import codec
+
+_logger = logging.getLogger(__name__)
+
+# Sessions whose latest snapshot is kept in process memory
+LOCAL_CACHE_SIZE = 256
+
+
+class SessionSnapshot:
+    """
+    Session state as of one version, shared by every connection of the
+    process. Frames are encoded once per wire format and only the rank of
+    the receiving guest is added to the encoded bytes.
+    """
+
+    def __init__(self, version: int, data: bytes):
+        self.version = version
+        self.data = data
+        self._value: Optional[dict] = None
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+        self._ranks: Optional[Dict[str, int]] = None
+
+    @property
+    def value(self) -> dict:
+        # Decoded on first use, the engine process rarely needs it
+        if self._value is None:
+            self._value = codec.loads(self.data)
+        return self._value
+
+    @property
+    def ended(self) -> bool:
+        return self.value.get("session_status") == "ENDED"
+
+    def rank_of(self, client_id: str) -> Optional[int]:
+        if self._ranks is None:
+            self._ranks = {uid: rank for rank, uid in enumerate(self.value.get("ranking", []))}
+        return self._ranks.get(client_id)
+
+    def frame(
+        self,
+        wire_format: str = codec.JSON,
+        event: Optional[str] = None,
+        client_id: Optional[str] = None,
+    ) -> Union[str, bytes]:
+        encoded = self._encoded.get(wire_format)
+        if encoded is None:
+            encoded = self._encoded[wire_format] = codec.encode_value(self.value, wire_format)
+        if client_id:
+            encoded = codec.add_field(encoded, "rank", self.rank_of(client_id), wire_format)
+        if event is None:
+            return encoded
+        return codec.wrap_value(event, encoded, wire_format)
+
+
+_local_snapshots: "OrderedDict[str, SessionSnapshot]" = OrderedDict()
+
+
+class SnapshotService:
+    """
+    The session engine stores a snapshot of the whole session whenever its
+    state changes (once per tick at most for player results), as one msgpack
+    blob under snapshot:{session_id} with its version. Connecting
+    clients read the version, and only fetch and decode the blob when the
+    process doesn't hold that version yet.
+    """
+
+    @staticmethod
+    def snapshot_key(session_id: str) -> str:
+        return f"snapshot:{session_id}"
+
+    @staticmethod
+    async def version(session_id: str) -> int:
+        version = await redis.hget(SnapshotService.snapshot_key(session_id), "version")
+        return int(version or 0)
+
+    @staticmethod
+    def queue(pipe: Pipeline, session_id: str, version: int, value: dict):
+        # The engine numbers its snapshots, it is the only writer, and queues
+        # them with the rest of its writes. Remembered right away, get()
+        # checks the version in redis before trusting the local copy.
+        data = codec.dumps(value)
+        pipe.hset(SnapshotService.snapshot_key(session_id), mapping={"version": version, "data": data})
+        _remember(session_id, SessionSnapshot(version, data))
+
+    @staticmethod
+    async def get(session_id: str) -> Optional[SessionSnapshot]:
+        key = SnapshotService.snapshot_key(session_id)
+        version = await redis.hget(key, "version")
+        if version is None:
+            return None
+        snapshot = _local_snapshots.get(session_id)
+        if snapshot is not None and snapshot.version == int(version):
+            _local_snapshots.move_to_end(session_id)
+            return snapshot
+        version, data = await redis.hmget(key, "version", "data")
+        snapshot = SessionSnapshot(int(version), data)
+        _remember(session_id, snapshot)
+        return snapshot
+
+
+def _remember(session_id: str, snapshot: SessionSnapshot):
+    current = _local_snapshots.get(session_id)
+    # A slower reader must not replace a newer snapshot
+    if current is not None and current.version > snapshot.version:
+        return
+    _local_snapshots[session_id] = snapshot
+    _local_snapshots.move_to_end(session_id)
+    while len(_local_snapshots) > LOCAL_CACHE_SIZE:
+        _local_snapshots.popitem(last=False)
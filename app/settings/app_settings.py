@@ -38,3 +38,39 @@ class AppSettings(BaseSettings):
     @property
     def redis_dsn(self):
         return settings.get("REDIS")
+
+    @property
+    def session_lease_ttl(self):
+        return settings.get("SESSION_LEASE_TTL", 15)
+
+    @property
+    def session_checkpoint_interval(self):
+        return settings.get("SESSION_CHECKPOINT_INTERVAL", 10)
+
+    @property
+    def session_ended_key_ttl(self):
+        return settings.get("SESSION_ENDED_KEY_TTL", 300)
+
+    @property
+    def keyspace_sweep_interval(self):
+        return settings.get("KEYSPACE_SWEEP_INTERVAL", 600)
+
+    @property
+    def mongo_slow_query_ms(self):
+        return settings.get("MONGO_SLOW_QUERY_MS", 100)
+
+    @property
+    def mongo_explain_interval(self):
+        return settings.get("MONGO_EXPLAIN_INTERVAL", 300)
+
+    @property
+    def loop_block_threshold_ms(self):
+        return settings.get("LOOP_BLOCK_THRESHOLD_MS", 100)
+
+    @property
+    def counter_reconcile_interval(self):
+        return settings.get("COUNTER_RECONCILE_INTERVAL", 3600)
+
+    @property
+    def internal_token(self):
+        return settings.get("INTERNAL_TOKEN")
@@ -0,0 +1,69 @@
+"""
+Frame size and encode/decode time of live session frames, JSON vs the
+negotiated msgpack format with positional player records.
+
+    python -m benchmarks.frame_codec [--repeat 50]
+"""
+import argparse
+import random
+import string
+import timeit
+
+from app.helpers import codec
+
+PLAYER_COUNTS = (100, 1000, 5000)
+
+
+def make_players(count: int) -> dict:
+    rng = random.Random(count)
+    players = {}
+    for _ in range(count):
+        uid = "".join(rng.choices(string.ascii_lowercase + string.digits, k=20))
+        players[uid] = {
+            "uid": uid,
+            "name": "".join(rng.choices(string.ascii_letters, k=rng.randint(4, 16))),
+            "point": rng.randint(0, 200),
+            "time": round(rng.uniform(0, 3600), 3),
+        }
+    return players
+
+
+def make_frame(players: dict) -> dict:
+    # Full result frame, the worst case every client used to get every tick
+    return {
+        "seq": 1,
+        "offset": 0,
+        "ranking": list(players.keys()),
+        "total": len(players),
+        "data": players,
+    }
+
+
+def bench(count: int, repeat: int) -> list:
+    value = make_frame(make_players(count))
+    rows = []
+    for wire_format in (codec.JSON, codec.MSGPACK):
+        frame = codec.encode_frame("client_update_result", value, wire_format)
+        encode = timeit.timeit(
+            lambda: codec.encode_frame("client_update_result", value, wire_format),
+            number=repeat,
+        ) / repeat
+        decode = timeit.timeit(
+            lambda: codec.decode_frame(frame, wire_format), number=repeat
+        ) / repeat
+        rows.append((count, wire_format, len(frame), encode * 1000, decode * 1000))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    print(f"{'players':>8} {'format':>8} {'bytes':>10} {'encode ms':>10} {'decode ms':>10}")
+    for count in PLAYER_COUNTS:
+        for row in bench(count, args.repeat):
+            print("{:>8} {:>8} {:>10} {:>10.3f} {:>10.3f}".format(*row))
+
+
+if __name__ == "__main__":
+    main()
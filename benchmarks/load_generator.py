@@ -0,0 +1,391 @@
+"""
+Synthetic live session load: one host and N guest websockets answering at a
+fixed rate, reporting action -> ranking broadcast latency percentiles,
+dropped / late frames and server CPU.
+
+    python -m benchmarks.load_generator --players 200 --rate 1 --duration 60
+
+Runs against a server started beforehand (--url, use --server-pid to get
+its CPU usage), or starts one with --serve on --redis-dsn / --mongo-dsn,
+localhost by default (`make dev` brings both up). It signs up a
+load test account, then creates a library with questions, a car race and
+a session through the REST API.
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+from app.helpers import codec
+
+API_PREFIX = "/api/v1"
+PASSWORD = "loadtest-password"
+# config/settings.toml points at the docker-compose hostnames, --serve runs
+# on the host where the compose ports are published on localhost
+DEFAULT_REDIS_DSN = "redis://localhost:6379/0"
+DEFAULT_MONGO_DSN = "mongodb://localhost:27017/KnowledgeKartDB"
+# Seconds to wait for the session engine to publish the first snapshot
+SESSION_READY_TIMEOUT = 30
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.actions_sent = 0
+        self.late_answers = 0
+        self.seq_gaps = 0
+        self.resyncs = 0
+        self.frames = 0
+        self.frame_bytes = 0
+        self.slow_disconnects = 0
+        self.connect_failures = 0
+        self.unanswered = 0
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class ServerCpu:
+    # utime + stime of a local server process, from /proc (Linux only)
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.started_cpu = self.started_wall = None
+
+    def _cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat") as stat:
+                fields = stat.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, IndexError, ValueError, TypeError):
+            return None
+
+    def start(self):
+        self.started_cpu, self.started_wall = self._cpu_seconds(), time.monotonic()
+
+    def report(self) -> str:
+        cpu = self._cpu_seconds()
+        if cpu is None or self.started_cpu is None:
+            return "n/a (pass --server-pid or --serve)"
+        used = cpu - self.started_cpu
+        return f"{used:.2f}s ({100 * used / (time.monotonic() - self.started_wall):.1f}% of one core)"
+
+
+class Api:
+    def __init__(self, base_url: str):
+        self.client = httpx.AsyncClient(base_url=base_url + API_PREFIX, timeout=30)
+
+    async def login(self, email: str):
+        await self.client.post(
+            "/account/signup",
+            json={"user_name": email.split("@")[0], "email": email, "password": PASSWORD},
+        )
+        response = await self.client.post("/account/login", json={"email": email, "password": PASSWORD})
+        token = response.json()["data"]["access_token"]
+        self.client.headers["Authorization"] = f"Bearer {token}"
+
+    async def create(self, kind: str, name_field: str, name: str, payload: dict, **params) -> str:
+        # Create endpoints don't return the new id, it is looked up by its unique name
+        response = await self.client.post(f"/{kind}/create", json={name_field: name, **payload}, params=params)
+        response.raise_for_status()
+        response = await self.client.get(f"/{kind}/list", params={"page": 1, "limit": 50})
+        for item in response.json()["data"]["items"]:
+            if item[name_field] == name:
+                return item.get("_id") or item.get("id")
+        raise RuntimeError(f"Created {kind} {name} not found")
+
+    async def setup_session(self, run_id: str, question_count: int, args) -> str:
+        library_id = await self.create("library", "library_name", f"loadtest-{run_id}", {})
+        for index in range(question_count):
+            response = await self.client.post(
+                "/question/create",
+                params={"library_id": library_id},
+                json={
+                    "question": f"Load test question {index}",
+                    "question_type": "MULTIPLECHOICE",
+                    "choices": [{"choice": choice} for choice in "ABCD"],
+                    "answer": ["A"],
+                },
+            )
+            response.raise_for_status()
+        car_race_id = await self.create(
+            "car_race",
+            "car_race_name",
+            f"loadtest-{run_id}",
+            {
+                "library_id": library_id,
+                "bonus_time_setting": 1,
+                "penalty_time_setting": 2,
+                "min_tick_interval": args.min_tick_interval,
+                "max_tick_interval": args.max_tick_interval,
+            },
+        )
+        return await self.create(
+            "session_management",
+            "car_race_session_name",
+            f"loadtest-{run_id}",
+            {"car_race_id": car_race_id},
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def frame_of(message, wire_format: str):
+    # (event, value) of a server frame, event None for the first snapshot
+    if wire_format == codec.MSGPACK:
+        # Not decode_frame, which reads lists as client player records
+        payload = codec.loads(message)
+        if isinstance(payload, list):
+            return payload[0], payload[1]
+        return None, payload
+    payload = codec.decode_frame(message, wire_format)
+    if isinstance(payload, dict) and "event" in payload:
+        return payload["event"], payload.get("value")
+    return None, payload
+
+
+def players_of(value) -> Dict[str, dict]:
+    data = (value or {}).get("data") or {}
+    if isinstance(data, list):
+        return {player["uid"]: player for player in map(codec.unpack_player, data)}
+    return data
+
+
+class Bot:
+    def __init__(self, index: int, session_url: str, stats: Stats, args):
+        self.uid = f"bot-{index}-{uuid.uuid4().hex[:6]}"
+        self.url = f"{session_url}/ws_guest/{{session_id}}/{self.uid}"
+        self.stats = stats
+        self.args = args
+        self.wire_format = codec.MSGPACK if args.msgpack else codec.JSON
+        self.sent_at: Dict[int, float] = {}
+        self.last_seq: Optional[int] = None
+        self.websocket = None
+
+    async def connect(self, session_id: str):
+        subprotocols = ["knowledgekart.msgpack.v1"] if self.args.msgpack else None
+        self.websocket = await websockets.connect(
+            self.url.format(session_id=session_id), subprotocols=subprotocols, max_size=None
+        )
+        _, snapshot = frame_of(await self.websocket.recv(), self.wire_format)
+        self.last_seq = snapshot.get("seq")
+        await self.send({"name": self.uid})
+
+    async def send(self, message: dict):
+        if self.wire_format == codec.MSGPACK:
+            await self.websocket.send(codec.dumps(message))
+        else:
+            await self.websocket.send(codec.encode_value(message))
+
+    async def answer(self, question_count: int, stop_at: float):
+        rng = random.Random(self.uid)
+        # Spread the first answers over one interval so bots don't answer in lockstep
+        await asyncio.sleep(rng.uniform(0, 1 / self.args.rate))
+        for question_index in range(question_count):
+            if time.monotonic() >= stop_at:
+                break
+            correct = rng.random() < self.args.accuracy
+            self.sent_at[question_index] = time.monotonic()
+            await self.send({
+                "question_index": question_index,
+                "answer": ["A"] if correct else ["B"],
+                "client_ts": time.time(),
+            })
+            self.stats.actions_sent += 1
+            await asyncio.sleep(1 / self.args.rate)
+
+    async def receive(self):
+        try:
+            async for message in self.websocket:
+                now = time.monotonic()
+                self.stats.frames += 1
+                self.stats.frame_bytes += len(message)
+                event, value = frame_of(message, self.wire_format)
+                if event == "session_snapshot":
+                    # The server dropped a backlog of deltas for this client
+                    self.stats.resyncs += 1
+                    self.last_seq = value.get("seq")
+                    self._acknowledge(value.get("client_data") or {}, now)
+                elif event == "client_update_result":
+                    seq = value.get("seq")
+                    if self.last_seq is not None and seq > self.last_seq + 1:
+                        self.stats.seq_gaps += seq - self.last_seq - 1
+                    self.last_seq = max(self.last_seq or 0, seq)
+                    self._acknowledge(players_of(value), now)
+        except websockets.ConnectionClosed as closed:
+            if closed.code == 1013:
+                self.stats.slow_disconnects += 1
+
+    def _acknowledge(self, players, now: float):
+        if isinstance(players, list):
+            players = {player["uid"]: player for player in map(codec.unpack_player, players)}
+        player = players.get(self.uid)
+        if not player:
+            return
+        for question_index in player.get("answered") or []:
+            sent_at = self.sent_at.pop(question_index, None)
+            if sent_at is None:
+                continue
+            latency = now - sent_at
+            self.stats.latencies.append(latency)
+            if latency * 1000 > self.args.late_ms:
+                self.stats.late_answers += 1
+
+
+async def wait_for_session(session_url: str, session_id: str):
+    # The engine publishes the first snapshot shortly after the session is created
+    deadline = time.monotonic() + SESSION_READY_TIMEOUT
+    while time.monotonic() < deadline:
+        async with websockets.connect(f"{session_url}/ws_user/{session_id}", max_size=None) as websocket:
+            _, snapshot = frame_of(await websocket.recv(), codec.JSON)
+            if "seq" in snapshot:
+                return
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"Session {session_id} never went live")
+
+
+async def drain_host(session_url: str, session_id: str):
+    async with websockets.connect(f"{session_url}/ws_user/{session_id}", max_size=None) as websocket:
+        try:
+            async for _ in websocket:
+                pass
+        except websockets.ConnectionClosed:
+            pass
+
+
+async def run(args) -> Stats:
+    run_id = uuid.uuid4().hex[:8]
+    session_url = args.url.replace("http", "ws", 1) + API_PREFIX + "/session"
+    api = Api(args.url)
+    stats = Stats()
+    try:
+        await api.login(f"loadtest-{run_id}@example.com")
+        session_id = await api.setup_session(run_id, args.questions, args)
+        print(f"session {session_id}")
+        await wait_for_session(session_url, session_id)
+        host = asyncio.create_task(drain_host(session_url, session_id))
+
+        bots = [Bot(index, session_url, stats, args) for index in range(args.players)]
+        gate = asyncio.Semaphore(args.connect_concurrency)
+
+        async def connect(bot: Bot):
+            async with gate:
+                try:
+                    await bot.connect(session_id)
+                except Exception:
+                    stats.connect_failures += 1
+
+        connect_started = time.monotonic()
+        await asyncio.gather(*(connect(bot) for bot in bots))
+        bots = [bot for bot in bots if bot.websocket is not None]
+        print(f"{len(bots)} players connected in {time.monotonic() - connect_started:.2f}s")
+        receivers = [asyncio.create_task(bot.receive()) for bot in bots]
+
+        (await api.client.put(f"/session/start/{session_id}")).raise_for_status()
+        stop_at = time.monotonic() + args.duration
+        await asyncio.gather(*(bot.answer(args.questions, stop_at) for bot in bots))
+        # Let the last ticks arrive before ending the session
+        await asyncio.sleep(args.max_tick_interval * 2)
+        stats.unanswered = sum(len(bot.sent_at) for bot in bots)
+        (await api.client.put(f"/session/end/{session_id}")).raise_for_status()
+        await asyncio.wait(receivers + [host], timeout=10)
+        for task in receivers + [host]:
+            task.cancel()
+    finally:
+        await api.close()
+    return stats
+
+
+def report(stats: Stats, cpu: ServerCpu, wall: float):
+    def ms(value: Optional[float]) -> str:
+        return "n/a" if value is None else f"{value * 1000:.1f}ms"
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    print(f"actions sent      {stats.actions_sent} ({stats.actions_sent / wall:.1f}/s)")
+    print(f"latency p50       {ms(stats.percentile(50))}")
+    print(f"latency p95       {ms(stats.percentile(95))}")
+    print(f"latency p99       {ms(stats.percentile(99))}")
+    print(f"latency max       {ms(max(stats.latencies) if stats.latencies else None)}")
+    print(f"late answers      {stats.late_answers}")
+    print(f"unanswered        {stats.unanswered}")
+    print(f"seq gaps          {stats.seq_gaps}")
+    print(f"resyncs           {stats.resyncs}")
+    print(f"slow disconnects  {stats.slow_disconnects}")
+    print(f"connect failures  {stats.connect_failures}")
+    print(f"frames received   {stats.frames} ({stats.frame_bytes / 1024 / 1024:.1f} MiB)")
+    print(f"server cpu        {cpu.report()}")
+    # A saturated load generator measures itself, not the server
+    print(f"generator cpu     {usage.ru_utime + usage.ru_stime:.2f}s")
+
+
+def serve(port: int, redis_dsn: str, mongo_dsn: str) -> subprocess.Popen:
+    # Dynaconf reads DYNACONF_<KEY> over config/settings.toml
+    env = {**os.environ, "DYNACONF_REDIS": redis_dsn, "DYNACONF_MONGO_DSN": mongo_dsn}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ping").status_code == 200:
+                # Routes are only added once startup finished
+                time.sleep(1)
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("Server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--serve", action="store_true", help="start a local server on the --url port")
+    parser.add_argument("--redis-dsn", default=DEFAULT_REDIS_DSN, help="redis of the --serve server")
+    parser.add_argument("--mongo-dsn", default=DEFAULT_MONGO_DSN, help="MongoDB of the --serve server")
+    parser.add_argument("--server-pid", type=int)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=1.0, help="answers per second per player")
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of answering")
+    parser.add_argument("--accuracy", type=float, default=0.7)
+    parser.add_argument("--late-ms", type=float, default=1000, help="latency counted as late")
+    parser.add_argument("--connect-concurrency", type=int, default=50)
+    parser.add_argument("--min-tick-interval", type=float, default=0.2)
+    parser.add_argument("--max-tick-interval", type=float, default=2.0)
+    parser.add_argument("--msgpack", action="store_true", help="negotiate the msgpack wire format")
+    args = parser.parse_args()
+
+    server = None
+    server_pid = args.server_pid
+    if args.serve:
+        server = serve(httpx.URL(args.url).port or 80, args.redis_dsn, args.mongo_dsn)
+        server_pid = server.pid
+    cpu = ServerCpu(server_pid)
+    try:
+        cpu.start()
+        started = time.monotonic()
+        stats = asyncio.run(run(args))
+        report(stats, cpu, time.monotonic() - started)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+CPU cost of every stage of a live session tick on synthetic sessions, with
+saved baselines to catch ranking and serialization regressions.
+
+    python -m benchmarks.tick_path [--repeat 5] [--quick]
+    python -m benchmarks.tick_path --save default
+    python -m benchmarks.tick_path --compare default [--threshold 1.25]
+
+Redis round trips are not included, only the work done in the worker
+process: scoring answers, packing the results written to redis, ranking,
+building and encoding the delta, broadcast, presence and snapshot frames.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from app.helpers import codec
+from app.services.leaderboard_services import Ranking, composite_score
+from app.services.scoring_services import AnswerIndex, apply_answer, new_player
+from app.services.snapshot_services import SessionSnapshot
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+PLAYER_COUNTS = (10, 100, 1000, 10000)
+UPDATE_COUNTS = (1, 50, 500, 5000)
+QUICK_PLAYER_COUNTS = (10, 1000)
+QUICK_UPDATE_COUNTS = (1, 500)
+QUESTION_COUNT = 50
+
+
+def make_session(player_count: int, seed: int = 0) -> Tuple[AnswerIndex, Dict[str, dict]]:
+    rng = random.Random(seed)
+    questions = [
+        {"question_type": "MULTIPLECHOICE", "answer": [rng.choice("ABCD")]}
+        for _ in range(QUESTION_COUNT)
+    ]
+    players = {}
+    for index in range(player_count):
+        uid = f"player-{index:06d}-{rng.getrandbits(32):08x}"
+        player = new_player(uid, f"Player {index}")
+        for question_index in range(rng.randint(0, QUESTION_COUNT // 2)):
+            player["answered"].append(question_index)
+            apply_answer(player, rng.random() < 0.7, rng.uniform(0, 600), 1.0, 2.0)
+        players[uid] = player
+    return AnswerIndex(questions), players
+
+
+def make_stages(player_count: int, update_count: int) -> Dict[str, Callable]:
+    answers, players = make_session(player_count)
+    rng = random.Random(update_count)
+    updated = rng.sample(list(players), update_count)
+    submissions = [
+        (uid, rng.randrange(QUESTION_COUNT), [rng.choice("ABCD")]) for uid in updated
+    ]
+    changed = {uid: players[uid] for uid in updated}
+    ranking = sorted(
+        players, key=lambda uid: composite_score(players[uid]["point"], players[uid]["time"]), reverse=True
+    )
+    delta = {
+        "seq": 1,
+        "offset": 0,
+        "ranking": ranking[:update_count],
+        "total": player_count,
+        "data": changed,
+    }
+    presence = {"added": updated, "removed": [], "total": player_count}
+    snapshot_value = {
+        "session_status": "STARTED",
+        "bonus": 1.0,
+        "penalty": 2.0,
+        "session_name": "bench",
+        "seq": 1,
+        "question_pack": "0" * 32,
+        "client_list": list(players),
+        "client_data": players,
+        "ranking": ranking,
+    }
+    snapshot_data = codec.dumps(snapshot_value)
+
+    def score():
+        for uid, question_index, answer in submissions:
+            player = dict(players[uid])
+            apply_answer(player, answers.check(question_index, answer), 300.0, 1.0, 2.0)
+
+    def pack_results():
+        # HSET payload and ranking scores of the changed players
+        {uid: codec.dumps_player(player) for uid, player in changed.items()}
+        {uid: composite_score(player["point"], player["time"]) for uid, player in changed.items()}
+
+    def rank_all():
+        # Full re-sort, what every tick did before the sorted set
+        sorted(players, key=lambda uid: composite_score(players[uid]["point"], players[uid]["time"]))
+
+    in_memory = Ranking(players)
+    scores = {uid: composite_score(player["point"], player["time"]) for uid, player in changed.items()}
+
+    def rank_update():
+        # The engine's in memory ranking: moved slice of the delta and the
+        # snapshot ranking, without asking redis
+        low, high = in_memory.update(scores)
+        in_memory.slice(low, high)
+        in_memory.uids()
+
+    def encode_delta_json():
+        codec.encode_frame("client_update_result", delta, codec.JSON)
+
+    def encode_delta_msgpack():
+        codec.encode_frame("client_update_result", delta, codec.MSGPACK)
+
+    def encode_broadcast():
+        # What the engine publishes: the delta in every wire format at once
+        codec.encode_broadcast("client_update_result", delta)
+
+    def encode_presence():
+        codec.encode_frame("client_update_users", presence, codec.JSON)
+
+    def store_snapshot():
+        codec.dumps(snapshot_value)
+
+    def snapshot_frames():
+        # First connect of a process: decode once, encode once per wire format
+        snapshot = SessionSnapshot(1, snapshot_data)
+        snapshot.frame(codec.JSON, client_id=updated[0])
+        snapshot.frame(codec.MSGPACK, client_id=updated[0])
+
+    return {
+        "score": score,
+        "pack_results": pack_results,
+        "rank_all": rank_all,
+        "rank_update": rank_update,
+        "encode_delta_json": encode_delta_json,
+        "encode_delta_msgpack": encode_delta_msgpack,
+        "encode_broadcast": encode_broadcast,
+        "encode_presence": encode_presence,
+        "store_snapshot": store_snapshot,
+        "snapshot_frames": snapshot_frames,
+    }
+
+
+def measure(stage: Callable, repeat: int) -> float:
+    # Best of repeat runs, each long enough for the clock (at least ~20ms)
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            stage()
+        elapsed = time.perf_counter() - started
+        if elapsed >= 0.02 or number >= 1 << 16:
+            break
+        number *= 4
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            stage()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def run(repeat: int, quick: bool) -> Dict[str, float]:
+    results = {}
+    player_counts = QUICK_PLAYER_COUNTS if quick else PLAYER_COUNTS
+    update_counts = QUICK_UPDATE_COUNTS if quick else UPDATE_COUNTS
+    for player_count in player_counts:
+        for update_count in update_counts:
+            if update_count > player_count:
+                continue
+            for name, stage in make_stages(player_count, update_count).items():
+                key = f"{name}/{player_count}/{update_count}"
+                results[key] = measure(stage, repeat)
+                print(f"{key:<40} {results[key] * 1000:>10.3f} ms", flush=True)
+    return results
+
+
+def save(name: str, results: Dict[str, float]):
+    BASELINE_DIR.mkdir(exist_ok=True)
+    path = BASELINE_DIR / f"{name}.json"
+    path.write_text(json.dumps({
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "results": results,
+    }, indent=2, sort_keys=True) + "\n")
+    print(f"baseline saved to {path}")
+
+
+def compare(name: str, results: Dict[str, float], threshold: float, min_delta: float) -> List[str]:
+    baseline = json.loads((BASELINE_DIR / f"{name}.json").read_text())["results"]
+    regressions = []
+    print(f"\n{'stage/players/updates':<40} {'baseline ms':>12} {'now ms':>10} {'ratio':>7}")
+    for key, value in results.items():
+        if key not in baseline:
+            continue
+        ratio = value / baseline[key] if baseline[key] else float("inf")
+        flag = ""
+        # Stages of a few microseconds are mostly noise
+        if abs(value - baseline[key]) < min_delta:
+            pass
+        elif ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        print(f"{key:<40} {baseline[key] * 1000:>12.3f} {value * 1000:>10.3f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="a few sizes only")
+    parser.add_argument("--save", metavar="NAME", help="save the results as baseline NAME")
+    parser.add_argument("--compare", metavar="NAME", help="compare against baseline NAME")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio counted as regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="smaller slowdowns are ignored")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.quick)
+    if args.save:
+        save(args.save, results)
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold, args.min_delta_ms / 1000)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold}x")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
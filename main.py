@@ -5,7 +5,11 @@ from app.routers import routers
 from app.middlewares.limiters import add_limiters
 from app.middlewares.exception_handlers import add_exception_handlers
 from app.middlewares.cors import apply_cors
+from app.middlewares.metrics import add_metrics
 from app.settings import AppSettings
+from app.helpers import metrics
+from app.helpers.loop_monitor import loop_monitor
+from app.services.session_supervisor_services import session_supervisor
 
 app = FastAPI(title="Clustering")
 
@@ -18,6 +22,10 @@ async def app_init():
     add_limiters(app)
     apply_cors(app, app_settings.allowed_origins)
     add_exception_handlers(app)
+    add_metrics(app)
+
+    # EVENT LOOP LAG
+    loop_monitor.start()
 
     # INIT DATABASE
     await database.initialize()
@@ -26,6 +34,18 @@ async def app_init():
     for router in routers:
         app.include_router(**router)
 
+    # LIVE SESSION ENGINES
+    await session_supervisor.start()
+
+
+@app.on_event("shutdown")
+async def app_shutdown():
+    await session_supervisor.stop()
+    await database.hub.close()
+    await database.query_monitor.stop()
+    await loop_monitor.stop()
+    metrics.mark_process_dead()
+
 
 @app.get("/ping", summary="Health check usage only")
 def ping():
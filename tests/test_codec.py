@@ -0,0 +1,105 @@
+import json
+import unittest
+
+import msgpack
+
+from app.helpers import codec
+
+
+def _map(size: int) -> dict:
+    return {f"k{index}": index for index in range(size)}
+
+
+class AddFieldTest(unittest.TestCase):
+
+    def test_json(self):
+        self.assertEqual(json.loads(codec.add_field("{}", "rank", 3)), {"rank": 3})
+        encoded = codec.add_field(json.dumps({"a": [1, 2]}), "rank", None)
+        self.assertEqual(json.loads(encoded), {"rank": None, "a": [1, 2]})
+
+    def test_msgpack_across_map_header_sizes(self):
+        # fixmap, then map 16 from 15 keys on, then map 32 from 65535 keys on
+        for size in (0, 1, 14, 15, 16, 65534, 65535, 65536):
+            value = _map(size)
+            encoded = codec.add_field(codec.encode_value(value, codec.MSGPACK), "rank", 1, codec.MSGPACK)
+            self.assertEqual(msgpack.unpackb(encoded, raw=False), {"rank": 1, **value}, size)
+
+
+class WrapValueTest(unittest.TestCase):
+
+    def test_same_bytes_as_encode_frame(self):
+        value = {"seq": 1, "ranking": ["a", "b"], "data": {"a": {"uid": "a", "name": "A", "point": 1, "time": 2.0}}}
+        for wire_format in (codec.JSON, codec.MSGPACK):
+            self.assertEqual(
+                codec.wrap_value("resync", codec.encode_value(value, wire_format), wire_format),
+                codec.encode_frame("resync", value, wire_format),
+            )
+
+
+class PlayerRecordTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        player = {"uid": "a", "name": "A", "point": 2, "time": 1.5, "answered": [0, 3]}
+        self.assertEqual(codec.pack_player(player), ["a", "A", 2, 1.5, {"answered": [0, 3]}])
+        self.assertEqual(codec.loads_player(codec.dumps_player(player)), player)
+        self.assertEqual(codec.unpack_player(["b", None, 0, 0.0]), {"uid": "b", "name": None, "point": 0, "time": 0.0})
+
+    def test_compact_value_only_touches_player_maps(self):
+        value = {"seq": 1, "data": {"a": {"uid": "a", "name": "A", "point": 1, "time": 0.0}}}
+        self.assertEqual(codec.compact_value(value), {"seq": 1, "data": [["a", "A", 1, 0.0]]})
+        self.assertEqual(value["data"]["a"]["uid"], "a")
+        self.assertEqual(codec.compact_value("STARTED"), "STARTED")
+        self.assertEqual(codec.compact_value({"added": ["a"]}), {"added": ["a"]})
+
+
+class FrameTest(unittest.TestCase):
+
+    def test_broadcast_round_trip(self):
+        value = {"seq": 3, "data": {"a": {"uid": "a", "name": "A", "point": 1, "time": 0.5}}}
+        frame = codec.Frame(codec.encode_broadcast("client_update_result", value))
+        self.assertEqual(frame.topic, "client_update_result")
+        # Maps and lists stay out of the routing header
+        self.assertIsNone(frame.value)
+        self.assertEqual(frame.encoded(codec.JSON), codec.encode_frame("client_update_result", value, codec.JSON))
+        self.assertEqual(frame.encoded(codec.MSGPACK), codec.encode_frame("client_update_result", value, codec.MSGPACK))
+        self.assertIs(frame.encoded(codec.MSGPACK), frame.encoded(codec.MSGPACK))
+
+    def test_scalar_values_are_routed_on(self):
+        frame = codec.Frame(codec.encode_broadcast("update_status", "ENDED"))
+        self.assertEqual((frame.topic, frame.value), ("update_status", "ENDED"))
+        self.assertEqual(json.loads(frame.encoded()), {"event": "update_status", "value": "ENDED"})
+
+
+class DecodeFrameTest(unittest.TestCase):
+
+    def test_maps(self):
+        action = {"question_index": 1, "answer": ["A"], "client_ts": 12}
+        self.assertEqual(codec.decode_frame(json.dumps(action)), action)
+        self.assertEqual(codec.decode_frame(msgpack.packb(action), codec.MSGPACK), action)
+
+    def test_anything_else_is_rejected(self):
+        for data, wire_format in (
+            (msgpack.packb(["u1", "A", 1, 0.0]), codec.MSGPACK),
+            (msgpack.packb("resync"), codec.MSGPACK),
+            (b"\xc1", codec.MSGPACK),
+            ("[1, 2]", codec.JSON),
+            ("null", codec.JSON),
+            ("{", codec.JSON),
+        ):
+            with self.assertRaises(ValueError):
+                codec.decode_frame(data, wire_format)
+
+
+class NegotiateTest(unittest.TestCase):
+
+    def test_first_known_subprotocol_wins(self):
+        self.assertEqual(
+            codec.negotiate(["other", "knowledgekart.msgpack.v1", "knowledgekart.json.v1"]),
+            (codec.MSGPACK, "knowledgekart.msgpack.v1"),
+        )
+        self.assertEqual(codec.negotiate(["other"]), (codec.JSON, None))
+        self.assertEqual(codec.negotiate(None), (codec.JSON, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
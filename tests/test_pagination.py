@@ -0,0 +1,26 @@
+import base64
+import unittest
+
+from beanie import PydanticObjectId
+
+from app.helpers.exceptions import BadRequestException
+from app.helpers.pagination import decode_cursor, encode_cursor
+
+
+class CursorTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        last_id = PydanticObjectId()
+        cursor = encode_cursor(last_id)
+        self.assertEqual(decode_cursor(cursor), last_id)
+        # Usable as is in a query string
+        self.assertNotRegex(cursor, r"[+/]")
+
+    def test_invalid_cursors(self):
+        for cursor in ("", "not a cursor", "abc", base64.urlsafe_b64encode(b"short").decode()):
+            with self.assertRaises(BadRequestException, msg=cursor):
+                decode_cursor(cursor)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import io
+import csv
+import asyncio
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from beanie import init_beanie, PydanticObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from openpyxl import Workbook
+
+from app.models.library import Library
+from app.models.question import Question
+from app.models.user_counter import UserCounter
+from app.helpers.auth_helpers import get_current_user
+from app.middlewares.exception_handlers import add_exception_handlers
+from app.routers.library_management.library import router
+from app.services.question_pack_services import QuestionPackService
+
+USER_ID = str(PydanticObjectId())
+HEADER = ["question", "question_type", "answer", "choice_1", "feedback_1", "choice_2", "feedback_2"]
+ROWS = [
+    ["1 + 1", "MULTIPLECHOICE", "2", "2", "right", "3", "wrong"],
+    ["The sky is ___", "FILLINTHEBLANK", "blue", None, None, None, None],
+    [None, "MULTIPLECHOICE", None, None, None, None, None],
+]
+
+
+def _csv_file() -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    writer.writerows(ROWS)
+    return buffer.getvalue().encode()
+
+
+def _xlsx_file() -> bytes:
+    workbook = Workbook()
+    workbook.active.append(HEADER)
+    for row in ROWS:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+class QuestionImportTest(unittest.TestCase):
+    """
+    Imports go through the route with a real multipart upload, so the
+    service gets the SpooledTemporaryFile FastAPI hands out, not a BytesIO.
+    """
+
+    def setUp(self):
+        app = FastAPI()
+        add_exception_handlers(app)
+        app.include_router(router)
+        app.dependency_overrides[get_current_user] = lambda: USER_ID
+        self.client = TestClient(app)
+        self.library_id = asyncio.run(self._init_database())
+        invalidate = mock.patch.object(QuestionPackService, "invalidate", mock.AsyncMock())
+        invalidate.start()
+        self.addCleanup(invalidate.stop)
+
+    async def _init_database(self) -> str:
+        await init_beanie(AsyncMongoMockClient()["test"], document_models=[Library, Question, UserCounter])
+        library = Library(
+            user_id=PydanticObjectId(USER_ID),
+            library_name="library",
+            created_at=datetime.now(),
+            updated_at=datetime.now(),
+        )
+        await library.save()
+        return str(library.id)
+
+    def _import(self, filename: str, content: bytes, media_type: str) -> dict:
+        response = self.client.post(
+            f"/library/{self.library_id}/import",
+            files={"file": (filename, content, media_type)},
+        )
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()["data"]
+
+    def _questions(self) -> list:
+        return asyncio.run(Question.find({"library_id": PydanticObjectId(self.library_id)}).to_list())
+
+    def _assert_imported(self, report: dict):
+        self.assertEqual(report["imported"], 2)
+        self.assertEqual(report["failed"], 1)
+        self.assertEqual(report["errors"][0]["row"], 4)
+        questions = sorted(self._questions(), key=lambda question: question.question)
+        self.assertEqual([question.question for question in questions], ["1 + 1", "The sky is ___"])
+        self.assertEqual([choice.choice for choice in questions[0].choices], ["2", "3"])
+
+    def test_import_csv(self):
+        self._assert_imported(self._import("questions.csv", _csv_file(), "text/csv"))
+
+    def test_import_xlsx(self):
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        self._assert_imported(self._import("questions.xlsx", _xlsx_file(), media_type))
+
+    def test_import_broken_xlsx(self):
+        response = self.client.post(
+            f"/library/{self.library_id}/import",
+            files={"file": ("questions.xlsx", b"not a zip", "application/octet-stream")},
+        )
+        self.assertEqual(response.status_code, 400, response.text)
+
+
+if __name__ == "__main__":
+    unittest.main()
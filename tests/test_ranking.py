@@ -0,0 +1,106 @@
+import random
+import unittest
+
+from app.services.leaderboard_services import TIME_SCALE, LeaderboardService, Ranking, composite_score
+
+
+def _expected(players: dict) -> list:
+    # Point desc, time asc, then uid desc
+    return sorted(
+        players,
+        key=lambda uid: (composite_score(players[uid]["point"], players[uid]["time"]), uid),
+        reverse=True,
+    )
+
+
+class _Pipe:
+    # Records what LeaderboardService.update queues
+    def __init__(self):
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+
+class CompositeScoreTest(unittest.TestCase):
+
+    def test_point_wins_then_smaller_time(self):
+        self.assertGreater(composite_score(2, TIME_SCALE * 10), composite_score(1, 0))
+        self.assertGreater(composite_score(1, 10.5), composite_score(1, 11))
+
+    def test_time_is_clamped(self):
+        self.assertEqual(composite_score(1, -5), composite_score(1, 0))
+        self.assertGreater(composite_score(1, TIME_SCALE * 10), composite_score(0, 0))
+        self.assertEqual(composite_score(None, None), 0.0)
+
+
+class RankingTest(unittest.TestCase):
+
+    def test_order_and_ranks(self):
+        players = {
+            "a": {"point": 1, "time": 5.0},
+            "b": {"point": 2, "time": 9.0},
+            "c": {"point": 1, "time": 3.0},
+            "d": {"point": 1, "time": 5.0},
+        }
+        ranking = Ranking(players)
+        self.assertEqual(ranking.uids(), ["b", "c", "d", "a"])
+        self.assertEqual([ranking.rank(uid) for uid in "abcd"], [3, 0, 1, 2])
+        self.assertIsNone(ranking.rank("missing"))
+        self.assertEqual(len(ranking), 4)
+        self.assertEqual(ranking.slice(1, 2), ["c", "d"])
+        self.assertEqual(ranking.slice(2, 1), [])
+
+    def test_update_reports_nothing_when_no_rank_moves(self):
+        ranking = Ranking({"a": {"point": 2, "time": 0}, "b": {"point": 1, "time": 0}})
+        low, high = ranking.update({"a": composite_score(3, 0)})
+        self.assertGreater(low, high)
+        self.assertEqual(ranking.uids(), ["a", "b"])
+
+    def test_new_player_moves_everyone_below_it(self):
+        ranking = Ranking({"a": {"point": 3, "time": 0}, "b": {"point": 1, "time": 0}})
+        self.assertEqual(ranking.update({"c": composite_score(2, 0)}), (1, 2))
+        self.assertEqual(ranking.uids(), ["a", "c", "b"])
+
+    def test_random_updates_match_a_full_sort(self):
+        rng = random.Random(7)
+        players = {f"u{index}": {"point": rng.randint(0, 5), "time": rng.randint(0, 20)} for index in range(200)}
+        ranking = Ranking(players)
+        client = ranking.uids()
+        for _ in range(300):
+            changed = {}
+            for uid in rng.sample(list(players) + [f"new{rng.randint(0, 50)}"], rng.randint(1, 12)):
+                players[uid] = {"point": rng.randint(0, 8), "time": rng.randint(0, 20)}
+                changed[uid] = players[uid]
+            low, high = ranking.update(
+                {uid: composite_score(player["point"], player["time"]) for uid, player in changed.items()}
+            )
+            expected = _expected(players)
+            self.assertEqual(ranking.uids(), expected)
+            self.assertEqual([ranking.rank(uid) for uid in expected], list(range(len(expected))))
+            # Patching the moved slice into the previous order gives the new one
+            client = client[:len(ranking)] + [None] * (len(ranking) - len(client))
+            client[max(low, 0):high + 1] = ranking.slice(low, high)
+            self.assertEqual(client, expected)
+
+
+class LeaderboardUpdateTest(unittest.TestCase):
+
+    def test_delta_and_queued_writes(self):
+        players = {"a": {"uid": "a", "point": 1, "time": 1.0}, "b": {"uid": "b", "point": 0, "time": 0.0}}
+        ranking = Ranking(players)
+        pipe = _Pipe()
+        changed = {"b": {"uid": "b", "point": 2, "time": 4.0}}
+        delta = LeaderboardService.update("s1", changed, ranking, 7, pipe)
+        self.assertEqual(delta, {"seq": 7, "offset": 0, "ranking": ["b", "a"], "total": 2, "data": changed})
+        self.assertEqual([name for name, _, _ in pipe.commands], ["hset", "hset"])
+        self.assertEqual(pipe.commands[1][1], ("settings:s1", "seq", 7))
+
+    def test_no_players(self):
+        pipe = _Pipe()
+        self.assertEqual(LeaderboardService.update("s1", {}, Ranking(), 1, pipe), {})
+        self.assertEqual(pipe.commands, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
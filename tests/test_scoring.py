@@ -0,0 +1,113 @@
+import unittest
+
+from app.services.scoring_services import (
+    TYPO_MIN_LENGTH,
+    AnswerIndex,
+    apply_answer,
+    new_player,
+    normalize,
+    within_one_edit,
+)
+
+
+class NormalizeTest(unittest.TestCase):
+
+    def test_case_accents_spaces_and_edge_punctuation(self):
+        self.assertEqual(normalize("  Crème   Brûlée! "), "creme brulee")
+        self.assertEqual(normalize('"Paris."'), "paris")
+        self.assertEqual(normalize(42), "42")
+
+    def test_inner_punctuation_is_kept(self):
+        self.assertEqual(normalize("e.g. this"), "e.g. this")
+
+
+class WithinOneEditTest(unittest.TestCase):
+
+    def test_equal(self):
+        self.assertTrue(within_one_edit("", ""))
+        self.assertTrue(within_one_edit("answer", "answer"))
+
+    def test_one_substitution_insertion_or_deletion(self):
+        self.assertTrue(within_one_edit("answer", "answar"))
+        self.assertTrue(within_one_edit("answer", "answers"))
+        self.assertTrue(within_one_edit("answers", "answer"))
+        self.assertTrue(within_one_edit("answer", "nswer"))
+        self.assertTrue(within_one_edit("", "a"))
+
+    def test_two_edits(self):
+        self.assertFalse(within_one_edit("answer", "anwsre"))
+        self.assertFalse(within_one_edit("answer", "aswar"))
+        self.assertFalse(within_one_edit("answer", "answerss"))
+        self.assertFalse(within_one_edit("ab", "ba"))
+
+
+class AnswerIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = AnswerIndex([
+            {"question_type": "MULTIPLECHOICE", "answer": ["A", "C"]},
+            {"question_type": "MULTIPLECHOICE", "answer": "B"},
+            {"question_type": "FILLINTHEBLANK", "answer": ["Photosynthesis", "sun"]},
+            {"answer": "Yes"},
+        ])
+
+    def test_multiple_choice_needs_every_correct_choice_and_nothing_else(self):
+        self.assertTrue(self.index.check(0, ["c", "a"]))
+        self.assertFalse(self.index.check(0, ["A"]))
+        self.assertFalse(self.index.check(0, ["A", "B", "C"]))
+        self.assertTrue(self.index.check(1, "b"))
+        self.assertTrue(self.index.check(1, ["B"]))
+        self.assertFalse(self.index.check(1, None))
+
+    def test_question_type_defaults_to_multiple_choice(self):
+        self.assertTrue(self.index.check(3, " yes "))
+        self.assertFalse(self.index.check(3, "yess"))
+
+    def test_fill_in_the_blank_accepts_one_typo_on_long_blanks(self):
+        self.assertTrue(self.index.check(2, ["photosynthesis", "Sun."]))
+        self.assertTrue(self.index.check(2, ["photosynthesys", "sun"]))
+        self.assertFalse(self.index.check(2, ["photosinthesys", "sun"]))
+        # Too short for a typo
+        self.assertLess(len("sun"), TYPO_MIN_LENGTH)
+        self.assertFalse(self.index.check(2, ["photosynthesis", "son"]))
+
+    def test_fill_in_the_blank_needs_every_blank(self):
+        self.assertFalse(self.index.check(2, ["photosynthesis"]))
+        self.assertFalse(self.index.check(2, ["photosynthesis", "sun", "moon"]))
+
+    def test_unknown_question(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertIsNone(self.index.check(4, "A"))
+        self.assertIsNone(self.index.check(-1, "A"))
+        self.assertIsNone(self.index.check("0", "A"))
+        self.assertIsNone(self.index.check(None, "A"))
+
+
+class ApplyAnswerTest(unittest.TestCase):
+
+    def test_points_and_time(self):
+        player = new_player("u1", "Player")
+        apply_answer(player, True, 30.0, 2.0, 5.0)
+        self.assertEqual((player["point"], player["correct"], player["wrong"]), (1, 1, 0))
+        self.assertEqual(player["time"], 28.0)
+        apply_answer(player, False, 40.0, 2.0, 5.0)
+        self.assertEqual((player["point"], player["correct"], player["wrong"]), (1, 1, 1))
+        # Race time of the last answer - 1 bonus + 1 penalty
+        self.assertEqual(player["time"], 43.0)
+        apply_answer(player, True, 50.5, 2.0, 5.0)
+        self.assertEqual(player["point"], 2)
+        self.assertEqual(player["time"], 51.5)
+
+    def test_time_never_goes_below_zero(self):
+        player = new_player("u1", None)
+        apply_answer(player, True, 1.0, 10.0, 0.0)
+        self.assertEqual(player["time"], 0.0)
+
+    def test_time_is_rounded(self):
+        player = new_player("u1", None)
+        apply_answer(player, False, 1.23456, 0.0, 0.0)
+        self.assertEqual(player["time"], 1.235)
+
+
+if __name__ == "__main__":
+    unittest.main()
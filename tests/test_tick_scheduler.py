@@ -0,0 +1,63 @@
+import unittest
+
+from app.helpers.tick_scheduler import (
+    DEFAULT_MAX_TICK_INTERVAL,
+    DEFAULT_MIN_TICK_INTERVAL,
+    DUTY_FACTOR,
+    HIGH_WATERMARK,
+    TickScheduler,
+)
+
+
+class TickSchedulerTest(unittest.TestCase):
+
+    def test_defaults_and_bounds(self):
+        scheduler = TickScheduler()
+        self.assertEqual((scheduler.min_interval, scheduler.max_interval), (DEFAULT_MIN_TICK_INTERVAL, DEFAULT_MAX_TICK_INTERVAL))
+        # A max below the min is raised to it
+        scheduler = TickScheduler(0.5, 0.1)
+        self.assertEqual((scheduler.min_interval, scheduler.max_interval), (0.5, 0.5))
+
+    def test_interval_grows_with_the_batch_size(self):
+        scheduler = TickScheduler(0.2, 2.0)
+        self.assertEqual(scheduler.next_interval(0), 0.2)
+        self.assertAlmostEqual(scheduler.next_interval(HIGH_WATERMARK // 2), 1.1)
+        self.assertEqual(scheduler.next_interval(HIGH_WATERMARK * 10), 2.0)
+
+    def test_slow_ticks_stretch_the_interval(self):
+        scheduler = TickScheduler(0.2, 2.0)
+        scheduler.record(0.3, 1)
+        self.assertAlmostEqual(scheduler.next_interval(0), 0.3 * DUTY_FACTOR)
+        scheduler.record(5.0, 1)
+        self.assertEqual(scheduler.next_interval(0), 2.0)
+
+    def test_late_ticks_are_counted_as_merged(self):
+        scheduler = TickScheduler(0.2, 2.0)
+        scheduler.next_interval(0)
+        scheduler.record(0.01, 1, lateness=0.1)
+        self.assertEqual(scheduler.merged_ticks, 0)
+        scheduler.record(0.01, 1, lateness=0.65)
+        self.assertEqual(scheduler.merged_ticks, 3)
+
+    def test_moving_averages(self):
+        scheduler = TickScheduler(0.2, 2.0)
+        scheduler.record(0.1, 100)
+        self.assertEqual((scheduler.avg_duration, scheduler.avg_batch_size), (0.1, 100.0))
+        scheduler.record(0.2, 200)
+        self.assertAlmostEqual(scheduler.avg_duration, 0.12)
+        self.assertAlmostEqual(scheduler.avg_batch_size, 120.0)
+        # A busy room keeps a wider window even when one tick is quiet
+        self.assertGreater(scheduler.next_interval(0), 0.2)
+
+    def test_stats(self):
+        scheduler = TickScheduler(0.2, 2.0)
+        scheduler.record(0.1234567, 3)
+        stats = scheduler.stats()
+        self.assertEqual(stats["ticks"], 1)
+        self.assertEqual(stats["last_duration"], 0.123457)
+        self.assertEqual(stats["max_duration"], 0.123457)
+        self.assertEqual(stats["last_batch_size"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()